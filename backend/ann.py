@@ -0,0 +1,328 @@
+"""
+Pluggable nearest-neighbour engines for recommendations.
+
+  exact    sklearn NearestNeighbors (KD-tree), the original behaviour.
+  ivf      inverted-file index: k-means coarse centroids, vectors stored
+           contiguously per list; a query scans only the nprobe closest lists.
+  ivf_sq8  the ivf lists scanned on uint8 codes (quantize.py), stored one
+           feature at a time; the best KNN_RERANK x k candidates per query are
+           re-ranked on transformed knn_features, so distances are exact.
+
+Select with KNN_ENGINE (default "exact"); tune IVF with KNN_NPROBE and
+ivf_sq8 also with KNN_RERANK.
+precompute_dataset.py builds every engine into precomputed/ so switching is
+a config change. See benchmarks/ann_recall.py for the recall-vs-latency report.
+"""
+
+import json
+import os
+
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_argmin
+from sklearn.neighbors import NearestNeighbors
+
+from feature_transform import FeatureTransform, TransformedRows
+from quantize import ScalarQuantizer
+
+DEFAULT_ENGINE = "exact"
+DEFAULT_K = 5
+
+
+class ExactEngine:
+    """Exact euclidean search over every point."""
+
+    name = "exact"
+    artifact = "knn_model.joblib"
+
+    def __init__(self, model):
+        self.model = model
+
+    @classmethod
+    def build(cls, X):
+        model = NearestNeighbors(n_neighbors=DEFAULT_K, metric="euclidean")
+        model.fit(X)
+        return cls(model)
+
+    def __len__(self):
+        return self.model.n_samples_fit_
+
+    def kneighbors(self, Q, k=DEFAULT_K):
+        k = min(k, len(self))
+        return self.model.kneighbors(np.asarray(Q), n_neighbors=k)
+
+    def save(self, directory):
+        joblib.dump(self.model, os.path.join(directory, self.artifact))
+
+    @classmethod
+    def load(cls, directory):
+        return cls(joblib.load(os.path.join(directory, cls.artifact), mmap_mode="r"))
+
+    @classmethod
+    def update(cls, directory, X, appended_from=None):
+        """KD-trees can't take new points, so the exact engine is always refitted."""
+        return cls.build(X)
+
+
+class IVFEngine:
+    """Inverted-file approximate search (coarse k-means quantizer, exact scan of probed lists)."""
+
+    name = "ivf"
+    artifact = "ivf_meta.json"
+    DEFAULT_NPROBE = 8
+
+    def __init__(self, centroids, offsets, ids, vectors, nprobe=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.nprobe = int(nprobe or self.DEFAULT_NPROBE)
+
+    @staticmethod
+    def default_n_lists(n):
+        return int(np.clip(np.sqrt(n), 1, 4096))
+
+    @classmethod
+    def build(cls, X, n_lists=None, nprobe=None, sample_size=None, random_state=0):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_lists = min(n_lists or cls.default_n_lists(len(X)), len(X))
+        rng = np.random.default_rng(random_state)
+        sample_size = min(len(X), sample_size or n_lists * 32)
+        sample = X[rng.choice(len(X), sample_size, replace=False)] if sample_size < len(X) else X
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_lists, batch_size=max(4096, 4 * n_lists), n_init=1, random_state=random_state
+        ).fit(sample)
+        centroids = kmeans.cluster_centers_.astype(np.float32)
+        return cls.from_assignment(X, centroids, cls.assign(X, centroids), nprobe)
+
+    @staticmethod
+    def assign(X, centroids):
+        """Nearest-centroid list for every row of X (chunked)."""
+        return pairwise_distances_argmin(X, centroids).astype(np.int32)
+
+    @classmethod
+    def from_assignment(cls, X, centroids, labels, nprobe=None):
+        order = np.argsort(labels, kind="stable").astype(np.int32)
+        counts = np.bincount(labels, minlength=len(centroids))
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(centroids, offsets, order, np.asarray(X, dtype=np.float32)[order], nprobe)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def labels(self):
+        """List number of every indexed point, in point-ID order."""
+        labels = np.empty(len(self.ids), dtype=np.int32)
+        labels[self.ids] = np.repeat(np.arange(len(self.centroids), dtype=np.int32), np.diff(self.offsets))
+        return labels
+
+    def add(self, X_new):
+        """New index with X_new appended as point IDs len(self)..; existing lists and centroids are kept."""
+        X_new = np.asarray(X_new, dtype=np.float32)
+        old = np.empty((len(self), self.vectors.shape[1]), dtype=np.float32)
+        old[self.ids] = self.vectors
+        new_labels = self.assign(X_new, self.centroids) if len(X_new) else np.empty(0, dtype=np.int32)
+        labels = np.concatenate([self.labels(), new_labels])
+        return self.from_assignment(np.concatenate([old, X_new]), np.array(self.centroids), labels, self.nprobe)
+
+    @classmethod
+    def update(cls, directory, X, appended_from=None):
+        """Update the saved index for X without retraining centroids.
+
+        If the saved points are X[:appended_from], only the tail is assigned and
+        added; otherwise every point is reassigned to the saved centroids.
+        """
+        if not has_engine(directory, cls.name):
+            return cls.build(X)
+        previous = cls.load(directory)
+        if appended_from is not None and appended_from == len(previous):
+            return previous.add(X[appended_from:])
+        centroids = np.array(previous.centroids)
+        return cls.from_assignment(X, centroids, cls.assign(X, centroids), previous.nprobe)
+
+    def _probe(self, Q, nprobe, k):
+        """Lists to scan per query: the nprobe closest, widened until they hold k points."""
+        d = (Q * Q).sum(axis=1)[:, None] - 2 * Q @ self.centroids.T + (self.centroids ** 2).sum(axis=1)
+        nprobe = min(nprobe, len(self.centroids))
+        sizes = np.diff(self.offsets)
+        probes = []
+        for row in d:
+            lists = np.argpartition(row, nprobe - 1)[:nprobe] if nprobe < len(row) else np.arange(len(row))
+            if sizes[lists].sum() < k:
+                lists = np.argsort(row)
+                lists = lists[:np.searchsorted(np.cumsum(sizes[lists]), k) + 1]
+            probes.append(lists)
+        return probes
+
+    def kneighbors(self, Q, k=DEFAULT_K, nprobe=None):
+        Q = np.atleast_2d(np.asarray(Q, dtype=np.float32))
+        k = min(k, len(self))
+        distances = np.empty((len(Q), k))
+        indices = np.empty((len(Q), k), dtype=np.int64)
+        offsets = self.offsets
+        for qi, lists in enumerate(self._probe(Q, nprobe or self.nprobe, k)):
+            vectors = np.concatenate([self.vectors[offsets[l]:offsets[l + 1]] for l in lists])
+            ids = np.concatenate([self.ids[offsets[l]:offsets[l + 1]] for l in lists])
+            d = ((vectors - Q[qi]) ** 2).sum(axis=1)
+            top = np.argpartition(d, k - 1)[:k] if len(d) > k else np.arange(len(d))
+            top = top[np.argsort(d[top], kind="stable")]
+            distances[qi] = np.sqrt(np.maximum(d[top], 0))
+            indices[qi] = ids[top]
+        return distances, indices
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "ivf_centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "ivf_offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "ivf_ids.npy"), self.ids)
+        np.save(os.path.join(directory, "ivf_vectors.npy"), self.vectors)
+        with open(os.path.join(directory, self.artifact), "w") as f:
+            json.dump({"n_lists": int(len(self.centroids)), "n_points": int(len(self)), "nprobe": self.nprobe}, f)
+
+    @classmethod
+    def load(cls, directory, nprobe=None):
+        with open(os.path.join(directory, cls.artifact)) as f:
+            meta = json.load(f)
+
+        def npy(name):
+            return np.load(os.path.join(directory, name), mmap_mode="r")
+
+        return cls(
+            npy("ivf_centroids.npy"),
+            npy("ivf_offsets.npy"),
+            npy("ivf_ids.npy"),
+            npy("ivf_vectors.npy"),
+            nprobe or meta.get("nprobe"),
+        )
+
+
+class IVFSQ8Engine:
+    """IVF lists scanned on 8-bit scalar-quantized codes, then re-ranked exactly.
+
+    Uses the ivf engine's centroids and lists (and its files in precomputed/) but not its
+    float32 vectors: codes are stored feature-major, [n_features, n_points] in list order,
+    so a probed list is one contiguous slice per feature, and the few candidates left are
+    re-ranked on `points`, transformed rows in point-ID order. Loaded from precomputed/
+    those are knn_features.npy through the feature transform, which the app maps anyway.
+    """
+
+    name = "ivf_sq8"
+    artifact = "ivf_sq8.json"
+    derived_from = IVFEngine.name
+    DEFAULT_RERANK = 4
+
+    def __init__(self, ivf, codes, quantizer, points, rerank=None):
+        self.ivf = ivf
+        self.codes = codes
+        self.quantizer = quantizer
+        self.points = points
+        self.rerank = int(rerank or self.DEFAULT_RERANK)
+
+    @classmethod
+    def derive(cls, ivf, X, rerank=None):
+        """Quantize an ivf engine built over X (no retraining); X is kept for the re-rank."""
+        quantizer = ScalarQuantizer.fit(ivf.vectors, np.uint8)
+        lists = IVFEngine(ivf.centroids, ivf.offsets, ivf.ids, None, ivf.nprobe)
+        return cls(lists, np.ascontiguousarray(quantizer.encode(ivf.vectors).T), quantizer, X, rerank)
+
+    @classmethod
+    def build(cls, X, nprobe=None, rerank=None):
+        return cls.derive(IVFEngine.build(X, nprobe=nprobe), X, rerank)
+
+    @classmethod
+    def update(cls, directory, X, appended_from=None):
+        return cls.derive(IVFEngine.update(directory, X, appended_from), X)
+
+    def __len__(self):
+        return len(self.ivf)
+
+    @property
+    def nprobe(self):
+        return self.ivf.nprobe
+
+    def kneighbors(self, Q, k=DEFAULT_K, nprobe=None):
+        Q = np.atleast_2d(np.asarray(Q, dtype=np.float32))
+        k = min(k, len(self))
+        n_candidates = k * self.rerank
+        # Queries in code units; approximate d^2 = sum_j step_j^2 * (code_j - u_j)^2.
+        U = ((Q - self.quantizer.offset) / self.quantizer.step).astype(np.float32)
+        weights = (self.quantizer.step ** 2).astype(np.float32)
+        distances = np.empty((len(Q), k))
+        indices = np.empty((len(Q), k), dtype=np.int64)
+        offsets = self.ivf.offsets
+        for qi, lists in enumerate(self.ivf._probe(Q, nprobe or self.ivf.nprobe, k)):
+            spans = [(offsets[l], offsets[l + 1]) for l in lists]
+            codes = np.concatenate([self.codes[:, a:b] for a, b in spans], axis=1)
+            positions = np.concatenate([np.arange(a, b) for a, b in spans])
+            approx = np.zeros(len(positions), dtype=np.float32)
+            for j, u in enumerate(U[qi]):
+                t = np.subtract(codes[j], u, dtype=np.float32)
+                t *= t
+                t *= weights[j]
+                approx += t
+            if len(positions) > n_candidates:
+                positions = positions[np.argpartition(approx, n_candidates - 1)[:n_candidates]]
+            # Sorted IDs, so re-rank reads of (mmapped) points go forward through the file.
+            ids = np.sort(self.ivf.ids[positions])
+            d = ((self.points[ids] - Q[qi]) ** 2).sum(axis=1)
+            top = np.argpartition(d, k - 1)[:k] if len(d) > k else np.arange(len(d))
+            top = top[np.argsort(d[top], kind="stable")]
+            distances[qi] = np.sqrt(np.maximum(d[top], 0))
+            indices[qi] = ids[top]
+        return distances, indices
+
+    def save(self, directory):
+        """Writes the codes and quantizer only; the ivf engine's files must be saved alongside."""
+        np.save(os.path.join(directory, "ivf_sq8_codes.npy"), self.codes)
+        with open(os.path.join(directory, self.artifact), "w") as f:
+            json.dump({"quantizer": self.quantizer.to_dict(), "rerank": self.rerank}, f)
+
+    @classmethod
+    def load(cls, directory, nprobe=None, rerank=None):
+        with open(os.path.join(directory, cls.artifact)) as f:
+            meta = json.load(f)
+        features = np.load(os.path.join(directory, "knn_features.npy"), mmap_mode="r")
+        return cls(
+            IVFEngine.load(directory, nprobe),
+            np.load(os.path.join(directory, "ivf_sq8_codes.npy"), mmap_mode="r"),
+            ScalarQuantizer.from_dict(meta["quantizer"]),
+            TransformedRows(features, FeatureTransform.load(directory)),
+            rerank or meta.get("rerank"),
+        )
+
+
+ENGINES = {ExactEngine.name: ExactEngine, IVFEngine.name: IVFEngine, IVFSQ8Engine.name: IVFSQ8Engine}
+
+
+def configured_engine():
+    """Engine name from KNN_ENGINE (unknown names fall back to exact)."""
+    name = (os.getenv("KNN_ENGINE") or DEFAULT_ENGINE).strip().lower()
+    return name if name in ENGINES else DEFAULT_ENGINE
+
+
+def _engine_kwargs(name):
+    kwargs = {}
+    if name in (IVFEngine.name, IVFSQ8Engine.name) and os.getenv("KNN_NPROBE"):
+        kwargs["nprobe"] = int(os.getenv("KNN_NPROBE"))
+    if name == IVFSQ8Engine.name and os.getenv("KNN_RERANK"):
+        kwargs["rerank"] = int(os.getenv("KNN_RERANK"))
+    return kwargs
+
+
+def build_engine(X, name=None):
+    name = name or configured_engine()
+    return ENGINES[name].build(X, **_engine_kwargs(name))
+
+
+def has_engine(directory, name):
+    return os.path.exists(os.path.join(directory, ENGINES[name].artifact))
+
+
+def load_engine(directory, name=None):
+    """Load the configured engine from precomputed/, falling back to exact if it wasn't built."""
+    name = name or configured_engine()
+    if not has_engine(directory, name):
+        print(f"KNN engine '{name}' not in {directory}; using exact.")
+        name = ExactEngine.name
+    return ENGINES[name].load(directory, **_engine_kwargs(name))
@@ -1,21 +1,32 @@
+import atexit
+import hmac
 import os
-import pickle
 import time
 import threading
-from collections import defaultdict
+import weakref
 from functools import wraps
 
-from flask import Flask, redirect, request, session, jsonify
+from flask import Flask, Response, g, redirect, request, session, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from spotipy import Spotify
 from spotipy.oauth2 import SpotifyOAuth
-import mysql.connector
-import pandas as pd
 import traceback
-from sklearn.neighbors import NearestNeighbors
 from spotipy.cache_handler import CacheHandler
 
+from attribute_index import SearchFilter
+import batch
+from dataset import load_stages, precomputed_stamp
+from lookup_store import FEATURE_COLS, MATCH_NONE, MATCH_TYPES
+from db import make_user_writer
+import metrics
+from name_index import NAME_MATCH
+import recommender
+from spotify_client import DEFAULT_TIME_RANGE, TIME_RANGES, RateLimited, SpotifyUser
+from recommender import MatchedTracks
+from rate_limiter import make_limiter
+from responses import json_response
+from result_cache import cache_key, make_cache
+
 load_dotenv()
 
 IS_PRODUCTION = os.getenv("FLASK_ENV") == "production"
@@ -71,26 +82,21 @@ CORS(
     allow_headers=["Content-Type"],
 )
 
-_db = None
-_cursor = None
-
-
-def _get_cursor():
-    global _db, _cursor
-    if _cursor is None:
-        _db = mysql.connector.connect(
-            host=os.getenv("MYSQL_HOST"),
-            user=os.getenv("MYSQL_USER"),
-            password=os.getenv("MYSQL_PASSWORD"),
-            database=os.getenv("MYSQL_DATABASE"),
-        )
-        _cursor = _db.cursor()
-    return _cursor
+_user_writer = None
+_user_writer_pid = None
+_user_writer_lock = threading.Lock()
 
 
-def _get_db():
-    _get_cursor()
-    return _db
+def _get_user_writer():
+    """Per-process write-behind queue for user upserts (see db.py); its thread does not survive fork."""
+    global _user_writer, _user_writer_pid
+    if _user_writer_pid != os.getpid():
+        with _user_writer_lock:
+            if _user_writer_pid != os.getpid():
+                _user_writer = make_user_writer()
+                _user_writer_pid = os.getpid()
+                atexit.register(_user_writer.flush, 2)
+    return _user_writer
 
 sp_oauth = SpotifyOAuth(
     client_id=os.getenv("SPOTIFY_CLIENT_ID"),
@@ -101,59 +107,82 @@ sp_oauth = SpotifyOAuth(
     show_dialog=True,
 )
 
-df_full = None
-df_knn = None
-knn_model = None
-track_by_id = None
-artist_features_by_id = None
+# Live dataset snapshot (dataset.Dataset). Requests read it once and keep their
+# reference; load_dataset swaps in a new one with a single assignment.
+_dataset = None
+_retired_datasets = weakref.WeakSet()
 
 _dataset_lock = threading.Lock()
-_dataset_ready = False
 _dataset_loading = False
+_dataset_error = None
+_watcher_pid = None
+DATASET_RETRY_AFTER = 2
+DATASET_WATCH_INTERVAL = float(os.getenv("DATASET_WATCH_INTERVAL", 0))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+BATCH_MAX_SETS = int(os.getenv("BATCH_MAX_SETS", 1000))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 1))
 
-FEATURE_COLS = ["tempo", "energy", "valence", "danceability", "acousticness", "liveness"]
-
-# Rate limiting: (timestamp, count) per IP
-_rate_store = defaultdict(lambda: (0, 0))
-RATE_LIMIT_WINDOW = 60
-RATE_LIMIT_MAX = 120
-
+# Per-user /auth-data results keyed by Spotify user ID + dataset version (see result_cache.py)
+_result_cache = make_cache()
 
-LOAD_COLS = ["track_uri", "artist_uri", "track_name", "artist_name"] + FEATURE_COLS
-DATASET_CACHE = "dataset_cache.pkl"
-PRECOMPUTED_DIR = "precomputed"
-PRECOMPUTED_ARTIFACTS = ["artist_features_by_id.pkl", "track_by_id.pkl", "df_knn.parquet", "knn_model.pkl"]
-
-
-def _extract_ids_vectorized(series, prefix="track"):
-    """Vectorized Spotify ID extraction from URIs/URLs."""
-    s = series.astype(str).str.strip()
-    is_url = s.str.contains("spotify.com", na=False)
-    ids = pd.Series(index=s.index, dtype=object)
-    ids[is_url] = s[is_url].str.rstrip("/").str.split("/").str[-1]
-    ids[~is_url] = s[~is_url].str.replace(f"spotify:{prefix}:", "", regex=False)
-    ids = ids.where(ids.str.len() == 22)
-    return ids
+# Per-IP rate limiting (see rate_limiter.py)
+_rate_limiter = make_limiter()
 
 
 def rate_limit(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        ip = request.remote_addr or "unknown"
-        now = time.time()
-        start, count = _rate_store[ip]
-        if now - start > RATE_LIMIT_WINDOW:
-            _rate_store[ip] = (now, 1)
-        else:
-            count += 1
-            if count > RATE_LIMIT_MAX:
-                return jsonify({"error": "Too many requests"}), 429
-            _rate_store[ip] = (start, count)
+        if _rate_limiter is not None:
+            allowed, retry_after = _rate_limiter.allow(request.remote_addr or "unknown")
+            if not allowed:
+                response = jsonify({"error": "Too many requests"})
+                response.headers["Retry-After"] = str(int(retry_after) + 1)
+                return response, 429
         return f(*args, **kwargs)
 
     return decorated
 
 
+def _is_admin():
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    if request.headers.get("X-Profile") == "1" and _is_admin():
+        g.profiler = metrics.SamplingProfiler().start()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - start, request.endpoint or "unmatched", str(response.status_code)
+        )
+    profiler = g.get("profiler")
+    if profiler is not None:
+        profiler.stop()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{request.endpoint or 'unmatched'}-{int(time.time() * 1000)}.folded")
+        with open(path, "w") as f:
+            f.write(profiler.folded())
+        response.headers["X-Profile-File"] = path
+        response.headers["X-Profile-Samples"] = str(profiler.samples)
+    return response
+
+
+@app.teardown_request
+def stop_request_profiler(_exc):
+    """Stop the X-Profile sampler even when the view raised and after_request was skipped."""
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.stop()
+
+
 @app.after_request
 def security_headers(response):
     response.headers["X-Content-Type-Options"] = "nosniff"
@@ -165,117 +194,109 @@ def security_headers(response):
     return response
 
 
-def _load_from_csv():
-    df = pd.read_csv(
-        "spotify_tracks_cleaned_final.csv",
-        usecols=LOAD_COLS,
-    )
-    df.dropna(subset=FEATURE_COLS, inplace=True)
-    df["tempo"] = pd.to_numeric(df["tempo"], errors="coerce")
-    df["track_id"] = _extract_ids_vectorized(df["track_uri"], "track")
-    df["artist_id"] = _extract_ids_vectorized(df["artist_uri"], "artist")
-    df = df[df["track_id"].notna() & df["artist_id"].notna()]
-    return df
+def _load_dataset_safely():
+    """load_dataset for background threads: records failures so a later request can retry."""
+    global _dataset_loading, _dataset_error
+    try:
+        load_dataset()
+        _dataset_error = None
+    except Exception as e:
+        _dataset_error = str(e)[:200]
+        if not IS_PRODUCTION:
+            traceback.print_exc()
+    finally:
+        _dataset_loading = False
 
 
-def _ensure_dataset(timeout=120):
-    """Block until dataset is ready (or timeout). Returns True if ready."""
+def _start_reload():
+    """Load a new snapshot in the background unless a load is already running. Returns True if started."""
     global _dataset_loading
-    if _dataset_ready:
-        return True
     with _dataset_lock:
-        if _dataset_ready:
-            return True
-        if not _dataset_loading:
-            _dataset_loading = True
-            threading.Thread(target=load_dataset, daemon=True).start()
-    deadline = time.time() + timeout
-    while not _dataset_ready and time.time() < deadline:
-        time.sleep(0.2)
-    return _dataset_ready
-
-
-def _load_from_precomputed(backend_dir):
-    """Load full-dataset artifacts from precomputed/ (from running precompute_dataset.py)."""
-    global df_knn, knn_model, track_by_id, artist_features_by_id, _dataset_ready, _dataset_loading
-    precomputed_dir = os.path.join(backend_dir, PRECOMPUTED_DIR)
-    if not all(os.path.exists(os.path.join(precomputed_dir, a)) for a in PRECOMPUTED_ARTIFACTS):
-        return False
-    csv_path = os.path.join(backend_dir, "spotify_tracks_cleaned_final.csv")
-    try:
-        with open(os.path.join(precomputed_dir, "source_mtime.txt")) as f:
-            source_mtime = float(f.read().strip())
-    except Exception:
-        source_mtime = 0
-    if os.path.exists(csv_path) and os.path.getmtime(csv_path) > source_mtime:
-        return False
-    with open(os.path.join(precomputed_dir, "artist_features_by_id.pkl"), "rb") as f:
-        artist_features_by_id = pickle.load(f)
-    with open(os.path.join(precomputed_dir, "track_by_id.pkl"), "rb") as f:
-        track_by_id = pickle.load(f)
-    df_knn = pd.read_parquet(os.path.join(precomputed_dir, "df_knn.parquet"))
-    with open(os.path.join(precomputed_dir, "knn_model.pkl"), "rb") as f:
-        knn_model = pickle.load(f)
-    _dataset_ready = True
-    _dataset_loading = False
-    print(f"Loaded precomputed: {len(track_by_id)} tracks, {len(artist_features_by_id)} artists, KNN ready.")
+        if _dataset_loading:
+            return False
+        _dataset_loading = True
+    threading.Thread(target=_load_dataset_safely, daemon=True).start()
     return True
 
 
-def load_dataset():
-    global df_full, df_knn, knn_model, track_by_id, artist_features_by_id, _dataset_loading
-    backend_dir = os.path.dirname(os.path.abspath(__file__))
-    csv_path = os.path.join(backend_dir, "spotify_tracks_cleaned_final.csv")
-    cache_path = os.path.join(backend_dir, DATASET_CACHE)
+def _watch_precomputed():
+    """Reload when precompute_dataset.py publishes a new build to precomputed/.
 
-    if _load_from_precomputed(backend_dir):
+    Each manifest stamp (build ID, source CSV mtime) triggers at most one reload, so a build the
+    loader rejects as stale is not retried on every poll (a CSV-built snapshot has no build_id to
+    compare against); a new build or a rerun that makes it current again is picked up.
+    """
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    seen = precomputed_stamp(backend_dir)
+    while True:
+        time.sleep(DATASET_WATCH_INTERVAL)
+        current = _dataset
+        stamp = precomputed_stamp(backend_dir)
+        if current is None or stamp is None or stamp == seen:
+            continue
+        if stamp[0] == current.build_id:
+            seen = stamp
+        elif _start_reload():
+            print(f"precomputed/ build {stamp[0]} found; reloading dataset.")
+            seen = stamp
+
+
+def _ensure_watcher():
+    """Start the watcher once per process (threads do not survive gunicorn's fork)."""
+    global _watcher_pid
+    if DATASET_WATCH_INTERVAL <= 0 or _watcher_pid == os.getpid():
         return
+    with _dataset_lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+    threading.Thread(target=_watch_precomputed, daemon=True).start()
 
-    parquet_path = cache_path.replace(".pkl", ".parquet")
-    try:
-        if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
-            df_full = pd.read_parquet(parquet_path)
-        elif os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
-            with open(cache_path, "rb") as f:
-                df_full = pickle.load(f)
-        else:
-            df_full = _load_from_csv()
-            try:
-                df_full.to_parquet(parquet_path, index=False)
-            except Exception:
-                with open(cache_path, "wb") as f:
-                    pickle.dump(df_full, f, protocol=4)
-    except Exception:
-        df_full = _load_from_csv()
-
-    df_artist = df_full.groupby("artist_id", as_index=False)[FEATURE_COLS].mean()
-    df_artist["artist_id"] = df_artist["artist_id"].astype(str)
-    raw_artist = df_artist.set_index("artist_id")[FEATURE_COLS].to_dict("index")
-    artist_features_by_id = {
-        aid: {k: float(v) for k, v in row.items()}
-        for aid, row in raw_artist.items()
-    }
 
-    df_first = df_full.drop_duplicates(subset=["track_id"], keep="first").copy()
-    df_first["acousticness"] = df_first["acousticness"].fillna(0.5)
-    df_first["liveness"] = df_first["liveness"].fillna(0.2)
-    track_cols = ["track_name", "artist_name"] + FEATURE_COLS
-    df_first["track_id"] = df_first["track_id"].astype(str)
-    raw_track = df_first.set_index("track_id")[track_cols].to_dict("index")
-    track_by_id = {
-        tid: {k: float(v) if k in FEATURE_COLS else v for k, v in row.items()}
-        for tid, row in raw_track.items()
-    }
+def _ensure_dataset():
+    """Start loading the dataset if nothing has yet; never blocks. Returns True once lookups are ready
+    (the snapshot may still be lookup-only; check knn_ready before recommending)."""
+    _ensure_watcher()
+    if _dataset is not None:
+        return True
+    _start_reload()
+    return False
+
+
+def _dataset_status():
+    if _dataset is not None:
+        return "ready" if _dataset.knn_ready else "partial"
+    if _dataset_loading:
+        return "loading"
+    return "error" if _dataset_error else "idle"
 
-    df_knn = df_full.drop_duplicates(subset=["track_name", "artist_name"]).dropna(
-        subset=FEATURE_COLS
-    )
-    knn_model = NearestNeighbors(n_neighbors=5, metric="euclidean")
-    knn_model.fit(df_knn[FEATURE_COLS].values)
-    global _dataset_ready
-    _dataset_ready = True
-    _dataset_loading = False
-    print(f"Loaded {len(df_full)} tracks, {len(artist_features_by_id)} artists, KNN ready.")
+
+def _dataset_not_ready():
+    response = jsonify({"error": "Dataset not ready; try again shortly", "status": _dataset_status()})
+    response.headers["Retry-After"] = str(DATASET_RETRY_AFTER)
+    return response, 503
+
+
+def load_dataset():
+    """Build the newest snapshot and make it live; the previous one is freed once unreferenced.
+
+    On a cold start from the CSV the lookup-only stage goes live first, so matching and stats
+    are served while the neighbour index builds. A reload never replaces a full snapshot with a
+    lookup-only one.
+    """
+    global _dataset
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    started = time.perf_counter()
+    with metrics.load_step("total"):
+        for new_dataset in load_stages(backend_dir):
+            if not new_dataset.knn_ready and _dataset is not None and _dataset.knn_ready:
+                continue
+            if not new_dataset.knn_ready:
+                metrics.DATASET_LOAD_SECONDS.observe(time.perf_counter() - started, "lookup_ready")
+            previous, _dataset = _dataset, new_dataset
+            if previous is not None:
+                _retired_datasets.add(previous)
+                print(f"Dataset swapped: {previous.version} -> {new_dataset.version}")
 
 
 def get_spotify_client():
@@ -285,63 +306,62 @@ def get_spotify_client():
     if sp_oauth.is_token_expired(token_info):
         token_info = sp_oauth.refresh_access_token(token_info["refresh_token"])
         session["token_info"] = token_info
-    return Spotify(auth=token_info["access_token"])
+    return SpotifyUser(token_info["access_token"])
 
 
 TOP_TRACKS_LIMIT = 50
 
 
-def get_tracks_with_features(sp):
-    """Fetch top tracks from Spotify and match to dataset. Returns (all_tracks, matched_df).
+def get_tracks_with_features(top_tracks, dataset):
+    """Match Spotify top tracks to dataset. Returns (all_tracks, matched).
     all_tracks: list of 50 dicts with track_name, artist_name, match_type, and features when matched.
-    matched_df: DataFrame of matched rows only (for stats and recommendations).
+    matched: MatchedTracks of matched rows only (for stats and recommendations).
     """
-    top_tracks = sp.current_user_top_tracks(limit=TOP_TRACKS_LIMIT)["items"]
-    rows_matched = []
+    lookup_store = dataset.lookup_store
+    match, features, track_pos = lookup_store.resolve(
+        [t["id"] for t in top_tracks],
+        [t["artists"][0]["id"] for t in top_tracks],
+        [t["name"] for t in top_tracks],
+        [t["artists"][0]["name"] for t in top_tracks],
+        dataset.name_index if NAME_MATCH != "off" else None,
+    )
+    matched_names = []
+    matched_artists = []
     all_tracks = []
 
-    for t in top_tracks:
-        track_id = t["id"]
-        track_name = t["name"]
-        artist = t["artists"][0]
-        artist_id = artist["id"]
-        artist_name = artist["name"]
-
-        row = track_by_id.get(track_id)
-        match_type = "exact" if row is not None else None
-        if row is None:
-            af = artist_features_by_id.get(artist_id)
-            if af is not None:
-                row = {
-                    "track_name": track_name,
-                    "artist_name": artist_name,
-                    **af,
-                }
-                match_type = "artist"
-        if row is not None:
-            rows_matched.append(row)
-            all_tracks.append({
-                "track_name": row["track_name"],
-                "artist_name": row["artist_name"],
-                "match_type": match_type,
-                "tempo": int(round(float(row["tempo"]))),
-                "energy": round(float(row["energy"]), 2),
-                "valence": round(float(row["valence"]), 2),
-                "danceability": round(float(row["danceability"]), 2),
-            })
-        else:
+    for i, t in enumerate(top_tracks):
+        if match[i] == MATCH_NONE:
             all_tracks.append({
-                "track_name": track_name,
-                "artist_name": artist_name,
+                "track_name": t["name"],
+                "artist_name": t["artists"][0]["name"],
                 "match_type": "unmatched",
                 "tempo": None,
                 "energy": None,
                 "valence": None,
                 "danceability": None,
             })
+            continue
+        if track_pos[i] >= 0:
+            track_name = lookup_store.track_names[track_pos[i]]
+            artist_name = lookup_store.track_artists[track_pos[i]]
+        else:
+            track_name = t["name"]
+            artist_name = t["artists"][0]["name"]
+        row = dict(zip(FEATURE_COLS, features[i].tolist()))
+        matched_names.append(track_name)
+        matched_artists.append(artist_name)
+        all_tracks.append({
+            "track_name": track_name,
+            "artist_name": artist_name,
+            "match_type": MATCH_TYPES[int(match[i])],
+            "tempo": int(round(row["tempo"])),
+            "energy": round(row["energy"], 2),
+            "valence": round(row["valence"], 2),
+            "danceability": round(row["danceability"], 2),
+        })
 
-    matched_df = pd.DataFrame(rows_matched) if rows_matched else pd.DataFrame()
-    return all_tracks, matched_df
+    matched = match != MATCH_NONE
+    return all_tracks, MatchedTracks(features[matched], matched_names, matched_artists, track_pos[matched])
 
 
 @app.route("/login")
@@ -363,90 +383,94 @@ def callback():
         return redirect(_safe_frontend_redirect("/"))
     session["token_info"] = token_info
     session.modified = True
-    sp = Spotify(auth=token_info["access_token"])
-    user = sp.current_user()
+    try:
+        user = SpotifyUser(token_info["access_token"]).profile()
+    except Exception:
+        return redirect(_safe_frontend_redirect("/"))
     spotify_id = user["id"]
+    session["spotify_id"] = spotify_id
     name = user.get("display_name") or "Unknown"
     email = user.get("email")
 
-    try:
-        cur = _get_cursor()
-        cur.execute(
-            "INSERT IGNORE INTO users (spotify_id, name, email) VALUES (%s, %s, %s)",
-            (spotify_id, name, email),
-        )
-        _get_db().commit()
-    except Exception as e:
-        if not IS_PRODUCTION:
-            print("DB Error:", str(e)[:200])
+    if not _get_user_writer().submit(spotify_id, name, email) and not IS_PRODUCTION:
+        print("DB Error: user upsert queue full; dropped", spotify_id)
 
     return redirect(_safe_frontend_redirect("/dashboard"))
 
 
 def _stats_from_matched(matched, total_count=TOP_TRACKS_LIMIT):
-    """Build user-stats payload from a matched DataFrame (caller rounds if needed)."""
-    matched = matched.copy()
-    matched["tempo"] = matched["tempo"].round()
-    matched["energy"] = matched["energy"].round(2)
-    matched["valence"] = matched["valence"].round(2)
-    matched["danceability"] = matched["danceability"].round(2)
-    matched_count = len(matched)
-    return {
-        "track_count": matched_count,
-        "matched_count": matched_count,
-        "total_count": total_count,
-        "tempo_avg": round(float(matched["tempo"].mean()), 1),
-        "tempo_range": [int(matched["tempo"].min()), int(matched["tempo"].max())],
-        "energy_avg": round(float(matched["energy"].mean()), 2),
-        "valence_avg": round(float(matched["valence"].mean()), 2),
-        "danceability_avg": round(float(matched["danceability"].mean()), 2),
-        "tracks": matched[
-            ["track_name", "artist_name", "tempo", "energy", "valence", "danceability"]
-        ].to_dict(orient="records"),
-    }
+    """Build user-stats payload from MatchedTracks (rounds tempo/energy/valence/danceability)."""
+    return recommender.stats(matched, total_count)
+
 
+def _recommendations_from_matched(matched, dataset, mode=None, filters=None):
+    """Build recommendations list from matched user tracks against one dataset snapshot (see recommender.REC_MODES).
+    filters: optional attribute_index.SearchFilter."""
+    return recommender.recommend(matched, dataset.knn_table, dataset.knn_engine, dataset.feature_transform, mode=mode,
+                                 filters=filters, attribute_index=dataset.attribute_index,
+                                 neighbour_table=dataset.neighbour_table)
 
-def _recommendations_from_matched(matched):
-    """Build recommendations list from matched user tracks (uses global knn_model, df_knn)."""
-    distances, indices = knn_model.kneighbors(matched[FEATURE_COLS].values)
-    recommended = []
-    seen = set()
-    matched_set = set(zip(matched["track_name"], matched["artist_name"]))
-    for idx_list in indices:
-        for idx in idx_list:
-            row = df_knn.iloc[idx]
-            key = (row["track_name"], row["artist_name"])
-            if key not in seen and key not in matched_set:
-                seen.add(key)
-                recommended.append({
-                    "track_name": row["track_name"],
-                    "artist_name": row["artist_name"],
-                    "tempo": float(row["tempo"]),
-                    "energy": float(row["energy"]),
-                    "valence": float(row["valence"]),
-                    "danceability": float(row["danceability"]),
-                })
-                if len(recommended) >= 25:
-                    break
-        if len(recommended) >= 25:
-            break
-    return recommended[:25]
+
+SLIM_USER_FIELDS = ("id", "display_name", "images")
+
+
+def _slim_payload(payload):
+    """/auth-data payload without the duplicated stats.tracks list and with a trimmed user object."""
+    stats = {k: v for k, v in payload["stats"].items() if k != "tracks"}
+    user = {k: payload["user"][k] for k in SLIM_USER_FIELDS if k in payload["user"]}
+    return {**payload, "user": user, "stats": stats}
+
+
+def _auth_data_response(payload, slim=False):
+    return json_response(_slim_payload(payload) if slim else payload)
 
 
 @app.route("/auth-data")
 @rate_limit
 def auth_data():
-    """Single endpoint: user + stats + recommendations with one Spotify fetch and one KNN run."""
+    """Single endpoint: user + stats + recommendations from one concurrent Spotify fetch and one KNN run.
+    Optional ?time_range=short_term|medium_term|long_term (default medium_term) and
+    ?mode=per_track|centroid|clusters (default REC_MODE). Filters: min_<feature>/max_<feature> for any
+    FEATURE_COLS, exclude_artist (repeatable) and exclude_seed_artists=1. ?slim=1 drops stats.tracks
+    (the matched entries of tracks) and trims user to id, display_name and images.
+    Compact JSON, compressed per Accept-Encoding, with an ETag for If-None-Match (see responses.py).
+    While only the lookup stage is live, stats are served with recommended=[],
+    recommendations_status="pending" and Retry-After; otherwise recommendations_status="ready".
+    """
     if not _ensure_dataset():
-        return jsonify({"error": "Dataset not ready; try again shortly"}), 503
+        return _dataset_not_ready()
+    dataset = _dataset
+    if not session.get("token_info"):
+        return jsonify({"error": "Unauthorized"}), 401
+    time_range = request.args.get("time_range", DEFAULT_TIME_RANGE)
+    if time_range not in TIME_RANGES:
+        return jsonify({"error": f"time_range must be one of {', '.join(TIME_RANGES)}"}), 400
+    mode = request.args.get("mode", recommender.REC_MODE)
+    if mode not in recommender.REC_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(recommender.REC_MODES)}"}), 400
+    try:
+        filters = SearchFilter.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result_version = f"{dataset.version}:{time_range}:{mode}"
+    if filters is not None:
+        result_version += f":{filters.cache_key()}"
+    slim = request.args.get("slim", "").lower() in ("1", "true", "yes")
+    spotify_id = session.get("spotify_id")
+    if _result_cache is not None and spotify_id:
+        cached = _result_cache.get(cache_key(spotify_id, result_version))
+        if cached is not None:
+            return _auth_data_response(cached, slim)
     sp = get_spotify_client()
     if not sp:
         return jsonify({"error": "Unauthorized"}), 401
     try:
-        user = sp.current_user()
-        all_tracks, matched = get_tracks_with_features(sp)
+        with metrics.stage("spotify"):
+            user, top_tracks = sp.profile_and_top_tracks((time_range,), TOP_TRACKS_LIMIT)
+        with metrics.stage("match"):
+            all_tracks, matched = get_tracks_with_features(top_tracks[time_range], dataset)
         if matched.empty:
-            return jsonify({
+            payload = {
                 "user": user,
                 "stats": {
                     "error": "No matching tracks",
@@ -456,15 +480,33 @@ def auth_data():
                 },
                 "recommended": [],
                 "tracks": all_tracks,
-            }), 200
-        stats = _stats_from_matched(matched)
-        recommended = _recommendations_from_matched(matched)
-        return jsonify({
-            "user": user,
-            "stats": stats,
-            "recommended": recommended,
-            "tracks": all_tracks,
-        })
+            }
+        else:
+            with metrics.stage("stats"):
+                stats = _stats_from_matched(matched)
+            recommended = []
+            if dataset.knn_ready:
+                with metrics.stage("knn"):
+                    recommended = _recommendations_from_matched(matched, dataset, mode, filters)
+            payload = {
+                "user": user,
+                "stats": stats,
+                "recommended": recommended,
+                "tracks": all_tracks,
+            }
+        payload["recommendations_status"] = "ready" if dataset.knn_ready else "pending"
+        if _result_cache is not None and user.get("id") and dataset.knn_ready:
+            session["spotify_id"] = user["id"]
+            _result_cache.set(cache_key(user["id"], result_version), payload)
+        with metrics.stage("serialize"):
+            response = _auth_data_response(payload, slim)
+        if not dataset.knn_ready:
+            response.headers["Retry-After"] = str(DATASET_RETRY_AFTER)
+        return response
+    except RateLimited as e:
+        response = jsonify({"error": "Spotify rate limit; try again shortly"})
+        response.headers["Retry-After"] = str(int(e.retry_after + 0.999))
+        return response, 503
     except Exception as e:
         if not IS_PRODUCTION:
             traceback.print_exc()
@@ -472,6 +514,87 @@ def auth_data():
         return jsonify({"error": err_msg}), 500
 
 
+@app.route("/recommendations/batch", methods=["POST"])
+@rate_limit
+def recommendations_batch():
+    """Recommendations for many seed sets in one call; requires X-Admin-Token.
+    Body: {"seeds": [seed set, ...], "limit": N} (seed sets as in batch.py).
+    Streams NDJSON, one {"id", "recommended"} line per seed set in input order.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    if not _is_admin():
+        return jsonify({"error": "Forbidden"}), 403
+    if not _ensure_dataset() or not _dataset.knn_ready:
+        return _dataset_not_ready()
+    dataset = _dataset
+    body = request.get_json(silent=True) or {}
+    seeds = body.get("seeds")
+    if not isinstance(seeds, list) or not seeds:
+        return jsonify({"error": "seeds must be a non-empty list"}), 400
+    if len(seeds) > BATCH_MAX_SETS:
+        return jsonify({"error": f"at most {BATCH_MAX_SETS} seed sets per call"}), 400
+    try:
+        limit = batch.parse_limit(body.get("limit"))
+        resolved = [batch.resolve_seed_set(item, dataset.lookup_store, limit) for item in seeds]
+    except batch.SeedSetError as e:
+        return jsonify({"error": str(e)}), 400
+    results = batch.recommend_resolved(resolved, dataset, workers=BATCH_WORKERS)
+    return Response(stream_with_context(batch.ndjson_lines(results)), mimetype="application/x-ndjson")
+
+
+@app.route("/health")
+def health():
+    """Readiness probe: 200 once the dataset is live, 503 (with Retry-After) while it loads.
+    A lookup-only snapshot counts as live (status "partial"); components says which stages are up.
+    """
+    ready = _ensure_dataset()
+    dataset = _dataset
+    body = {"status": _dataset_status(), "dataset_ready": ready}
+    body["components"] = {
+        "lookup": dataset is not None,
+        "knn": dataset is not None and dataset.knn_ready,
+        "neighbour_table": dataset is not None and dataset.neighbour_table is not None,
+    }
+    if dataset is not None:
+        body["dataset_version"] = dataset.version
+        body["reloading"] = _dataset_loading
+        body["retired_datasets_alive"] = len(_retired_datasets)
+    if _result_cache is not None:
+        body["result_cache"] = _result_cache.stats()
+    if _rate_limiter is not None:
+        body["rate_limit"] = _rate_limiter.stats()
+    if _user_writer is not None and _user_writer_pid == os.getpid():
+        body["user_writes"] = _user_writer.stats()
+    if _dataset_error and not IS_PRODUCTION:
+        body["error"] = _dataset_error
+    response = jsonify(body)
+    if not ready:
+        response.headers["Retry-After"] = str(DATASET_RETRY_AFTER)
+    return response, 200 if ready else 503
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of this process's metrics."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    """Load the newest dataset in the background and swap it in; requires X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    if not _is_admin():
+        return jsonify({"error": "Forbidden"}), 403
+    started = _start_reload()
+    current = _dataset
+    return jsonify({
+        "status": "reloading" if started else "already_loading",
+        "dataset_version": current.version if current is not None else None,
+    }), 202
+
+
 @app.route("/logout")
 @rate_limit
 def logout():
@@ -480,13 +603,48 @@ def logout():
     return jsonify({"message": "Logged out"}), 200
 
 
+def _cache_counts():
+    stats = _result_cache.stats() if _result_cache is not None else {}
+    return {(k,): stats.get(k) for k in ("hits", "misses", "evictions")}
+
+
+def _user_write_counts():
+    if _user_writer is None or _user_writer_pid != os.getpid():
+        return {}
+    stats = _user_writer.stats()
+    return {(k,): stats[k] for k in ("written", "dropped", "errors")}
+
+
+metrics.gauge("sonus_dataset_ready", "1 once a dataset snapshot is live.", lambda: {(): _dataset is not None})
+metrics.gauge("sonus_dataset_knn_ready", "1 once the live snapshot can serve recommendations.",
+              lambda: {(): _dataset is not None and _dataset.knn_ready})
+metrics.gauge("sonus_dataset_loading", "1 while a dataset (re)load runs.", lambda: {(): _dataset_loading})
+metrics.gauge("sonus_dataset_loaded_timestamp_seconds", "When the live snapshot was loaded.",
+              lambda: {(): _dataset.loaded_at} if _dataset is not None else {})
+metrics.gauge("sonus_dataset_retired_alive", "Replaced snapshots still referenced by requests.",
+              lambda: {(): len(_retired_datasets)})
+metrics.gauge("sonus_result_cache_events_total", "Result cache lookups and evictions.", _cache_counts,
+              ("event",), kind="counter")
+metrics.gauge("sonus_result_cache_entries", "Entries in the in-process result cache.",
+              lambda: {(): _result_cache.stats().get("size")} if _result_cache is not None else {})
+metrics.gauge("sonus_rate_limit_rejected_total", "Requests rejected by the rate limiter.",
+              lambda: {(): _rate_limiter.stats()["rejected"]} if _rate_limiter is not None else {},
+              kind="counter")
+metrics.gauge("sonus_user_writes_total", "User upserts by outcome.", _user_write_counts, ("outcome",),
+              kind="counter")
+metrics.gauge("sonus_user_writes_pending", "User upserts waiting to be written.",
+              lambda: {(): _user_writer.stats()["pending"]}
+              if _user_writer is not None and _user_writer_pid == os.getpid() else {})
+
+
 if __name__ == "__main__":
+    # Development server. For production use serve.py (gunicorn, dataset preloaded before fork).
     # Start dataset load only in the process that serves requests:
     # - With reloader (debug=True): only the child has WERKZEUG_RUN_MAIN=true → load once.
     # - Without reloader (debug=False / production): no child → start here (only process).
     using_reloader = not IS_PRODUCTION
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or not using_reloader:
-        threading.Thread(target=load_dataset, daemon=True).start()
+        _ensure_dataset()
     app.run(
         port=int(os.getenv("PORT", 8888)),
         debug=not IS_PRODUCTION,
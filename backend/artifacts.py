@@ -0,0 +1,163 @@
+"""
+Memory-mapped precomputed artifact format.
+
+precompute_dataset.py writes these files to precomputed/ and app.py maps them
+with np.load(mmap_mode="r"), so startup does no unpickling and every worker
+process shares the same physical pages through the OS page cache.
+
+  manifest.json                     format version, row counts, source CSV mtime
+  track_ids.npy                     S22, sorted ascending (LookupStore, see lookup_store.py)
+  track_features.npy                float32 [n_tracks, len(FEATURE_COLS)], same order
+  track_names.{offsets,blob}.npy    string table, same order
+  track_artists.{offsets,blob}.npy  string table, same order
+  artist_ids.npy                    S22, sorted ascending
+  artist_features.npy               float32 [n_artists, len(FEATURE_COLS)]
+  track_codes.npy, artist_codes.npy,
+  lookup_quantizer.json             instead of the two above under LOOKUP_QUANTIZE: uint16 codes (quantize.py)
+  knn_features.npy                  float32 [n_knn, len(FEATURE_COLS)], KNN row order, raw values
+  feature_transform.json            standardization + weights applied before indexing (feature_transform.py)
+  knn_names.{offsets,blob}.npy      string table, KNN row order
+  knn_artists.{offsets,blob}.npy    string table, KNN row order
+  knn_keys.npy                      uint64 (track_name, artist_name) key per KNN row
+  attr_*.npy                        per-column sorted indexes and artist keys for filtered search (attribute_index.py)
+  name_*.npy                        normalized (track, artist) keys and, under NAME_MATCH=fuzzy, (artist, trigram)
+                                    postings for name matching (name_index.py)
+  neighbours.npy,
+  neighbour_track_rows.npy          precomputed neighbour lists and each track's KNN row (neighbour_table.py)
+  knn_model.joblib                  exact engine over transformed features (arrays mapped on load)
+  ivf_*.npy, ivf_meta.json          ivf engine over transformed features (see ann.py)
+  ivf_sq8_codes.npy, ivf_sq8.json   uint8 codes of the ivf lists for the ivf_sq8 engine
+
+A build is written to precomputed/.staging/ and each file is then moved into
+place with os.replace, manifest last. Replacing (rather than rewriting) keeps
+the old inodes alive, so a running app that still maps the previous version
+keeps reading it until it swaps to the new one (see dataset.py).
+"""
+
+import json
+import os
+import shutil
+import time
+
+from ann import ExactEngine, load_engine
+from attribute_index import AttributeIndex
+from feature_transform import FeatureTransform
+from lookup_store import FEATURE_COLS, LOOKUP_QUANTIZER, KnnTable, LookupStore
+from name_index import GRAM_FILES, NameIndex
+from neighbour_table import NEIGHBOUR_TABLE, NeighbourTable, track_knn_rows
+
+FORMAT_VERSION = 2
+MANIFEST = "manifest.json"
+STAGING_DIR = ".staging"
+MMAP_ARTIFACTS = [
+    MANIFEST,
+    "track_ids.npy",
+    "artist_ids.npy",
+    "knn_features.npy",
+    "knn_keys.npy",
+    ExactEngine.artifact,
+]
+# A build writes one lookup feature representation (float32 or codes) and removes the other.
+LOOKUP_FEATURE_FILES = [
+    "track_features.npy", "artist_features.npy", "track_codes.npy", "artist_codes.npy", LOOKUP_QUANTIZER,
+]
+# Written only by some builds; removed by a build that doesn't write them.
+OPTIONAL_FILES = LOOKUP_FEATURE_FILES + GRAM_FILES + NeighbourTable.files
+# Written by earlier builds only.
+RETIRED_FILES = ["name_artist_keys.npy", "name_artist_rows.npy"]
+
+
+def has_mmap_artifacts(precomputed_dir):
+    required = MMAP_ARTIFACTS + LookupStore.feature_files(precomputed_dir)
+    return all(os.path.exists(os.path.join(precomputed_dir, a)) for a in required)
+
+
+def read_manifest(precomputed_dir):
+    with open(os.path.join(precomputed_dir, MANIFEST)) as f:
+        return json.load(f)
+
+
+def _write_manifest(precomputed_dir, manifest):
+    tmp_path = os.path.join(precomputed_dir, MANIFEST + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(precomputed_dir, MANIFEST))
+
+
+def update_source_mtime(precomputed_dir, source_mtime):
+    """Record a new CSV mtime for unchanged artifacts (content-identical rerun)."""
+    manifest = read_manifest(precomputed_dir)
+    manifest["source_mtime"] = source_mtime
+    _write_manifest(precomputed_dir, manifest)
+
+
+def save_mmap_artifacts(precomputed_dir, df_first, df_artist, df_knn, feature_transform, engines, source_mtime,
+                        neighbours=None):
+    """Write the mmap format from the DataFrames built by precompute_dataset.main.
+
+    neighbours: NeighbourTable lists over the df_knn rows, or None to write no neighbour table.
+    """
+    staging_dir = os.path.join(precomputed_dir, STAGING_DIR)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    store = LookupStore.from_frames(df_first, df_artist)
+    store.save(staging_dir)
+    knn_table = KnnTable.from_frame(df_knn)
+    knn_table.save(staging_dir)
+    AttributeIndex.build(knn_table.features, df_knn["artist_name"].values).save(staging_dir)
+    n_tracks = range(store.n_tracks)
+    track_names, track_artists = store.track_names.take(n_tracks), store.track_artists.take(n_tracks)
+    NameIndex.build(track_names, track_artists).save(staging_dir)
+    if neighbours is not None:
+        NeighbourTable(neighbours, track_knn_rows(store, knn_table, track_names, track_artists)).save(staging_dir)
+    feature_transform.save(staging_dir)
+    for engine in engines:
+        engine.save(staging_dir)
+
+    manifest_path = os.path.join(precomputed_dir, MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    staged = os.listdir(staging_dir)
+    for name in staged:
+        os.replace(os.path.join(staging_dir, name), os.path.join(precomputed_dir, name))
+    os.rmdir(staging_dir)
+    for name in (set(OPTIONAL_FILES) - set(staged)) | set(RETIRED_FILES):
+        if os.path.exists(os.path.join(precomputed_dir, name)):
+            os.remove(os.path.join(precomputed_dir, name))
+
+    # Manifest last: its presence marks a complete artifact set.
+    _write_manifest(precomputed_dir, {
+        "format_version": FORMAT_VERSION,
+        "build_id": f"{time.time():.6f}",
+        "feature_cols": FEATURE_COLS,
+        "n_tracks": int(store.n_tracks),
+        "n_artists": int(store.n_artists),
+        "n_knn": int(len(df_knn)),
+        "engines": [e.name for e in engines],
+        "neighbour_table_k": int(neighbours.shape[1]) if neighbours is not None else 0,
+        "source_mtime": source_mtime,
+    })
+
+
+def load_mmap_artifacts(precomputed_dir):
+    """Map artifacts read-only.
+
+    Returns (lookup_store, knn_table, feature_transform, knn_engine, attribute_index, name_index,
+    neighbour_table) for the configured engine. Artifact sets written before attribute_index.py get the
+    index built in memory; sets written before name_index.py or neighbour_table.py have no name index or
+    neighbour table (re-run precompute_dataset.py). neighbour_table is also None under NEIGHBOUR_TABLE=off.
+    """
+    manifest = read_manifest(precomputed_dir)
+    if manifest.get("format_version") != FORMAT_VERSION or manifest.get("feature_cols") != FEATURE_COLS:
+        raise ValueError(f"Unsupported precomputed format: {manifest.get('format_version')}")
+
+    knn_table = KnnTable.load(precomputed_dir)
+    if AttributeIndex.exists(precomputed_dir):
+        attribute_index = AttributeIndex.load(precomputed_dir)
+    else:
+        attribute_index = AttributeIndex.build(knn_table.features, knn_table.artists.take(range(len(knn_table))))
+    name_index = NameIndex.load(precomputed_dir) if NameIndex.exists(precomputed_dir) else None
+    neighbour_table = (NeighbourTable.load(precomputed_dir)
+                       if NEIGHBOUR_TABLE and NeighbourTable.exists(precomputed_dir) else None)
+    return (LookupStore.load(precomputed_dir), knn_table, FeatureTransform.load(precomputed_dir),
+            load_engine(precomputed_dir), attribute_index, name_index, neighbour_table)
@@ -0,0 +1,283 @@
+"""
+Filtered neighbour search: per-attribute sorted indexes over the KNN rows.
+
+A SearchFilter holds range constraints on raw FEATURE_COLS values (e.g.
+tempo 120-140, energy >= 0.7) and artists to leave out. AttributeIndex keeps,
+for every column, the KNN rows sorted by that column, plus an artist key per
+row and the same keys sorted:
+
+  attr_order.npy         int32 [len(FEATURE_COLS), n_knn]  KNN rows sorted by each raw column
+  attr_sorted.npy        float32 [len(FEATURE_COLS), n_knn] column values in that order
+  attr_artist_keys.npy   uint64 [n_knn]  artist key per KNN row (artist_keys())
+  attr_artists_sorted.npy uint64 [n_knn] the same keys, sorted
+
+filtered_kneighbors() finds each constrained column's span of rows with one
+searchsorted, then:
+
+  - if the narrowest span holds up to FILTER_BRUTE_FORCE_ROWS rows, or the
+    filter is so selective (product of span fractions) that even
+    FILTER_MAX_OVERFETCH neighbours are unlikely to hold OVERFETCH_FACTOR * k
+    matches, the span's rows are checked against the other ranges and
+    searched exactly by brute force in the transformed space, so a narrow
+    filter costs O(span), not a scan or an over-fetch;
+  - otherwise the ranges are a box in the (per-column affine) index space.
+    Each query is clamped into the box and the engine is asked for
+    neighbours of the clamped point, which are filtered and re-ranked by
+    distance to the real query. Any row in the box is at least
+    sqrt(gap^2 + reach^2) from the query (gap = query to box, reach =
+    farthest fetched neighbour), so once the k-th hit is closer than that
+    it is final. If not, the fetch grows 4x up to FILTER_MAX_OVERFETCH, then
+    falls back to brute force.
+
+Artist exclusion is applied to every hit; rows by excluded artists are
+counted exactly from the sorted artist keys and added to the first fetch.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from lookup_store import FEATURE_COLS, name_keys
+
+MAX_OVERFETCH = int(os.getenv("FILTER_MAX_OVERFETCH", 4096))
+OVERFETCH_FACTOR = 4
+BRUTE_FORCE_ROWS = int(os.getenv("FILTER_BRUTE_FORCE_ROWS", 50_000))
+BRUTE_FORCE_BLOCK = 65_536
+MAX_EXCLUDED_ARTISTS = 200
+_COL = {c: i for i, c in enumerate(FEATURE_COLS)}
+_TRUE = ("1", "true", "yes", "on")
+
+
+def artist_keys(artist_names):
+    """uint64 key per artist name (hashing each distinct name once)."""
+    codes, uniques = pd.factorize(pd.Series(artist_names, dtype=object).astype(str))
+    return name_keys([""] * len(uniques), uniques)[codes]
+
+
+class SearchFilter:
+    """Range constraints {col: (min, max)} on raw feature values (None = open) and excluded artist names."""
+
+    def __init__(self, ranges=None, exclude_artists=(), exclude_seed_artists=False):
+        self.ranges = {}
+        for col, (lo, hi) in (ranges or {}).items():
+            if col not in _COL:
+                raise ValueError(f"unknown feature {col!r}")
+            lo = None if lo is None else float(lo)
+            hi = None if hi is None else float(hi)
+            if lo is not None and hi is not None and lo > hi:
+                raise ValueError(f"min_{col} is greater than max_{col}")
+            if lo is not None or hi is not None:
+                self.ranges[col] = (lo, hi)
+        self.exclude_artists = tuple(exclude_artists)[:MAX_EXCLUDED_ARTISTS]
+        self.exclude_seed_artists = bool(exclude_seed_artists)
+
+    @classmethod
+    def from_args(cls, args):
+        """From request args: min_<col>, max_<col>, exclude_artist (repeatable), exclude_seed_artists=1.
+        Returns None when no filter is given; raises ValueError on bad values."""
+        ranges = {}
+        for col in FEATURE_COLS:
+            lo, hi = args.get(f"min_{col}"), args.get(f"max_{col}")
+            if lo is not None or hi is not None:
+                try:
+                    ranges[col] = (None if lo in (None, "") else float(lo), None if hi in (None, "") else float(hi))
+                except ValueError:
+                    raise ValueError(f"min_{col} and max_{col} must be numbers") from None
+        flt = cls(
+            ranges,
+            [a for a in args.getlist("exclude_artist") if a],
+            str(args.get("exclude_seed_artists", "")).lower() in _TRUE,
+        )
+        return None if flt.empty else flt
+
+    @property
+    def empty(self):
+        return not self.ranges and not self.exclude_artists and not self.exclude_seed_artists
+
+    def cache_key(self):
+        """Canonical string for result-cache keys."""
+        ranges = ",".join(f"{c}:{lo}:{hi}" for c, (lo, hi) in sorted(self.ranges.items()))
+        return f"{ranges}|{','.join(sorted(self.exclude_artists))}|{int(self.exclude_seed_artists)}"
+
+    def excluded_artist_keys(self, seed_artists=()):
+        names = list(self.exclude_artists) + (list(seed_artists) if self.exclude_seed_artists else [])
+        return np.unique(artist_keys(names)) if names else np.empty(0, dtype=np.uint64)
+
+
+class AttributeIndex:
+    """Sorted per-column row orders and artist keys over KnnTable rows."""
+
+    def __init__(self, order, sorted_values, row_artist_keys, artists_sorted):
+        self.order = order
+        self.sorted_values = sorted_values
+        self.artist_keys = row_artist_keys
+        self.artists_sorted = artists_sorted
+
+    def __len__(self):
+        return len(self.artist_keys)
+
+    @classmethod
+    def build(cls, features, artist_names):
+        """From raw KNN features [n, len(FEATURE_COLS)] and the artist name of each row."""
+        features = np.asarray(features, dtype=np.float32)
+        order = np.argsort(features, axis=0, kind="stable").T.astype(np.int32)
+        sorted_values = np.take_along_axis(features.T, order, axis=1)
+        keys = artist_keys(artist_names)
+        return cls(order, sorted_values, keys, np.sort(keys))
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "attr_order.npy"), self.order)
+        np.save(os.path.join(directory, "attr_sorted.npy"), self.sorted_values)
+        np.save(os.path.join(directory, "attr_artist_keys.npy"), self.artist_keys)
+        np.save(os.path.join(directory, "attr_artists_sorted.npy"), self.artists_sorted)
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, "attr_artists_sorted.npy"))
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        def npy(name):
+            return np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+
+        return cls(npy("attr_order.npy"), npy("attr_sorted.npy"), npy("attr_artist_keys.npy"),
+                   npy("attr_artists_sorted.npy"))
+
+    def _spans(self, ranges):
+        """(rows in range, column, start, stop) per constrained column, narrowest first."""
+        spans = []
+        for col, (lo, hi) in ranges.items():
+            c = _COL[col]
+            values = self.sorted_values[c]
+            start = 0 if lo is None else int(np.searchsorted(values, np.float32(lo), side="left"))
+            stop = len(values) if hi is None else int(np.searchsorted(values, np.float32(hi), side="right"))
+            spans.append((max(stop - start, 0), c, start, stop))
+        return sorted(spans)
+
+    def span_rows(self, ranges):
+        """Rows in the narrowest column span: what candidates() has to gather and check."""
+        spans = self._spans(ranges)
+        return spans[0][0] if spans else len(self)
+
+    def selectivity(self, ranges):
+        """Expected fraction of rows inside every range, treating columns as independent."""
+        n = len(self)
+        return float(np.prod([size / n for size, _, _, _ in self._spans(ranges)])) if n else 0.0
+
+    def candidates(self, features, ranges):
+        """Sorted KNN rows inside every range, or None if there are no ranges."""
+        spans = self._spans(ranges)
+        if not spans:
+            return None
+        _, c, start, stop = spans[0]
+        rows = np.sort(self.order[c, start:stop])
+        if len(spans) > 1 and len(rows):
+            rows = rows[in_ranges(features[rows], ranges)]
+        return rows
+
+    def count_artists(self, keys):
+        """Rows whose artist key is in keys."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        return int((np.searchsorted(self.artists_sorted, keys, side="right")
+                    - np.searchsorted(self.artists_sorted, keys, side="left")).sum())
+
+
+def in_ranges(values, ranges):
+    """Mask of raw feature rows [..., len(FEATURE_COLS)] inside every range (compared in float32,
+    like the stored values, so energy >= 0.7 keeps rows stored as 0.7)."""
+    keep = np.ones(values.shape[:-1], dtype=bool)
+    for col, (lo, hi) in ranges.items():
+        if lo is not None:
+            keep &= values[..., _COL[col]] >= np.float32(lo)
+        if hi is not None:
+            keep &= values[..., _COL[col]] <= np.float32(hi)
+    return keep
+
+
+def _box(feature_transform, ranges):
+    """Range constraints as per-column (lo, hi) bounds in the transformed (index) space."""
+    lo = np.full(len(FEATURE_COLS), -np.inf)
+    hi = np.full(len(FEATURE_COLS), np.inf)
+    for col, (l, h) in ranges.items():
+        lo[_COL[col]] = -np.inf if l is None else l
+        hi[_COL[col]] = np.inf if h is None else h
+    with np.errstate(invalid="ignore"):
+        lo, hi = feature_transform.transform(lo[None, :])[0], feature_transform.transform(hi[None, :])[0]
+    return np.where(np.isnan(lo), -np.inf, lo), np.where(np.isnan(hi), np.inf, hi)
+
+
+def _brute_force(Q, feature_transform, features, rows, k):
+    """Exact k nearest of Q among rows, in blocks of BRUTE_FORCE_BLOCK; returns (distances, row ids)."""
+    k = min(k, len(rows))
+    best_d = np.empty((len(Q), 0))
+    best_i = np.empty((len(Q), 0), dtype=np.int64)
+    if k == 0:
+        return best_d, best_i
+    Q = np.asarray(Q, dtype=np.float64)
+    for start in range(0, len(rows), BRUTE_FORCE_BLOCK):
+        block = np.asarray(rows[start:start + BRUTE_FORCE_BLOCK], dtype=np.int64)
+        X = feature_transform.transform(features[block]).astype(np.float64)
+        d = (X * X).sum(axis=1) - 2 * Q @ X.T
+        if d.shape[1] > k:
+            top = np.argpartition(d, k - 1, axis=1)[:, :k]
+            d, ids = np.take_along_axis(d, top, axis=1), block[top]
+        else:
+            ids = np.broadcast_to(block, d.shape)
+        best_d, best_i = np.concatenate([best_d, d], axis=1), np.concatenate([best_i, ids], axis=1)
+        if best_d.shape[1] > k:
+            top = np.argpartition(best_d, k - 1, axis=1)[:, :k]
+            best_d, best_i = np.take_along_axis(best_d, top, axis=1), np.take_along_axis(best_i, top, axis=1)
+    order = np.argsort(best_d, axis=1, kind="stable")
+    d = np.take_along_axis(best_d, order, axis=1) + (Q * Q).sum(axis=1)[:, None]
+    return np.sqrt(np.maximum(d, 0)), np.take_along_axis(best_i, order, axis=1)
+
+
+def filtered_kneighbors(engine, feature_transform, knn_table, index, Q, k, flt, seed_artists=()):
+    """engine.kneighbors(Q, k) restricted to KNN rows that pass flt (a SearchFilter or None)."""
+    if flt is None or flt.empty:
+        return engine.kneighbors(Q, k)
+    n = len(knn_table)
+    features = knn_table.features
+    excluded = flt.excluded_artist_keys(seed_artists)
+    n_excluded = index.count_artists(excluded)
+    if not flt.ranges and n_excluded == 0:
+        return engine.kneighbors(Q, k)
+
+    Q = np.asarray(Q, dtype=np.float64)
+    distances = np.empty((len(Q), k))
+    indices = np.empty((len(Q), k), dtype=np.int64)
+    todo = np.arange(len(Q))
+    wide = index.selectivity(flt.ranges) * MAX_OVERFETCH >= OVERFETCH_FACTOR * k
+    if wide and index.span_rows(flt.ranges) > BRUTE_FORCE_ROWS:
+        lo, hi = _box(feature_transform, flt.ranges)
+        clamped = np.clip(Q, lo, hi)
+        gap = ((Q - clamped) ** 2).sum(axis=1)
+        fetch = OVERFETCH_FACTOR * k + n_excluded
+        while len(todo) and fetch < n and fetch <= MAX_OVERFETCH:
+            reach, idx = engine.kneighbors(clamped[todo], fetch)
+            raw = np.asarray(features[idx.ravel()])
+            keep = in_ranges(raw, flt.ranges).reshape(idx.shape)
+            if n_excluded:
+                keep &= ~np.isin(index.artist_keys[idx], excluded)
+            X = feature_transform.transform(raw).reshape(*idx.shape, -1)
+            d = np.where(keep, ((X - Q[todo, None, :]) ** 2).sum(axis=2), np.inf)
+            top = np.argsort(d, axis=1, kind="stable")[:, :k]
+            d, idx = np.take_along_axis(d, top, axis=1), np.take_along_axis(idx, top, axis=1)
+            # Every unfetched row x in the box has |q - x|^2 >= gap + reach^2, so the k-th is final
+            done = d[:, -1] <= gap[todo] + reach[:, -1] ** 2
+            distances[todo[done]], indices[todo[done]] = np.sqrt(d[done]), idx[done]
+            todo = todo[~done]
+            fetch *= 4
+    if len(todo) == 0:
+        return distances, indices
+
+    rows = index.candidates(features, flt.ranges)
+    if rows is None:
+        rows = np.flatnonzero(~np.isin(index.artist_keys, excluded))
+    elif n_excluded:
+        rows = rows[~np.isin(index.artist_keys[rows], excluded)]
+    if len(rows) < k:
+        return _brute_force(Q, feature_transform, features, rows, k)
+    distances[todo], indices[todo] = _brute_force(Q[todo], feature_transform, features, rows, k)
+    return distances, indices
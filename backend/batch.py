@@ -0,0 +1,213 @@
+"""
+Batch recommendations for many seed sets (users, playlists) in one pass.
+
+A seed set is a dict:
+
+  {"id": "user-42", "track_ids": [...], "artist_ids": [...]}   IDs resolved like /auth-data
+  {"id": "playlist-7", "features": [[tempo, energy, ...], ...]} raw FEATURE_COLS rows (or dicts)
+
+with optional "exclude_track_ids" and "limit". Exact-matched seed tracks are
+always excluded from their own results.
+
+recommend_batch() groups seed sets into chunks, stacks every seed of a chunk
+into one matrix for a single kneighbors call, then splits the neighbours back
+per set for dedup and exclusion (recommender.select_rows). Exact-matched
+seeds take their neighbours from the dataset's precomputed neighbour table
+when it has one (neighbour_table.py). Chunks run on a
+thread pool with a bounded number in flight and results are yielded in input
+order, so callers can stream them (NDJSON or Parquet) without holding the
+whole batch in memory. Used by POST /recommendations/batch and batch_recommend.py.
+"""
+
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from lookup_store import FEATURE_COLS, MATCH_EXACT, MATCH_NONE, name_keys
+import recommender
+
+CHUNK_SETS = 256
+MAX_SEEDS_PER_SET = 200
+MAX_LIMIT = 100
+OUTPUT_COLS = ["seed_id", "rank", "track_name", "artist_name"] + recommender.STAT_COLS
+
+
+class SeedSetError(ValueError):
+    """A seed set is malformed; the message names the set."""
+
+
+def _feature_rows(rows, seed_id):
+    if rows is None:
+        rows = []
+    if not isinstance(rows, list) or not (all(isinstance(row, list) for row in rows)
+                                          or all(isinstance(row, dict) for row in rows)):
+        raise SeedSetError(f"seed set {seed_id!r}: features must be a list of rows (lists or objects)")
+    if rows and isinstance(rows[0], dict):
+        missing = [c for c in FEATURE_COLS if any(c not in row for row in rows)]
+        if missing:
+            raise SeedSetError(f"seed set {seed_id!r}: feature objects need every feature, missing {', '.join(missing)}")
+        rows = [[row[c] for c in FEATURE_COLS] for row in rows]
+    try:
+        X = np.asarray(rows, dtype=np.float64) if rows else np.empty((0, len(FEATURE_COLS)))
+    except (TypeError, ValueError):
+        X = None
+    if X is None or X.ndim != 2 or X.shape[1] != len(FEATURE_COLS):
+        raise SeedSetError(f"seed set {seed_id!r}: features must be rows of {len(FEATURE_COLS)} numbers")
+    return X[~np.isnan(X).any(axis=1)]
+
+
+def _id_list(item, field, seed_id):
+    """item[field] as a list of ID strings ([] when absent)."""
+    ids = item.get(field)
+    if ids is None:
+        return []
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        raise SeedSetError(f"seed set {seed_id!r}: {field} must be a list of strings")
+    return ids
+
+
+def parse_limit(value, default=recommender.REC_LIMIT):
+    """value as an int limit of at least 1, default when None; raises SeedSetError otherwise."""
+    if value is None:
+        value = default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise SeedSetError("limit must be an integer") from None
+    if limit < 1:
+        raise SeedSetError("limit must be at least 1")
+    return limit
+
+
+def _exclude_keys(lookup_store, track_ids):
+    if not track_ids:
+        return np.empty(0, dtype=np.uint64)
+    match, _, pos = lookup_store.resolve(track_ids, [""] * len(track_ids))
+    pos = pos[match == MATCH_EXACT]
+    return name_keys([lookup_store.track_names[int(p)] for p in pos],
+                     [lookup_store.track_artists[int(p)] for p in pos])
+
+
+def resolve_seed_set(item, lookup_store, default_limit=recommender.REC_LIMIT):
+    """(seed_id, float64 features, exclude name keys, limit, lookup-store positions) for one seed-set dict.
+
+    Positions are -1 for feature rows and artist-mean seeds.
+    """
+    if not isinstance(item, dict):
+        raise SeedSetError("each seed set must be an object")
+    seed_id = item.get("id")
+    try:
+        limit = min(parse_limit(item.get("limit"), default_limit), MAX_LIMIT)
+    except SeedSetError as e:
+        raise SeedSetError(f"seed set {seed_id!r}: {e}") from None
+    exclude_ids = _id_list(item, "exclude_track_ids", seed_id)
+    if "features" in item:
+        features = _feature_rows(item["features"], seed_id)[:MAX_SEEDS_PER_SET]
+        exclude = _exclude_keys(lookup_store, exclude_ids)
+        return seed_id, features, exclude, limit, np.full(len(features), -1, dtype=np.int64)
+    track_ids = _id_list(item, "track_ids", seed_id)[:MAX_SEEDS_PER_SET]
+    artist_ids = _id_list(item, "artist_ids", seed_id)[:len(track_ids)]
+    artist_ids += [""] * (len(track_ids) - len(artist_ids))
+    if not track_ids:
+        raise SeedSetError(f"seed set {seed_id!r}: needs track_ids or features")
+    match, features, pos = lookup_store.resolve(track_ids, artist_ids)
+    exact = pos[match == MATCH_EXACT]
+    exclude = np.concatenate([
+        name_keys([lookup_store.track_names[int(p)] for p in exact],
+                  [lookup_store.track_artists[int(p)] for p in exact]),
+        _exclude_keys(lookup_store, exclude_ids),
+    ])
+    matched = match != MATCH_NONE
+    return seed_id, features[matched], exclude, limit, np.where(match == MATCH_EXACT, pos, -1)[matched]
+
+
+def _run_chunk(chunk, dataset, k):
+    """[(seed_id, records)] for resolved seed sets, with one neighbour query for the whole chunk."""
+    sizes = [len(features) for _, features, _, _, _ in chunk]
+    results = [(seed_id, []) for seed_id, _, _, _, _ in chunk]
+    if sum(sizes):
+        Q = dataset.feature_transform.transform(np.concatenate([f for _, f, _, _, _ in chunk if len(f)]))
+        if dataset.neighbour_table is not None:
+            track_pos = np.concatenate([p for _, _, _, _, p in chunk])
+            indices = dataset.neighbour_table.kneighbors(dataset.knn_engine, Q, track_pos, k)
+        else:
+            _, indices = dataset.knn_engine.kneighbors(Q, k)
+        start = 0
+        for i, (seed_id, _, exclude, limit, _) in enumerate(chunk):
+            if sizes[i]:
+                rows = recommender.select_rows(dataset.knn_table, indices[start:start + sizes[i]], exclude, limit)
+                results[i] = (seed_id, recommender.records(dataset.knn_table, rows))
+                start += sizes[i]
+    return results
+
+
+def recommend_batch(seed_sets, dataset, k=recommender.NEIGHBOURS_PER_TRACK, chunk_sets=CHUNK_SETS, workers=1,
+                    default_limit=recommender.REC_LIMIT):
+    """Yield (seed_id, records) for each seed-set dict, in input order.
+
+    seed_sets may be any iterable (e.g. lines of a file); at most 2 * workers
+    chunks are resolved or queried at a time.
+    """
+    resolved = (resolve_seed_set(item, dataset.lookup_store, default_limit) for item in seed_sets)
+    return recommend_resolved(resolved, dataset, k, chunk_sets, workers)
+
+
+def recommend_resolved(resolved, dataset, k=recommender.NEIGHBOURS_PER_TRACK, chunk_sets=CHUNK_SETS, workers=1):
+    """recommend_batch() for seed sets already passed through resolve_seed_set()."""
+    def chunks():
+        chunk = []
+        for seed_set in resolved:
+            chunk.append(seed_set)
+            if len(chunk) >= chunk_sets:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    if workers <= 1:
+        for chunk in chunks():
+            yield from _run_chunk(chunk, dataset, k)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks():
+            pending.append(pool.submit(_run_chunk, chunk, dataset, k))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def ndjson_lines(results):
+    """One JSON line per seed set: {"id": ..., "recommended": [...]}."""
+    for seed_id, recs in results:
+        yield json.dumps({"id": seed_id, "recommended": recs}) + "\n"
+
+
+def write_parquet(results, path, rows_per_group=100_000):
+    """Stream results into a Parquet file, one row per recommendation (OUTPUT_COLS). Returns seed sets written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("seed_id", pa.string()), ("rank", pa.int32()), ("track_name", pa.string()), ("artist_name", pa.string()),
+        *[(c, pa.float64()) for c in recommender.STAT_COLS],
+    ])
+    columns = {c: [] for c in OUTPUT_COLS}
+    n_sets = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for seed_id, recs in results:
+            n_sets += 1
+            for rank, rec in enumerate(recs, 1):
+                columns["seed_id"].append(None if seed_id is None else str(seed_id))
+                columns["rank"].append(rank)
+                for c in OUTPUT_COLS[2:]:
+                    columns[c].append(rec[c])
+            if len(columns["rank"]) >= rows_per_group:
+                writer.write_table(pa.table(columns, schema=schema))
+                columns = {c: [] for c in OUTPUT_COLS}
+        if columns["rank"]:
+            writer.write_table(pa.table(columns, schema=schema))
+    return n_sets
@@ -0,0 +1,88 @@
+"""
+Offline batch recommendations, e.g. for every user overnight.
+Run from backend dir:
+  python batch_recommend.py seeds.ndjson --out recs.parquet
+  python batch_recommend.py seeds.ndjson --out recs.ndjson --workers 4 --limit 50
+  cat seeds.ndjson | python batch_recommend.py - --out -
+
+Input is NDJSON, one seed set per line (see batch.py), read lazily. Output
+is written as results are produced: NDJSON (one line per seed set) or
+Parquet (one row per recommendation), chosen by --format or the --out suffix.
+Uses the same dataset as the app (precomputed/ when current, else the CSV).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from batch import CHUNK_SETS, SeedSetError, ndjson_lines, recommend_batch, write_parquet
+from dataset import load_snapshot
+import recommender
+
+
+def _seed_sets(lines):
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise SeedSetError(f"line {n}: not valid JSON") from None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommendations for many seed sets")
+    parser.add_argument("seeds", help="NDJSON seed sets, or - for stdin")
+    parser.add_argument("--out", required=True, help="output path, or - for NDJSON on stdout")
+    parser.add_argument("--format", choices=["ndjson", "parquet"], help="default: from --out suffix")
+    parser.add_argument("--limit", type=int, default=recommender.REC_LIMIT, help="recommendations per set")
+    parser.add_argument("--k", type=int, default=recommender.NEIGHBOURS_PER_TRACK, help="neighbours per seed")
+    parser.add_argument("--chunk-sets", type=int, default=CHUNK_SETS, help="seed sets per neighbour query")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="chunks queried in parallel")
+    args = parser.parse_args()
+
+    if args.limit < 1:
+        parser.error("--limit must be at least 1")
+    fmt = args.format or ("parquet" if args.out.endswith(".parquet") else "ndjson")
+    if fmt == "parquet" and args.out == "-":
+        parser.error("parquet output needs a file path")
+
+    start = time.perf_counter()
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    dataset = load_snapshot(backend_dir)
+    print(f"Dataset {dataset.version} ready in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+
+    start = time.perf_counter()
+    source = sys.stdin if args.seeds == "-" else open(args.seeds)
+    try:
+        results = recommend_batch(
+            _seed_sets(source), dataset, k=args.k, chunk_sets=args.chunk_sets, workers=args.workers,
+            default_limit=args.limit,
+        )
+        if fmt == "parquet":
+            n_sets = write_parquet(results, args.out)
+        else:
+            out = sys.stdout if args.out == "-" else open(args.out, "w")
+            n_sets = 0
+            try:
+                for line in ndjson_lines(results):
+                    out.write(line)
+                    n_sets += 1
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+    except SeedSetError as e:
+        print(f"Invalid seed set: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    elapsed = time.perf_counter() - start
+    print(f"{n_sets} seed sets in {elapsed:.2f} s ({n_sets / max(elapsed, 1e-9):.0f}/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
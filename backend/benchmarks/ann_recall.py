@@ -0,0 +1,109 @@
+"""
+Recall-vs-latency report: IVF engine against the exact engine.
+
+Run from backend dir:
+  python benchmarks/ann_recall.py                    # uses precomputed/knn_features.npy if present
+  python benchmarks/ann_recall.py --synthetic 2000000
+  python benchmarks/ann_recall.py --json > ann.json
+
+Queries are drawn from the indexed points (a user's exact matches) and
+batched 50 at a time like one /auth-data request. Recall is recall@k of the
+IVF result set against the exact result set. Points are searched in the
+FeatureTransform space the app indexes (pass --raw for raw features).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann import ExactEngine, IVFEngine  # noqa: E402
+from feature_transform import FeatureTransform  # noqa: E402
+
+FEATURE_COLS = ["tempo", "energy", "valence", "danceability", "acousticness", "liveness"]
+
+
+def synthetic_features(n, seed=0):
+    """Feature matrix shaped like the dataset: tempo 60-200 BPM, the rest in 0-1."""
+    rng = np.random.default_rng(seed)
+    X = rng.beta(2, 2, size=(n, len(FEATURE_COLS))).astype(np.float32)
+    X[:, 0] = rng.normal(120, 28, n).clip(60, 200)
+    return X
+
+
+def load_features(args):
+    path = os.path.join(args.precomputed, "knn_features.npy")
+    if not args.synthetic and os.path.exists(path):
+        return np.load(path, mmap_mode="r"), path
+    n = args.synthetic or 200_000
+    return synthetic_features(n), f"synthetic ({n} rows)"
+
+
+def _time_queries(engine, batches, k, **kwargs):
+    start = time.perf_counter()
+    results = [engine.kneighbors(q, k, **kwargs)[1] for q in batches]
+    elapsed = time.perf_counter() - start
+    return np.vstack(results), elapsed * 1000 / len(batches)
+
+
+def run(X, n_queries, k, nprobes, n_lists=None, transform=None):
+    if transform is not None:
+        X = transform(X)
+    rng = np.random.default_rng(1)
+    Q = np.asarray(X[rng.choice(len(X), n_queries, replace=False)])
+    batches = np.array_split(Q, max(1, n_queries // 50))
+
+    t = time.perf_counter()
+    exact = ExactEngine.build(X)
+    exact_build = time.perf_counter() - t
+    truth, exact_ms = _time_queries(exact, batches, k)
+
+    t = time.perf_counter()
+    ivf = IVFEngine.build(X, n_lists=n_lists)
+    ivf_build = time.perf_counter() - t
+
+    rows = [{"engine": "exact", "nprobe": None, "recall": 1.0, "ms_per_request": exact_ms, "build_s": exact_build}]
+    for nprobe in nprobes:
+        found, ms = _time_queries(ivf, batches, k, nprobe=nprobe)
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+        rows.append({"engine": "ivf", "nprobe": nprobe, "recall": float(recall), "ms_per_request": ms, "build_s": ivf_build})
+    return {"n_points": int(len(X)), "n_lists": int(len(ivf.centroids)), "k": k, "n_queries": n_queries, "rows": rows}
+
+
+def print_report(source, report):
+    print(f"Source: {source}")
+    print(f"Points: {report['n_points']}  IVF lists: {report['n_lists']}  k={report['k']}  queries={report['n_queries']}")
+    print(f"{'engine':<8}{'nprobe':>8}{'recall@k':>10}{'ms/request':>12}{'build s':>10}")
+    for r in report["rows"]:
+        nprobe = "-" if r["nprobe"] is None else r["nprobe"]
+        print(f"{r['engine']:<8}{nprobe:>8}{r['recall']:>10.3f}{r['ms_per_request']:>12.2f}{r['build_s']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--precomputed", default="precomputed")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic rows instead of precomputed/")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64")
+    parser.add_argument("--raw", action="store_true", help="search raw features (no FeatureTransform)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+
+    X, source = load_features(args)
+    transform = None if args.raw else FeatureTransform.fit(X).transform
+    report = run(X, args.queries, args.k, [int(p) for p in args.nprobe.split(",")], args.n_lists, transform)
+    if args.json:
+        print(json.dumps({"source": source, **report}, indent=2))
+    else:
+        print_report(source, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Local stand-in for the two Spotify Web API endpoints the app calls.
+
+Run from backend dir:
+  python benchmarks/fake_spotify.py --port 9100 --latency-ms 80
+  SPOTIFY_API_URL=http://127.0.0.1:9100/v1/ python serve.py
+
+  GET /v1/me                 profile; the user ID is derived from the bearer token
+  GET /v1/me/top/tracks      ?limit=&time_range= ; tracks sampled from the dataset
+                             CSV so they match the lookup store
+
+Each access token is a user: the same token always gets the same profile and,
+per time range, the same top tracks. --latency-ms sleeps before every
+response to model Spotify round trips; --rate-limit-every N answers every Nth
+request with 429 and Retry-After to exercise spotify_client back-off.
+make_server() starts it in-process for other benchmarks.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_PATH = os.path.join(BACKEND_DIR, "spotify_tracks_cleaned_final.csv")
+
+
+def _spotify_id(uri):
+    return str(uri).rstrip("/").split("/")[-1].split(":")[-1]
+
+
+def catalog(csv_path=CSV_PATH, n_rows=20000):
+    """(track_id, name, artist_id, artist_name) rows to draw top tracks from."""
+    if os.path.exists(csv_path):
+        df = pd.read_csv(csv_path, usecols=["track_uri", "artist_uri", "track_name", "artist_name"], nrows=n_rows)
+        return [
+            (_spotify_id(t), name, _spotify_id(a), artist)
+            for t, a, name, artist in zip(df["track_uri"], df["artist_uri"], df["track_name"], df["artist_name"])
+        ]
+    return [(f"{i:022d}", f"Song {i}", f"{i % 500:022d}", f"Artist {i % 500}") for i in range(n_rows)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            n = server.requests
+        if server.latency:
+            time.sleep(server.latency)
+        if server.rate_limit_every and n % server.rate_limit_every == 0:
+            server.rate_limited += 1
+            return self._send(429, {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                              [("Retry-After", str(server.retry_after))])
+
+        token = self.headers.get("Authorization", "").partition(" ")[2]
+        if not token:
+            return self._send(401, {"error": {"status": 401, "message": "No token provided"}})
+        user_id = "fake-" + hashlib.blake2b(token.encode(), digest_size=6).hexdigest()
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        query = parse_qs(url.query)
+        if path == "/v1/me":
+            return self._send(200, {"id": user_id, "display_name": user_id, "email": f"{user_id}@example.com"})
+        if path == "/v1/me/top/tracks":
+            limit = min(int(query.get("limit", ["20"])[0]), 50)
+            time_range = query.get("time_range", ["medium_term"])[0]
+            seed = int.from_bytes(hashlib.blake2b(f"{token}:{time_range}".encode(), digest_size=4).digest(), "little")
+            rows = np.random.default_rng(seed).choice(len(server.catalog), limit, replace=False)
+            items = [
+                {"id": tid, "name": name, "artists": [{"id": aid, "name": artist}]}
+                for tid, name, aid, artist in (server.catalog[i] for i in rows)
+            ]
+            return self._send(200, {"items": items, "total": len(items), "limit": limit})
+        return self._send(404, {"error": {"status": 404, "message": "Not found"}})
+
+
+def make_server(port=0, latency_ms=0, rate_limit_every=0, retry_after=1, tracks=None):
+    """Start the fake API on a background thread. Returns the server; its base URL is server.api_url."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.rate_limited = 0
+    server.latency = latency_ms / 1000
+    server.rate_limit_every = rate_limit_every
+    server.retry_after = retry_after
+    server.catalog = tracks if tracks is not None else catalog()
+    server.api_url = f"http://127.0.0.1:{server.server_address[1]}/v1/"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with a 429")
+    args = parser.parse_args()
+    server = make_server(args.port, args.latency_ms, args.rate_limit_every, args.retry_after)
+    print(f"Fake Spotify API on {server.api_url} ({len(server.catalog)} tracks)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
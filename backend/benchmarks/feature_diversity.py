@@ -0,0 +1,106 @@
+"""
+Neighbour search cost and result diversity before/after the feature transform.
+
+Run from backend dir:
+  python benchmarks/feature_diversity.py                    # precomputed/knn_features.npy if present
+  python benchmarks/feature_diversity.py --synthetic 2000000
+  FEATURE_WEIGHTS="tempo=0.5" python benchmarks/feature_diversity.py --json
+
+"raw" is the old pipeline (euclidean on raw FEATURE_COLS); "standardized"
+applies FeatureTransform fitted on the same points. For each, per-request
+search time (50 queries, k=5) is reported for both engines, plus:
+  mean |query - neighbour| per column, in units of that column's std: before
+    the transform tempo is matched far more tightly than everything else;
+  diversity: mean pairwise distance between the 25 recommended rows of a
+    request, in standardized units (0 would mean identical recommendations).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann import ExactEngine, IVFEngine  # noqa: E402
+from benchmarks.ann_recall import FEATURE_COLS, load_features  # noqa: E402
+from feature_transform import FeatureTransform  # noqa: E402
+
+
+def _pairwise_mean(Z):
+    diff = Z[:, None, :] - Z[None, :, :]
+    d = np.sqrt((diff ** 2).sum(axis=-1))
+    n = len(Z)
+    return d.sum() / max(n * (n - 1), 1)
+
+
+def evaluate(X, space, n_requests, nprobe, seed=1):
+    """space: rows of X mapped into the search space (identity for raw)."""
+    rng = np.random.default_rng(seed)
+    requests = [rng.choice(len(X), 50, replace=False) for _ in range(n_requests)]
+    S = space(X)
+    unit = FeatureTransform.fit(X, weights=np.ones(len(FEATURE_COLS)))
+
+    exact = ExactEngine.build(S)
+    ivf = IVFEngine.build(S)
+    timings = {}
+    for name, engine, kwargs in (("exact", exact, {}), ("ivf", ivf, {"nprobe": nprobe})):
+        start = time.perf_counter()
+        results = [engine.kneighbors(S[r], 5, **kwargs)[1] for r in requests]
+        timings[name] = (time.perf_counter() - start) * 1000 / n_requests
+        if name == "exact":
+            truth = results
+        else:
+            recall = np.mean([
+                len(set(a) & set(b)) / 5 for f, t in zip(results, truth) for a, b in zip(f, t)
+            ])
+
+    gaps, diversity = [], []
+    for r, idx in zip(requests, truth):
+        gaps.append(np.abs(X[idx[:, 1:]] - X[r][:, None, :]).mean(axis=(0, 1)) / unit.std)
+        recs = list(dict.fromkeys(i for i in idx[:, 1:].ravel() if i not in set(r)))[:25]
+        diversity.append(_pairwise_mean(unit.transform(X[recs])))
+    return {
+        "exact_ms_per_request": timings["exact"],
+        "ivf_ms_per_request": timings["ivf"],
+        "ivf_recall": float(recall),
+        "neighbour_gap": dict(zip(FEATURE_COLS, np.mean(gaps, axis=0).round(4).tolist())),
+        "diversity": float(np.mean(diversity)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--precomputed", default="precomputed")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic rows instead of precomputed/")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--nprobe", type=int, default=4)
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+
+    X, source = load_features(args)
+    X = np.asarray(X, dtype=np.float64)
+    transform = FeatureTransform.fit(X)
+    report = {
+        "source": source,
+        "weights": dict(zip(FEATURE_COLS, transform.weights.tolist())),
+        "raw": evaluate(X, lambda A: A.astype(np.float32), args.requests, args.nprobe),
+        "standardized": evaluate(X, transform.transform, args.requests, args.nprobe),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Source: {source}  weights: {report['weights']}")
+    print(f"{'':<14}{'exact ms':>10}{'ivf ms':>9}{'ivf recall':>12}{'diversity':>11}   neighbour gap (std units)")
+    for name in ("raw", "standardized"):
+        r = report[name]
+        gap = " ".join(f"{c[:5]}={v:g}" for c, v in r["neighbour_gap"].items())
+        print(f"{name:<14}{r['exact_ms_per_request']:>10.2f}{r['ivf_ms_per_request']:>9.2f}"
+              f"{r['ivf_recall']:>12.3f}{r['diversity']:>11.3f}   {gap}")
+
+
+if __name__ == "__main__":
+    main()
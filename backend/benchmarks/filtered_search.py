@@ -0,0 +1,93 @@
+"""
+Filtered recommendations: post-filtering vs the attribute index.
+
+Run from backend dir:
+  python benchmarks/filtered_search.py --synthetic 2000000
+  python benchmarks/filtered_search.py --json
+
+For 50-track profiles and filters of decreasing selectivity, "post-filter"
+runs the unfiltered recommendation and drops rows outside the filter (the
+only option before attribute_index.py); "indexed" passes the SearchFilter to
+recommender.recommend. Reported are recommendations returned (of 25) and ms
+per request, both with the default REC_MODE.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import recommender  # noqa: E402
+from ann import ExactEngine  # noqa: E402
+from attribute_index import AttributeIndex, SearchFilter  # noqa: E402
+from benchmarks.ann_recall import FEATURE_COLS  # noqa: E402
+from benchmarks.recommend_request import synthetic_knn_frame  # noqa: E402
+from feature_transform import FeatureTransform  # noqa: E402
+from lookup_store import KnnTable  # noqa: E402
+
+FILTERS = {
+    "tempo 120-140": {"tempo": (120, 140)},
+    "energy >= 0.8": {"energy": (0.8, None)},
+    "tempo 160+, valence >= 0.7": {"tempo": (160, None), "valence": (0.7, None)},
+    "tempo 120-122, energy >= 0.9": {"tempo": (120, 122), "energy": (0.9, None)},
+}
+
+
+def _passes(rec, ranges):
+    return all((lo is None or rec[c] >= lo) and (hi is None or rec[c] <= hi) for c, (lo, hi) in ranges.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=500_000)
+    parser.add_argument("--profiles", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+
+    df_knn = synthetic_knn_frame(args.synthetic)
+    transform = FeatureTransform.fit(df_knn[FEATURE_COLS].values)
+    engine = ExactEngine.build(transform.transform(df_knn[FEATURE_COLS].values))
+    table = KnnTable.from_frame(df_knn)
+    start = time.perf_counter()
+    index = AttributeIndex.build(table.features, df_knn["artist_name"].values)
+    build_s = time.perf_counter() - start
+
+    profiles = []
+    for seed in range(args.profiles):
+        profile = df_knn.sample(50, random_state=seed)
+        profiles.append(recommender.MatchedTracks(
+            profile[FEATURE_COLS].to_numpy(), profile["track_name"], profile["artist_name"]))
+
+    report = {"n_points": args.synthetic, "profiles": args.profiles, "index_build_s": build_s, "filters": {}}
+    for label, ranges in FILTERS.items():
+        flt = SearchFilter(ranges)
+        matching = len(index.candidates(table.features, flt.ranges))
+        start = time.perf_counter()
+        post = [sum(_passes(r, ranges) for r in recommender.recommend(m, table, engine, transform)) for m in profiles]
+        post_ms = (time.perf_counter() - start) * 1000 / len(profiles)
+        start = time.perf_counter()
+        indexed = [len(recommender.recommend(m, table, engine, transform, filters=flt, attribute_index=index))
+                   for m in profiles]
+        indexed_ms = (time.perf_counter() - start) * 1000 / len(profiles)
+        report["filters"][label] = {
+            "selectivity": matching / args.synthetic,
+            "post_filter_recs": float(np.mean(post)), "post_filter_ms": post_ms,
+            "indexed_recs": float(np.mean(indexed)), "indexed_ms": indexed_ms,
+        }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Points: {report['n_points']}  profiles: {report['profiles']}  index build {build_s:.2f} s")
+    print(f"  {'filter':30s} {'match %':>8s} {'post recs':>9s} {'post ms':>8s} {'idx recs':>9s} {'idx ms':>7s}")
+    for label, r in report["filters"].items():
+        print(f"  {label:30s} {r['selectivity'] * 100:8.3f} {r['post_filter_recs']:9.1f} {r['post_filter_ms']:8.2f}"
+              f" {r['indexed_recs']:9.1f} {r['indexed_ms']:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
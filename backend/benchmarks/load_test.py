@@ -0,0 +1,366 @@
+"""
+End-to-end benchmark: synthetic dataset -> precompute -> startup -> /auth-data load.
+
+Run from backend dir:
+  python benchmarks/load_test.py                                  # 10k, 1M and 5M rows
+  python benchmarks/load_test.py --rows 10000 --concurrency 1 8 32 --out before.json
+  python benchmarks/load_test.py --compare before.json after.json
+
+For each --rows size a dataset in the spotify_tracks_cleaned_final.csv schema
+is generated (cached under --work-dir, default $TMPDIR/sonus_load_test) next
+to a copy of the backend modules, so the checked-out code is what gets
+measured. Each phase runs in its own process so peak RSS is per phase:
+
+  precompute  python precompute_dataset.py --full (wall time, peak RSS incl. workers)
+  startup     import app + load_dataset() from precomputed/ (and from CSV with --csv-startup)
+  load        app served by a threaded werkzeug server, driven by --concurrency
+              client threads for --requests requests each level; Spotify is
+              benchmarks/fake_spotify.py (--spotify-latency-ms), the result
+              cache and rate limiter are off unless --cache
+
+Results are one JSON document (stdout or --out) tagged with the git commit;
+--compare prints the ratio of every metric between two such files.
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.ann_recall import FEATURE_COLS, synthetic_features  # noqa: E402
+from benchmarks.fake_spotify import catalog, make_server  # noqa: E402
+
+CSV_NAME = "spotify_tracks_cleaned_final.csv"
+GEN_CHUNK = 500_000
+BASE62 = np.array(list("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"))
+SERVER_ENV = {
+    "FLASK_ENV": "production",
+    "FLASK_SECRET_KEY": "load-test",
+    "SPOTIFY_CLIENT_ID": "load-test",
+    "SPOTIFY_CLIENT_SECRET": "load-test",
+    "SPOTIFY_REDIRECT_URI": "http://127.0.0.1/callback",
+    "SQLITE_PATH": "users.db",
+}
+
+
+def _ids(index, salt):
+    """Deterministic 22-char base62 IDs for integer indexes."""
+    x = (np.asarray(index, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(salt)) & np.uint64(2 ** 63 - 1)
+    digits = np.empty((len(x), 22), dtype=np.int64)
+    for d in range(22):
+        digits[:, d] = (x % np.uint64(62)).astype(np.int64)
+        x = x // np.uint64(62) + np.uint64(d * 7919)
+    return ["".join(row) for row in BASE62[digits]]
+
+
+def generate_csv(path, n_rows, seed=0):
+    """Synthetic dataset: ~n/20 artists, 5% repeated tracks, a third of URIs as open.spotify.com URLs."""
+    rng = np.random.default_rng(seed)
+    n_artists = max(n_rows // 20, 1)
+    with open(path, "w") as f:
+        for start in range(0, n_rows, GEN_CHUNK):
+            n = min(GEN_CHUNK, n_rows - start)
+            rows = np.arange(start, start + n)
+            track = np.where(rng.random(n) < 0.05, rng.integers(0, n_rows, n), rows)
+            artist = rng.integers(0, n_artists, n)
+            X = synthetic_features(n, seed + start)
+            track_ids = _ids(track, 1)
+            df = pd.DataFrame({
+                "track_uri": [f"spotify:track:{t}" if i % 3 else f"https://open.spotify.com/track/{t}"
+                              for i, t in zip(rows, track_ids)],
+                "artist_uri": [f"spotify:artist:{a}" for a in _ids(artist, 2)],
+                "track_name": [f"Song {t}" for t in track],
+                "artist_name": [f"Artist {a}" for a in artist],
+                **{c: X[:, j].round(3) for j, c in enumerate(FEATURE_COLS)},
+                "popularity": rng.integers(0, 100, n),
+            })
+            df.to_csv(f, index=False, header=start == 0)
+
+
+def prepare_workspace(work_dir, n_rows):
+    """work_dir/<rows>/ with the current backend modules and a cached synthetic CSV."""
+    workspace = os.path.join(work_dir, str(n_rows))
+    os.makedirs(workspace, exist_ok=True)
+    for name in os.listdir(BACKEND_DIR):
+        if name.endswith(".py"):
+            shutil.copy(os.path.join(BACKEND_DIR, name), workspace)
+    csv_path = os.path.join(workspace, CSV_NAME)
+    if not os.path.exists(csv_path):
+        print(f"Generating {n_rows} rows...", file=sys.stderr)
+        generate_csv(csv_path + ".tmp", n_rows)
+        os.replace(csv_path + ".tmp", csv_path)
+    for stale in ("precomputed", "dataset_cache.parquet", "dataset_cache.pkl", "users.db"):
+        path = os.path.join(workspace, stale)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    return workspace
+
+
+def _peak_rss_mb(children=False):
+    """Peak RSS of this process, or of its largest child. ru_maxrss survives exec on Linux,
+    so this process's own peak comes from VmHWM where available."""
+    if children:
+        return round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    return _vm_hwm_mb(os.getpid()) or round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _run_phase(workspace, *args):
+    """Run a phase of this script in a fresh process inside workspace; returns its JSON result."""
+    env = {**os.environ, **SERVER_ENV}
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--phase", *args],
+        cwd=workspace, env=env, check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def phase_precompute(workers):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "precompute_dataset.py", "--full", "--workers", str(workers)],
+                   check=True, stdout=subprocess.DEVNULL)
+    return {"seconds": round(time.perf_counter() - start, 3), "peak_rss_mb": _peak_rss_mb(children=True)}
+
+
+def phase_startup(from_csv):
+    if from_csv:
+        shutil.rmtree("precomputed", ignore_errors=True)
+    start = time.perf_counter()
+    sys.path.insert(0, os.getcwd())
+    import app
+
+    imported = time.perf_counter()
+    app.load_dataset()
+    done = time.perf_counter()
+    return {
+        "seconds": round(done - start, 3),
+        "import_seconds": round(imported - start, 3),
+        "load_seconds": round(done - imported, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def phase_serve(port, api_url, cache):
+    os.environ["SPOTIFY_API_URL"] = api_url
+    os.environ["RATE_LIMIT_BACKEND"] = "none"
+    if not cache:
+        os.environ["RESULT_CACHE_BACKEND"] = "none"
+    sys.path.insert(0, os.getcwd())
+    from werkzeug.serving import make_server as make_wsgi_server
+
+    import app
+
+    app.load_dataset()
+    server = make_wsgi_server("127.0.0.1", port, app.app, threaded=True)
+    print("ready", flush=True)
+    server.serve_forever()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _session_cookie(secret, token):
+    """Signed Flask session cookie holding a non-expiring token for the fake API."""
+    from flask import Flask
+    from flask.sessions import SecureCookieSessionInterface
+
+    app = Flask("load_test")
+    app.secret_key = secret
+    serializer = SecureCookieSessionInterface().get_signing_serializer(app)
+    return serializer.dumps({"token_info": {
+        "access_token": token, "refresh_token": "x", "expires_at": int(time.time()) + 86400,
+    }})
+
+
+def _vm_hwm_mb(pid):
+    """Peak RSS of another process (Linux /proc), or None."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def drive(base_url, concurrency, n_requests, n_users):
+    """n_requests GET /auth-data from `concurrency` threads, cycling over n_users. Returns latency stats."""
+    import requests
+
+    cookies = [_session_cookie(SERVER_ENV["FLASK_SECRET_KEY"], f"user-{u}") for u in range(n_users)]
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    counter = iter(range(n_requests))
+
+    def worker():
+        http = requests.Session()
+        own = []
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                r = http.get(f"{base_url}/auth-data", cookies={"session": cookies[i % n_users]}, timeout=60)
+                ok = r.status_code == 200
+            except requests.RequestException:
+                ok = False
+            own.append(time.perf_counter() - start)
+            if not ok:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors[0],
+        "throughput_rps": round(n_requests / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+    }
+
+
+def run_load(workspace, args):
+    spotify = make_server(latency_ms=args.spotify_latency_ms, tracks=catalog(os.path.join(workspace, CSV_NAME)))
+    port = _free_port()
+    cmd = [sys.executable, os.path.abspath(__file__), "--phase", "serve", str(port), spotify.api_url]
+    if args.cache:
+        cmd.append("--cache")
+    server = subprocess.Popen(cmd, cwd=workspace, env={**os.environ, **SERVER_ENV},
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in server.stdout:
+            if line.strip() == "ready":
+                break
+        else:
+            raise RuntimeError("server failed to start")
+        base_url = f"http://127.0.0.1:{port}"
+        drive(base_url, 1, min(20, args.requests), args.users)  # warm-up
+        levels = [drive(base_url, c, args.requests, args.users) for c in args.concurrency]
+        return {"levels": levels, "server_peak_rss_mb": _vm_hwm_mb(server.pid),
+                "spotify_latency_ms": args.spotify_latency_ms, "cache": args.cache}
+    finally:
+        server.terminate()
+        server.wait()
+        spotify.shutdown()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(doc):
+    """{"<rows>.<phase>.<metric>": value} for every numeric metric in a results document."""
+    flat = {}
+    for size in doc["sizes"]:
+        prefix = str(size["rows"])
+        for phase in ("precompute", "startup", "startup_csv"):
+            for key, value in (size.get(phase) or {}).items():
+                flat[f"{prefix}.{phase}.{key}"] = value
+        load = size.get("load") or {}
+        if load.get("server_peak_rss_mb") is not None:
+            flat[f"{prefix}.load.server_peak_rss_mb"] = load["server_peak_rss_mb"]
+        for level in load.get("levels", []):
+            for key in ("throughput_rps", "p50_ms", "p99_ms", "errors"):
+                flat[f"{prefix}.load.c{level['concurrency']}.{key}"] = level[key]
+    return flat
+
+
+def compare(path_a, path_b):
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+    flat_a, flat_b = _flatten(a), _flatten(b)
+    print(f"{'metric':<40}{a.get('commit') or 'a':>12}{b.get('commit') or 'b':>12}{'b/a':>8}")
+    for key in flat_a:
+        if key in flat_b:
+            va, vb = flat_a[key], flat_b[key]
+            ratio = f"{vb / va:.2f}" if va else "-"
+            print(f"{key:<40}{va:>12}{vb:>12}{ratio:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end backend benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000, 5_000_000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=400, help="requests per concurrency level")
+    parser.add_argument("--users", type=int, default=200, help="distinct simulated Spotify users")
+    parser.add_argument("--spotify-latency-ms", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="precompute workers")
+    parser.add_argument("--cache", action="store_true", help="keep the /auth-data result cache on")
+    parser.add_argument("--csv-startup", action="store_true", help="also time startup without precomputed/")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "sonus_load_test"))
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("A", "B"), help="compare two result files")
+    parser.add_argument("--phase", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        name, rest = args.phase[0], args.phase[1:]
+        if name == "precompute":
+            print(json.dumps(phase_precompute(int(rest[0]))))
+        elif name == "startup":
+            print(json.dumps(phase_startup(rest == ["csv"])))
+        elif name == "serve":
+            phase_serve(int(rest[0]), rest[1], args.cache)
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = {"commit": _git_commit(), "cpu_count": os.cpu_count(), "sizes": []}
+    for n_rows in args.rows:
+        workspace = prepare_workspace(args.work_dir, n_rows)
+        size = {"rows": n_rows}
+        print(f"[{n_rows}] precompute...", file=sys.stderr)
+        size["precompute"] = _run_phase(workspace, "precompute", str(args.workers))
+        print(f"[{n_rows}] startup...", file=sys.stderr)
+        size["startup"] = _run_phase(workspace, "startup")
+        print(f"[{n_rows}] load...", file=sys.stderr)
+        size["load"] = run_load(workspace, args)
+        if args.csv_startup:
+            print(f"[{n_rows}] startup from CSV...", file=sys.stderr)
+            size["startup_csv"] = _run_phase(workspace, "startup", "csv")
+        results["sizes"].append(size)
+
+    doc = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(doc + "\n")
+    else:
+        print(doc)
+
+
+if __name__ == "__main__":
+    main()
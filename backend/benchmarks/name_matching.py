@@ -0,0 +1,115 @@
+"""
+Name matching of ID misses: build cost, index size, match rate and latency.
+
+Run from backend dir:
+  python benchmarks/name_matching.py --synthetic 2000000
+  python benchmarks/name_matching.py --json
+
+A synthetic catalogue gets random two-to-four word titles, 20 tracks per
+artist on average. Queries are catalogue tracks whose names were altered the
+way re-releases alter them ("remaster", "feat", "case", "typo") plus tracks
+that are not in the catalogue ("absent"). Each request looks up 50 misses in
+one NameIndex.lookup call, once with NAME_MATCH=on and once with fuzzy
+(the index is built with its trigram postings).
+"Correct" counts matches that land on the original song.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from name_index import NameIndex  # noqa: E402
+
+WORDS = np.array([
+    "love", "night", "heart", "fire", "dream", "rain", "gold", "summer", "blue", "light", "dance", "river",
+    "wild", "home", "road", "ghost", "echo", "sky", "star", "stone", "city", "ocean", "shadow", "smoke",
+    "honey", "glass", "silver", "storm", "velvet", "paper", "neon", "desert", "moon", "sugar", "thunder",
+    "angel", "diamond", "electric", "midnight", "golden", "broken", "sweet", "lonely", "lost", "young",
+])
+
+
+def _typo(name, rng):
+    i = int(rng.integers(len(name)))
+    return name[:i] + "x" + name[i + 1:]
+
+
+VARIANTS = {
+    "remaster": lambda name, rng: f"{name} - {int(rng.integers(1990, 2024))} Remaster",
+    "feat": lambda name, rng: f"{name} (feat. Guest {int(rng.integers(100))})",
+    "case": lambda name, rng: name.upper() + "!",
+    "typo": _typo,
+}
+
+
+def synthetic_catalogue(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(2, 5, n)
+    words = rng.choice(WORDS, (n, 4))
+    tracks = np.array([" ".join(w[:k]).title() + f" {i % 97}" for i, (w, k) in enumerate(zip(words, lengths))],
+                      dtype=object)
+    artists = np.array([f"Artist {a}" for a in rng.integers(0, max(1, n // 20), n)], dtype=object)
+    return tracks, artists
+
+
+def run(index, queries, fuzzy, batch=50):
+    names, artist_names = queries
+    start = time.perf_counter()
+    found = [index.lookup(names[i:i + batch], artist_names[i:i + batch], fuzzy=fuzzy)[0]
+             for i in range(0, len(names), batch)]
+    ms = (time.perf_counter() - start) * 1000 / len(found)
+    return np.concatenate(found), ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=1000, help="queries per variant")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+
+    tracks, artists = synthetic_catalogue(args.synthetic)
+    start = time.perf_counter()
+    index = NameIndex.build(tracks, artists, fuzzy=True)
+    build_s = time.perf_counter() - start
+    arrays = (index.keys, index.rows, index.gram_keys, index.gram_rows, index.gram_counts)
+    index_mb = sum(a.nbytes for a in arrays) / 2 ** 20
+
+    rng = np.random.default_rng(1)
+    report = {"n_tracks": args.synthetic, "build_s": build_s, "index_mb": index_mb, "variants": {}}
+    for variant, alter in [*VARIANTS.items(), ("absent", None)]:
+        rows = rng.choice(args.synthetic, args.queries, replace=False)
+        if alter is None:
+            names = np.array([f"Unreleased {i}" for i in range(args.queries)], dtype=object)
+            expected = np.full(args.queries, -1)
+        else:
+            names = np.array([alter(tracks[r], rng) for r in rows], dtype=object)
+            expected = rows
+        queries = (names, artists[rows])
+        row = {}
+        for mode, fuzzy in (("on", False), ("fuzzy", True)):
+            found, ms = run(index, queries, fuzzy)
+            # A match on another row with the same normalized name is the same song.
+            same = (found >= 0) & (expected >= 0)
+            same[same] = index.lookup(tracks[found[same]], artists[found[same]])[0] == \
+                index.lookup(tracks[expected[same]], artists[expected[same]])[0]
+            row[mode] = {"matched": float(np.mean(found >= 0)), "correct": float(np.mean(same)), "ms": ms}
+        report["variants"][variant] = row
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Tracks: {report['n_tracks']}  build {build_s:.2f} s  index {index_mb:.1f} MB")
+    print(f"  {'variant':10s} {'mode':6s} {'matched':>8s} {'correct':>8s} {'ms/50':>7s}")
+    for variant, row in report["variants"].items():
+        for mode, r in row.items():
+            print(f"  {variant:10s} {mode:6s} {r['matched']:8.3f} {r['correct']:8.3f} {r['ms']:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Precomputed neighbour lists: offline build cost and per-request time saved.
+
+Run from backend dir:
+  python benchmarks/neighbour_table.py --synthetic 2000000
+  python benchmarks/neighbour_table.py --json
+
+The table holds k=5 exact neighbours of every row, searched in CHUNK_ROWS
+chunks over --workers processes (what precompute_dataset.py does). Requests
+are 50-track per_track profiles of dataset tracks, answered by live search
+on the exact engine and from the table; "mixed" has 10 of the 50 tracks
+unmapped (artist means), which still go to the engine. Recommendations are
+checked to be identical. "batch" is one 256-set chunk of 20 seeds each
+through batch.recommend_batch.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch  # noqa: E402
+import recommender  # noqa: E402
+from ann import ExactEngine  # noqa: E402
+from benchmarks.ann_recall import FEATURE_COLS  # noqa: E402
+from benchmarks.recommend_request import synthetic_knn_frame  # noqa: E402
+from feature_transform import FeatureTransform  # noqa: E402
+from lookup_store import KnnTable, LookupStore  # noqa: E402
+from neighbour_table import NeighbourTable  # noqa: E402
+
+
+def _ms(fn, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=500_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--profiles", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+
+    df_knn = synthetic_knn_frame(args.synthetic)
+    transform = FeatureTransform.fit(df_knn[FEATURE_COLS].values)
+    X = transform.transform(df_knn[FEATURE_COLS].values)
+    engine = ExactEngine.build(X)
+    knn_table = KnnTable.from_frame(df_knn)
+
+    start = time.perf_counter()
+    neighbours = NeighbourTable.build(X, 5, args.workers, engine)
+    build_s = time.perf_counter() - start
+    # Synthetic tracks are the KNN rows themselves, so track position == KNN row.
+    table = NeighbourTable(neighbours, np.arange(len(X), dtype=np.int32))
+
+    rng = np.random.default_rng(1)
+    report = {"n_points": args.synthetic, "workers": args.workers, "build_s": build_s,
+              "table_mb": neighbours.nbytes / 2 ** 20, "requests": {}}
+    for name, unmapped in (("all mapped", 0), ("mixed", 10)):
+        profiles = []
+        for _ in range(args.profiles):
+            rows = rng.choice(len(X), 50, replace=False)
+            pos = rows.copy()
+            pos[rng.choice(50, unmapped, replace=False)] = -1
+            profiles.append(recommender.MatchedTracks(
+                df_knn[FEATURE_COLS].to_numpy()[rows], df_knn["track_name"].values[rows],
+                df_knn["artist_name"].values[rows], pos))
+
+        def run(neighbour_table):
+            return [recommender.recommend(m, knn_table, engine, transform, mode="per_track",
+                                          neighbour_table=neighbour_table) for m in profiles]
+
+        assert run(table) == run(None)
+        report["requests"][name] = {"live_ms": _ms(lambda: run(None), 1) / len(profiles),
+                                    "table_ms": _ms(lambda: run(table), 1) / len(profiles)}
+
+    df_knn = df_knn.assign(track_id=[f"{i:022d}" for i in range(len(df_knn))],
+                           artist_id=[f"{i % 1000:022d}" for i in range(len(df_knn))])
+    store = LookupStore.from_frames(df_knn, df_knn.groupby("artist_id", as_index=False)[FEATURE_COLS].mean())
+    seeds = [{"id": i, "track_ids": [f"{r:022d}" for r in rng.choice(len(X), 20)]} for i in range(batch.CHUNK_SETS)]
+    dataset = SimpleNamespace(lookup_store=store, knn_table=knn_table, knn_engine=engine,
+                              feature_transform=transform, neighbour_table=None)
+    live_ms = _ms(lambda: list(batch.recommend_batch(seeds, dataset)), 1)
+    live = list(batch.recommend_batch(seeds, dataset))
+    dataset.neighbour_table = table
+    assert list(batch.recommend_batch(seeds, dataset)) == live
+    report["requests"]["batch"] = {"live_ms": live_ms,
+                                   "table_ms": _ms(lambda: list(batch.recommend_batch(seeds, dataset)), 1)}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Points: {report['n_points']}  build {build_s:.1f} s on {args.workers} worker(s),"
+          f" table {report['table_mb']:.1f} MB")
+    print(f"  {'request':12s} {'live ms':>8s} {'table ms':>9s}")
+    for name, r in report["requests"].items():
+        print(f"  {name:12s} {r['live_ms']:8.2f} {r['table_ms']:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
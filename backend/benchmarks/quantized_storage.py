@@ -0,0 +1,176 @@
+"""
+Memory and recall of quantized feature storage against the float64 baseline.
+
+Run from backend dir:
+  python benchmarks/quantized_storage.py --synthetic 2000000
+  python benchmarks/quantized_storage.py --json
+
+Engines: "exact" (sklearn KD-tree, float64 copy of the points) is the
+baseline and the recall reference; "ivf" scans float32 lists; "ivf_sq8" scans
+uint8 codes and re-ranks rerank x k candidates on transformed knn_features
+rows. Queries are indexed points, 50 per request as in ann_recall.py. "index
+MB" is the size of the arrays the engine holds (for ivf_sq8 not the
+knn_features it re-ranks on, which the app maps anyway); "RSS MB" is how much
+a fresh process that memory-maps the saved engine has paged in after the
+queries.
+
+Lookup store: track features rounded to 3 decimals (as Spotify reports them)
+stored as float32 vs uint16 fixed-point codes. "changed" counts values whose
+rounded stats form (whole BPM, 2 decimals) differs from the float32 store.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann import ENGINES, ExactEngine, IVFEngine, IVFSQ8Engine  # noqa: E402
+from benchmarks.ann_recall import FEATURE_COLS, synthetic_features  # noqa: E402
+from feature_transform import FeatureTransform  # noqa: E402
+from lookup_store import LookupStore  # noqa: E402
+
+RERANKS = (1, 2, 4, 8)
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def _mapped_rss(directory, name, batches, k, kwargs, out):
+    """Child process: map the saved engine, run the queries, report the RSS they added."""
+    before = _rss_mb()
+    engine = ENGINES[name].load(directory, **kwargs)
+    for q in batches:
+        engine.kneighbors(q, k)
+    out.put(_rss_mb() - before)
+
+
+def mapped_rss(directory, name, batches, k, kwargs=None):
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    proc = ctx.Process(target=_mapped_rss, args=(directory, name, batches, k, kwargs or {}, out))
+    proc.start()
+    rss = out.get()
+    proc.join()
+    return rss
+
+
+def index_mb(engine):
+    if isinstance(engine, ExactEngine):
+        arrays = [np.asarray(a) for a in engine.model._tree.get_arrays() if isinstance(a, np.ndarray)]
+    elif isinstance(engine, IVFEngine):
+        arrays = [engine.centroids, engine.offsets, engine.ids, engine.vectors]
+    else:
+        arrays = [engine.codes, engine.ivf.centroids, engine.ivf.offsets, engine.ivf.ids]
+    return sum(a.nbytes for a in arrays) / 2 ** 20
+
+
+def timed(engine, batches, k, **kwargs):
+    engine.kneighbors(batches[0], k, **kwargs)
+    start = time.perf_counter()
+    indices = np.vstack([engine.kneighbors(q, k, **kwargs)[1] for q in batches])
+    return indices, (time.perf_counter() - start) * 1000 / len(batches)
+
+
+def recall(found, reference):
+    k = reference.shape[1]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(found, reference)]))
+
+
+def engine_report(raw, transform, n_queries, k, nprobe):
+    X = transform.transform(raw)
+    rng = np.random.default_rng(1)
+    batches = np.array_split(X[rng.choice(len(X), n_queries, replace=False)], max(1, n_queries // 50))
+    exact = ExactEngine.build(X)
+    ivf = IVFEngine.build(X, nprobe=nprobe)
+    sq8 = IVFSQ8Engine.derive(ivf, X)
+    reference, exact_ms = timed(exact, batches, k)
+    rows = {"exact": {"recall": 1.0, "ms": exact_ms, "index_mb": index_mb(exact)}}
+    found, ms = timed(ivf, batches, k)
+    rows["ivf"] = {"recall": recall(found, reference), "ms": ms, "index_mb": index_mb(ivf)}
+    for rerank in RERANKS:
+        sq8.rerank = rerank
+        found, ms = timed(sq8, batches, k)
+        rows[f"ivf_sq8 rerank {rerank}"] = {"recall": recall(found, reference), "ms": ms, "index_mb": index_mb(sq8)}
+    with tempfile.TemporaryDirectory() as directory:
+        for engine in (exact, ivf, sq8):
+            engine.save(directory)
+        np.save(os.path.join(directory, "knn_features.npy"), raw)
+        transform.save(directory)
+        rows["exact"]["rss_mb"] = mapped_rss(directory, "exact", batches, k)
+        rows["ivf"]["rss_mb"] = mapped_rss(directory, "ivf", batches, k)
+        for rerank in RERANKS:
+            rows[f"ivf_sq8 rerank {rerank}"]["rss_mb"] = mapped_rss(
+                directory, "ivf_sq8", batches, k, {"rerank": rerank})
+    return rows
+
+
+def lookup_report(n):
+    raw = np.round(synthetic_features(n, seed=2).astype(np.float64), 3)
+    df = pd.DataFrame(raw, columns=FEATURE_COLS)
+    df.insert(0, "track_id", [f"{i:022d}" for i in range(n)])
+    df["track_name"] = "t"
+    df["artist_name"] = "a"
+    artists = pd.DataFrame({"artist_id": ["0" * 22]})
+    for c in FEATURE_COLS:
+        artists[c] = df[c].mean()
+    plain = LookupStore.from_frames(df, artists, quantize=False)
+    quantized = LookupStore.from_frames(df, artists, quantize=True)
+    rows = np.arange(n)
+    a = np.asarray(plain.track_features[rows], dtype=np.float64)
+    b = np.asarray(quantized.track_features[rows], dtype=np.float64)
+    shown = [0] + [FEATURE_COLS.index(c) for c in ("energy", "valence", "danceability")]
+    decimals = [0, 2, 2, 2]
+    changed = sum(int((np.round(a[:, c], d) != np.round(b[:, c], d)).sum()) for c, d in zip(shown, decimals))
+    return {
+        "rows": n,
+        "float32_mb": plain.track_features.nbytes / 2 ** 20,
+        "uint16_mb": quantized.track_features.nbytes / 2 ** 20,
+        "max_abs_error": dict(zip(FEATURE_COLS, np.abs(a - b).max(axis=0).tolist())),
+        "stats_values_changed": changed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+
+    raw = synthetic_features(args.synthetic)
+    report = {
+        "n_points": args.synthetic,
+        "nprobe": args.nprobe,
+        "engines": engine_report(raw, FeatureTransform.fit(raw), args.queries, args.k, args.nprobe),
+        "lookup": lookup_report(args.synthetic),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Points: {report['n_points']}  k={args.k}  nprobe={args.nprobe}")
+    print(f"  {'engine':18s} {'recall':>7s} {'ms/req':>7s} {'index MB':>9s} {'RSS MB':>7s}")
+    for name, r in report["engines"].items():
+        print(f"  {name:18s} {r['recall']:7.3f} {r['ms']:7.2f} {r['index_mb']:9.1f} {r['rss_mb']:7.1f}")
+    lookup = report["lookup"]
+    print(f"Lookup features: float32 {lookup['float32_mb']:.1f} MB, uint16 {lookup['uint16_mb']:.1f} MB,"
+          f" {lookup['stats_values_changed']} rounded stats values changed")
+    print("  max abs error: " + ", ".join(f"{c} {e:.2g}" for c, e in lookup["max_abs_error"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Neighbour lookups, latency and taste coverage of the recommendation query modes.
+
+Run from backend dir:
+  python benchmarks/query_modes.py --synthetic 2000000
+  python benchmarks/query_modes.py --json
+
+Each synthetic profile has 50 tracks from three tastes of 30, 15 and 5 tracks
+(neighbourhoods of three random catalogue tracks), in rank order with the
+tastes interleaved. "lookups" is query rows x k per request. "coverage" is
+the mean distance (scaled space) from a profile track to its nearest
+recommendation, lower is better; "minority recs" is how many of the 25
+recommendations sit closest to the 5-track taste.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import recommender  # noqa: E402
+from ann import ExactEngine  # noqa: E402
+from benchmarks.ann_recall import FEATURE_COLS  # noqa: E402
+from benchmarks.recommend_request import synthetic_knn_frame  # noqa: E402
+from feature_transform import FeatureTransform  # noqa: E402
+from lookup_store import KnnTable  # noqa: E402
+
+TASTE_SIZES = (30, 15, 5)
+
+
+class CountingEngine:
+    def __init__(self, engine):
+        self.engine = engine
+        self.lookups = 0
+
+    def __len__(self):
+        return len(self.engine)
+
+    def kneighbors(self, Q, k):
+        self.lookups += len(Q) * k
+        return self.engine.kneighbors(Q, k)
+
+
+def synthetic_profiles(df_knn, X, engine, n_profiles, seed=0):
+    """(MatchedTracks, taste label per track) for profiles mixing three tastes."""
+    rng = np.random.default_rng(seed)
+    profiles = []
+    for _ in range(n_profiles):
+        anchors = rng.choice(len(X), len(TASTE_SIZES), replace=False)
+        _, near = engine.kneighbors(X[anchors], 200)
+        rows, labels = [], []
+        for taste, size in enumerate(TASTE_SIZES):
+            rows.extend(rng.choice(near[taste], size, replace=False))
+            labels.extend([taste] * size)
+        order = rng.permutation(len(rows))
+        rows, labels = np.array(rows)[order], np.array(labels)[order]
+        profile = df_knn.iloc[rows]
+        matched = recommender.MatchedTracks(
+            profile[FEATURE_COLS].to_numpy(), profile["track_name"], profile["artist_name"])
+        profiles.append((matched, labels))
+    return profiles
+
+
+def evaluate(mode, profiles, table, engine, transform):
+    counting = CountingEngine(engine)
+    coverage, minority = [], []
+    for matched, labels in profiles:
+        recs = recommender.recommend(matched, table, counting, transform, mode=mode)
+        Q = transform.transform(matched.features)
+        R = transform.transform(_rec_features(table, recs))
+        d = np.sqrt(((Q[:, None, :] - R[None, :, :]) ** 2).sum(axis=2))
+        coverage.append(d.min(axis=1).mean())
+        nearest_taste = labels[d.argmin(axis=0)]
+        minority.append(int((nearest_taste == len(TASTE_SIZES) - 1).sum()))
+    start = time.perf_counter()
+    for matched, _ in profiles:
+        recommender.recommend(matched, table, engine, transform, mode=mode)
+    elapsed = time.perf_counter() - start
+    return {
+        "lookups": counting.lookups / len(profiles),
+        "ms": elapsed * 1000 / len(profiles),
+        "coverage": float(np.mean(coverage)),
+        "minority_recs": float(np.mean(minority)),
+    }
+
+
+def _rec_features(table, recs):
+    keys = recommender.name_keys([r["track_name"] for r in recs], [r["artist_name"] for r in recs])
+    rows = np.flatnonzero(np.isin(table.keys, keys))
+    return np.asarray(table.features[rows], dtype=np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=500_000)
+    parser.add_argument("--profiles", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+
+    df_knn = synthetic_knn_frame(args.synthetic)
+    transform = FeatureTransform.fit(df_knn[FEATURE_COLS].values)
+    X = transform.transform(df_knn[FEATURE_COLS].values)
+    engine = ExactEngine.build(X)
+    table = KnnTable.from_frame(df_knn)
+    profiles = synthetic_profiles(df_knn, X, engine, args.profiles)
+
+    report = {
+        "n_points": args.synthetic,
+        "profiles": args.profiles,
+        "modes": {mode: evaluate(mode, profiles, table, engine, transform) for mode in recommender.REC_MODES},
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Points: {report['n_points']}  profiles: {report['profiles']} x {sum(TASTE_SIZES)} tracks")
+    print(f"  {'mode':10s} {'lookups':>8s} {'ms':>7s} {'coverage':>9s} {'minority recs':>14s}")
+    for mode, r in report["modes"].items():
+        print(f"  {mode:10s} {r['lookups']:8.0f} {r['ms']:7.2f} {r['coverage']:9.3f} {r['minority_recs']:14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Rate-limit check overhead and correctness under many concurrent threads.
+
+Run from backend dir:
+  python benchmarks/rate_limit_overhead.py
+  python benchmarks/rate_limit_overhead.py --threads 1 8 64 --calls 20000 --json
+
+"legacy" is the previous decorator body (unsynchronized (start, count) per IP
+in a defaultdict). "bucket/1" is TokenBucketLimiter with a single lock,
+"bucket/64" the default 64 lock stripes, "window" SlidingWindowLimiter over
+an in-process dict standing in for redis (no network). Each thread checks
+--calls requests spread over --ips client addresses; reported are ns per
+check (wall clock / total checks), lost counts (legacy only: concurrent
+increments overwritten) and tracked keys after a 1M-distinct-IP sweep.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import SlidingWindowLimiter, TokenBucketLimiter  # noqa: E402
+
+WINDOW = 60
+
+
+class LegacyLimiter:
+    def __init__(self, max_requests):
+        self.max_requests = max_requests
+        self.store = defaultdict(lambda: (0, 0))
+
+    def allow(self, ip):
+        now = time.time()
+        start, count = self.store[ip]
+        if now - start > WINDOW:
+            self.store[ip] = (now, 1)
+        else:
+            count += 1
+            if count > self.max_requests:
+                return False, 0.0
+            self.store[ip] = (start, count)
+        return True, 0.0
+
+    def __len__(self):
+        return len(self.store)
+
+
+class DictStore:
+    """incr/expire/get over a dict, standing in for redis."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def incr(self, key):
+        with self._lock:
+            self._data[key] = self._data.get(key, 0) + 1
+            return self._data[key]
+
+    def expire(self, key, seconds):
+        pass
+
+    def get(self, key):
+        return self._data.get(key)
+
+
+def make(name, max_requests):
+    if name == "legacy":
+        return LegacyLimiter(max_requests)
+    if name == "bucket/1":
+        return TokenBucketLimiter(max_requests, WINDOW, stripes=1)
+    if name == "bucket/64":
+        return TokenBucketLimiter(max_requests, WINDOW)
+    return SlidingWindowLimiter(DictStore(), max_requests, WINDOW)
+
+
+def hammer(limiter, n_threads, calls, ips):
+    barrier = threading.Barrier(n_threads + 1)
+
+    def worker(t):
+        keys = [f"10.{t % 256}.{(i // 256) % 256}.{i % 256}" for i in range(ips)]
+        barrier.wait()
+        for i in range(calls):
+            limiter.allow(keys[i % ips])
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(n_threads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return (time.perf_counter() - start) / (n_threads * calls) * 1e9
+
+
+def lost_updates(n_threads, calls):
+    """Same key from every thread with an unreachable limit: the count should equal all calls."""
+    limiter = LegacyLimiter(10 ** 9)
+    threads = [threading.Thread(target=lambda: [limiter.allow("1.2.3.4") for _ in range(calls)])
+               for _ in range(n_threads)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often, as a loaded server does
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    return n_threads * calls - limiter.store["1.2.3.4"][1]
+
+
+def tracked_keys(name, n_ips):
+    limiter = make(name, 120)
+    for i in range(n_ips):
+        limiter.allow(f"ip-{i}")
+    return len(limiter) if hasattr(limiter, "__len__") else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate limiter overhead under concurrency")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--calls", type=int, default=20000, help="checks per thread")
+    parser.add_argument("--ips", type=int, default=1000, help="client addresses per thread")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    names = ["legacy", "bucket/1", "bucket/64", "window"]
+    rows = []
+    for n_threads in args.threads:
+        for name in names:
+            ns = hammer(make(name, 10 ** 9), n_threads, args.calls, args.ips)
+            rows.append({"limiter": name, "threads": n_threads, "ns_per_check": round(ns)})
+    lost = lost_updates(8, args.calls)
+    keys = {name: tracked_keys(name, 1_000_000) for name in ("legacy", "bucket/64")}
+
+    if args.json:
+        print(json.dumps({"overhead": rows, "legacy_lost_updates": lost, "tracked_keys_after_1M_ips": keys}, indent=2))
+        return
+    print(f"{'limiter':<10}{'threads':>8}{'ns/check':>10}")
+    for r in rows:
+        print(f"{r['limiter']:<10}{r['threads']:>8}{r['ns_per_check']:>10}")
+    print(f"\nlegacy lost updates (8 threads x {args.calls} on one IP): {lost}")
+    print(f"tracked keys after 1M distinct IPs: {keys}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Per-request CPU time of stats + recommendation assembly for a 50-track profile.
+
+Run from backend dir:
+  python benchmarks/recommend_request.py --synthetic 2000000
+  python benchmarks/recommend_request.py --json
+
+"legacy" is the previous path (matched DataFrame copied for rounding, one
+df_knn.iloc[idx] Series per neighbour, tuple-set dedup). "vectorized" is
+recommender.stats + recommender.recommend. Both share the same engine, so the
+difference is assembly cost; the neighbour query is timed separately.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import recommender  # noqa: E402
+from ann import ExactEngine  # noqa: E402
+from benchmarks.ann_recall import FEATURE_COLS, synthetic_features  # noqa: E402
+from feature_transform import FeatureTransform  # noqa: E402
+from lookup_store import KnnTable  # noqa: E402
+
+
+def synthetic_knn_frame(n, seed=0):
+    X = synthetic_features(n, seed)
+    df = pd.DataFrame(X.astype(np.float64), columns=FEATURE_COLS)
+    df.insert(0, "track_name", [f"Song {i}" for i in range(n)])
+    df.insert(1, "artist_name", [f"Artist {i % max(n // 20, 1)}" for i in range(n)])
+    return df
+
+
+def legacy_stats(matched):
+    matched = matched.copy()
+    matched["tempo"] = matched["tempo"].round()
+    for c in ("energy", "valence", "danceability"):
+        matched[c] = matched[c].round(2)
+    return {
+        "tempo_avg": round(float(matched["tempo"].mean()), 1),
+        "tracks": matched[["track_name", "artist_name", "tempo", "energy", "valence", "danceability"]].to_dict(
+            orient="records"),
+    }
+
+
+def legacy_recommend(matched, df_knn, engine, transform):
+    _, indices = engine.kneighbors(transform.transform(matched[FEATURE_COLS].values), 5)
+    recommended, seen = [], set()
+    matched_set = set(zip(matched["track_name"], matched["artist_name"]))
+    for idx_list in indices:
+        for idx in idx_list:
+            row = df_knn.iloc[idx]
+            key = (row["track_name"], row["artist_name"])
+            if key not in seen and key not in matched_set:
+                seen.add(key)
+                recommended.append({
+                    "track_name": row["track_name"], "artist_name": row["artist_name"],
+                    "tempo": float(row["tempo"]), "energy": float(row["energy"]),
+                    "valence": float(row["valence"]), "danceability": float(row["danceability"]),
+                })
+                if len(recommended) >= 25:
+                    break
+        if len(recommended) >= 25:
+            break
+    return recommended[:25]
+
+
+def _cpu_ms(fn, repeats):
+    fn()
+    start = time.process_time()
+    for _ in range(repeats):
+        fn()
+    return (time.process_time() - start) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=500_000)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    args = parser.parse_args()
+
+    df_knn = synthetic_knn_frame(args.synthetic)
+    transform = FeatureTransform.fit(df_knn[FEATURE_COLS].values)
+    engine = ExactEngine.build(transform.transform(df_knn[FEATURE_COLS].values))
+    table = KnnTable.from_frame(df_knn)
+
+    profile = df_knn.sample(50, random_state=1)
+    matched_df = profile.reset_index(drop=True)
+    matched = recommender.MatchedTracks(
+        matched_df[FEATURE_COLS].to_numpy(), matched_df["track_name"], matched_df["artist_name"]
+    )
+    new_recs = recommender.recommend(matched, table, engine, transform, mode="per_track")
+    assert [r["track_name"] for r in new_recs] == \
+        [r["track_name"] for r in legacy_recommend(matched_df, df_knn, engine, transform)]
+
+    q = transform.transform(matched.features)
+    report = {
+        "n_points": args.synthetic,
+        "profile_tracks": len(matched),
+        "neighbour_query_ms": _cpu_ms(lambda: engine.kneighbors(q, 5), args.repeats),
+        "legacy_ms": _cpu_ms(
+            lambda: (legacy_stats(matched_df), legacy_recommend(matched_df, df_knn, engine, transform)), args.repeats),
+        "vectorized_ms": _cpu_ms(
+            lambda: (recommender.stats(matched, 50),
+                     recommender.recommend(matched, table, engine, transform, mode="per_track")),
+            args.repeats),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Points: {report['n_points']}  profile: {report['profile_tracks']} tracks  (CPU ms per request)")
+    print(f"  neighbour query only  {report['neighbour_query_ms']:8.2f}")
+    print(f"  legacy stats + recs   {report['legacy_ms']:8.2f}")
+    print(f"  vectorized            {report['vectorized_ms']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Immutable dataset snapshots for app.py.
+
+A Dataset bundles everything a request reads (lookup store, KNN table,
+feature transform, engine, attribute and name indexes, neighbour table)
+under one version string. app.py keeps the live snapshot in a single global
+and replaces it with one assignment, so a request that grabbed the old
+snapshot finishes on it while new requests see the new one. Nothing else holds a snapshot, so
+once the last in-flight request drops it the arrays (and their mmaps) are
+released.
+
+Snapshots come from precomputed/ when it is current (see artifacts.py),
+otherwise from the CSV. The CSV path loads in two stages (load_stages):
+a lookup-only snapshot (matching and stats) as soon as the lookup store is
+built, then the full one once the neighbour index is. A lookup-only
+snapshot has knn_ready False and no KNN components or name index. Only
+precomputed/ has a neighbour table (neighbour_table.py); CSV snapshots
+search every query live.
+"""
+
+import os
+import pickle
+import time
+
+import pandas as pd
+
+from ann import build_engine
+from artifacts import MANIFEST, has_mmap_artifacts, load_mmap_artifacts, read_manifest
+from attribute_index import AttributeIndex
+from feature_transform import FeatureTransform
+from lookup_store import FEATURE_COLS, KnnTable, LookupStore
+from metrics import load_step
+from name_index import NameIndex
+
+CSV_NAME = "spotify_tracks_cleaned_final.csv"
+LOAD_COLS = ["track_uri", "artist_uri", "track_name", "artist_name"] + FEATURE_COLS
+DATASET_CACHE = "dataset_cache.pkl"
+PRECOMPUTED_DIR = "precomputed"
+
+
+class Dataset:
+    """One loaded dataset version; treat as read-only once built."""
+
+    def __init__(self, version, lookup_store, knn_table, knn_engine, feature_transform, build_id=None,
+                 attribute_index=None, name_index=None, neighbour_table=None):
+        self.version = version
+        self.lookup_store = lookup_store
+        self.knn_table = knn_table
+        self.knn_engine = knn_engine
+        self.feature_transform = feature_transform
+        self.build_id = build_id
+        self.attribute_index = attribute_index
+        self.name_index = name_index
+        self.neighbour_table = neighbour_table
+        self.loaded_at = time.time()
+
+    @property
+    def knn_ready(self):
+        """False for a lookup-only snapshot (recommendations not available yet)."""
+        return self.knn_engine is not None
+
+
+def _extract_ids_vectorized(series, prefix="track"):
+    """Vectorized Spotify ID extraction from URIs/URLs."""
+    s = series.astype(str).str.strip()
+    is_url = s.str.contains("spotify.com", na=False)
+    ids = pd.Series(index=s.index, dtype=object)
+    ids[is_url] = s[is_url].str.rstrip("/").str.split("/").str[-1]
+    ids[~is_url] = s[~is_url].str.replace(f"spotify:{prefix}:", "", regex=False)
+    ids = ids.where(ids.str.len() == 22)
+    return ids
+
+
+def _read_csv(csv_path):
+    df = pd.read_csv(csv_path, usecols=LOAD_COLS)
+    df.dropna(subset=FEATURE_COLS, inplace=True)
+    df["tempo"] = pd.to_numeric(df["tempo"], errors="coerce")
+    df["track_id"] = _extract_ids_vectorized(df["track_uri"], "track")
+    df["artist_id"] = _extract_ids_vectorized(df["artist_uri"], "artist")
+    df = df[df["track_id"].notna() & df["artist_id"].notna()]
+    return df
+
+
+def precomputed_build_id(backend_dir):
+    """Build ID of the artifact set in precomputed/, or None if there is no complete set."""
+    precomputed_dir = os.path.join(backend_dir, PRECOMPUTED_DIR)
+    try:
+        manifest = read_manifest(precomputed_dir)
+        return manifest.get("build_id") or str(int(os.path.getmtime(os.path.join(precomputed_dir, MANIFEST))))
+    except (OSError, ValueError):
+        return None
+
+
+def precomputed_stamp(backend_dir):
+    """(build ID, source CSV mtime) of precomputed/, or None; the mtime changes when a rerun finds the CSV
+    content unchanged, which can make a build that was stale against the CSV current again."""
+    build_id = precomputed_build_id(backend_dir)
+    if build_id is None:
+        return None
+    try:
+        return build_id, read_manifest(os.path.join(backend_dir, PRECOMPUTED_DIR)).get("source_mtime")
+    except (OSError, ValueError):
+        return None
+
+
+def load_from_precomputed(backend_dir):
+    """Map full-dataset artifacts from precomputed/ (from running precompute_dataset.py), or None."""
+    precomputed_dir = os.path.join(backend_dir, PRECOMPUTED_DIR)
+    if not has_mmap_artifacts(precomputed_dir):
+        return None
+    csv_path = os.path.join(backend_dir, CSV_NAME)
+    try:
+        source_mtime = float(read_manifest(precomputed_dir).get("source_mtime") or 0)
+    except Exception:
+        source_mtime = 0
+    if os.path.exists(csv_path) and os.path.getmtime(csv_path) > source_mtime:
+        return None
+    build_id = precomputed_build_id(backend_dir)
+    try:
+        with load_step("map_precomputed"):
+            (lookup_store, knn_table, feature_transform, knn_engine, attribute_index, name_index,
+             neighbour_table) = load_mmap_artifacts(precomputed_dir)
+    except Exception as e:
+        print("Precomputed artifacts unreadable, falling back to CSV:", str(e)[:200])
+        return None
+    print(f"Mapped precomputed: {lookup_store.n_tracks} tracks, {lookup_store.n_artists} artists, KNN ({knn_engine.name}) ready.")
+    version = f"pre-{build_id}-{knn_engine.name}"
+    return Dataset(version, lookup_store, knn_table, knn_engine, feature_transform, build_id, attribute_index,
+                   name_index, neighbour_table)
+
+
+def _csv_stages(backend_dir):
+    """Yield a lookup-only snapshot, then the full one, built from the CSV (via the parquet/pickle cache)."""
+    csv_path = os.path.join(backend_dir, CSV_NAME)
+    cache_path = os.path.join(backend_dir, DATASET_CACHE)
+    parquet_path = cache_path.replace(".pkl", ".parquet")
+    with load_step("read_rows"):
+        try:
+            if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+                df_full = pd.read_parquet(parquet_path)
+            elif os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+                with open(cache_path, "rb") as f:
+                    df_full = pickle.load(f)
+            else:
+                df_full = _read_csv(csv_path)
+                try:
+                    df_full.to_parquet(parquet_path, index=False)
+                except Exception:
+                    with open(cache_path, "wb") as f:
+                        pickle.dump(df_full, f, protocol=4)
+        except Exception:
+            df_full = _read_csv(csv_path)
+
+    with load_step("lookup_store"):
+        df_artist = df_full.groupby("artist_id", as_index=False)[FEATURE_COLS].mean()
+        df_artist["artist_id"] = df_artist["artist_id"].astype(str)
+
+        df_first = df_full.drop_duplicates(subset=["track_id"], keep="first").copy()
+        df_first["acousticness"] = df_first["acousticness"].fillna(0.5)
+        df_first["liveness"] = df_first["liveness"].fillna(0.2)
+        df_first["track_id"] = df_first["track_id"].astype(str)
+        lookup_store = LookupStore.from_frames(df_first, df_artist)
+        del df_artist, df_first
+    csv_mtime = int(os.path.getmtime(csv_path)) if os.path.exists(csv_path) else 0
+    print(f"Lookup ready: {lookup_store.n_tracks} tracks, {lookup_store.n_artists} artists; building KNN...")
+    yield Dataset(f"csv-{csv_mtime}-lookup", lookup_store, None, None, None)
+
+    with load_step("knn_rows"):
+        df_knn = df_full.drop_duplicates(subset=["track_name", "artist_name"]).dropna(
+            subset=FEATURE_COLS
+        )
+        knn_table = KnnTable.from_frame(df_knn)
+    with load_step("feature_transform"):
+        feature_transform = FeatureTransform.fit(df_knn[FEATURE_COLS].values)
+        X = feature_transform.transform(df_knn[FEATURE_COLS].values)
+    with load_step("engine_build"):
+        knn_engine = build_engine(X)
+    with load_step("attribute_index"):
+        attribute_index = AttributeIndex.build(knn_table.features, df_knn["artist_name"].values)
+    with load_step("name_index"):
+        n_tracks = range(lookup_store.n_tracks)
+        name_index = NameIndex.build(lookup_store.track_names.take(n_tracks), lookup_store.track_artists.take(n_tracks))
+    print(f"Loaded {len(df_full)} tracks, {lookup_store.n_artists} artists, KNN ({knn_engine.name}) ready.")
+    version = f"csv-{csv_mtime}-{knn_engine.name}"
+    yield Dataset(version, lookup_store, knn_table, knn_engine, feature_transform, attribute_index=attribute_index,
+                  name_index=name_index)
+
+
+def load_from_csv(backend_dir):
+    """Build a full snapshot from the CSV (via the parquet/pickle cache when it is fresh)."""
+    for dataset in _csv_stages(backend_dir):
+        pass
+    return dataset
+
+
+def load_stages(backend_dir):
+    """Yield usable snapshots as they are built: precomputed/ in one step, the CSV lookup-first."""
+    dataset = load_from_precomputed(backend_dir)
+    if dataset is not None:
+        yield dataset
+        return
+    yield from _csv_stages(backend_dir)
+
+
+def load_snapshot(backend_dir):
+    """Newest available snapshot: precomputed/ if it is current, else the CSV."""
+    return load_from_precomputed(backend_dir) or load_from_csv(backend_dir)
@@ -0,0 +1,235 @@
+"""
+Database access for app.py: a thread-safe connection pool and a write-behind
+queue for user upserts.
+
+ConnectionPool hands each thread its own connection (never a shared cursor),
+pings connections that sat idle before reuse and drops any connection whose
+use raised, so a restarted MySQL is reconnected transparently.
+
+UserWriter takes upserts off the request path: callback() enqueues and
+returns immediately, and one background thread drains the queue in batches
+of INSERT ... ON DUPLICATE KEY UPDATE (last write per user wins within a
+batch). Failed batches are retried with back-off, then dropped and counted.
+
+Env:
+  MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE
+  MYSQL_POOL_SIZE        connections per process (default 5)
+  SQLITE_PATH            use a local SQLite file instead of MySQL (dev/tests)
+  USER_UPSERT_BATCH      rows per batch (default 100)
+  USER_UPSERT_FLUSH_MS   longest wait before a partial batch is written (default 500)
+  USER_UPSERT_MAX_QUEUE  pending upserts kept before new ones are dropped (default 10000)
+"""
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_POOL_SIZE = 5
+PING_AFTER = 30
+DEFAULT_BATCH = 100
+DEFAULT_FLUSH_MS = 500
+DEFAULT_MAX_QUEUE = 10000
+RETRY_DELAYS = (0.5, 2, 5)
+
+MYSQL_UPSERT = (
+    "INSERT INTO users (spotify_id, name, email) VALUES (%s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE name = VALUES(name), email = VALUES(email)"
+)
+SQLITE_UPSERT = (
+    "INSERT INTO users (spotify_id, name, email) VALUES (?, ?, ?) "
+    "ON CONFLICT(spotify_id) DO UPDATE SET name = excluded.name, email = excluded.email"
+)
+SQLITE_SCHEMA = "CREATE TABLE IF NOT EXISTS users (spotify_id VARCHAR(255) PRIMARY KEY, name VARCHAR(255), email VARCHAR(255))"
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool timeout."""
+
+
+class ConnectionPool:
+    """Bounded pool of DB-API connections from connect(); connections are opened on demand."""
+
+    def __init__(self, connect, size=DEFAULT_POOL_SIZE, timeout=5, ping_after=PING_AFTER):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            if hasattr(conn, "ping"):
+                conn.ping(reconnect=False)
+            else:
+                conn.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _checkout(self):
+        while True:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - idle_since < self.ping_after or self._healthy(conn):
+                return conn
+            self._close(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commit is up to the caller, errors discard the connection."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no DB connection free after {self.timeout}s")
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except Exception:
+            if conn is not None:
+                self._close(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put((conn, time.monotonic()))
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(conn)
+
+
+class UserWriter:
+    """Write-behind queue of (spotify_id, name, email) upserts, flushed in batches."""
+
+    def __init__(self, pool, upsert_sql=MYSQL_UPSERT, batch_size=DEFAULT_BATCH,
+                 flush_interval=DEFAULT_FLUSH_MS / 1000, max_queue=DEFAULT_MAX_QUEUE):
+        self.pool = pool
+        self.upsert_sql = upsert_sql
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._counts = {"queued": 0, "written": 0, "batches": 0, "dropped": 0, "errors": 0}
+        threading.Thread(target=self._run, daemon=True, name="user-writer").start()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def submit(self, spotify_id, name, email):
+        """Queue one upsert; never blocks. Returns False if the queue is full."""
+        try:
+            self._queue.put_nowait((spotify_id, name, email))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("queued")
+        return True
+
+    def _next_batch(self):
+        rows = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows):
+        latest = {row[0]: row for row in rows}
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.executemany(self.upsert_sql, list(latest.values()))
+                conn.commit()
+            finally:
+                cur.close()
+
+    def _run(self):
+        while True:
+            rows = self._next_batch()
+            for delay in RETRY_DELAYS + (None,):
+                try:
+                    self._write(rows)
+                    self._count("written", len(rows))
+                    self._count("batches")
+                    break
+                except Exception as e:
+                    self._count("errors")
+                    if delay is None:
+                        print(f"User upsert batch of {len(rows)} dropped:", str(e)[:200])
+                        self._count("dropped", len(rows))
+                        break
+                    time.sleep(delay)
+            for _ in rows:
+                self._queue.task_done()
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been written or dropped."""
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def stats(self):
+        with self._lock:
+            return {"pending": self._queue.qsize(), **self._counts}
+
+
+def _mysql_connect():
+    import mysql.connector
+
+    return mysql.connector.connect(
+        host=os.getenv("MYSQL_HOST"),
+        user=os.getenv("MYSQL_USER"),
+        password=os.getenv("MYSQL_PASSWORD"),
+        database=os.getenv("MYSQL_DATABASE"),
+    )
+
+
+def make_user_writer():
+    """UserWriter over a pool configured from env (SQLite when SQLITE_PATH is set)."""
+    size = int(os.getenv("MYSQL_POOL_SIZE", DEFAULT_POOL_SIZE))
+    sqlite_path = os.getenv("SQLITE_PATH")
+    if sqlite_path:
+        import sqlite3
+
+        def connect():
+            conn = sqlite3.connect(sqlite_path, timeout=10, check_same_thread=False)
+            conn.execute(SQLITE_SCHEMA)
+            return conn
+
+        pool, upsert_sql = ConnectionPool(connect, size), SQLITE_UPSERT
+    else:
+        pool, upsert_sql = ConnectionPool(_mysql_connect, size), MYSQL_UPSERT
+    return UserWriter(
+        pool,
+        upsert_sql,
+        batch_size=int(os.getenv("USER_UPSERT_BATCH", DEFAULT_BATCH)),
+        flush_interval=int(os.getenv("USER_UPSERT_FLUSH_MS", DEFAULT_FLUSH_MS)) / 1000,
+        max_queue=int(os.getenv("USER_UPSERT_MAX_QUEUE", DEFAULT_MAX_QUEUE)),
+    )
@@ -0,0 +1,93 @@
+"""
+Feature transform shared by precompute_dataset.py and load_dataset.
+
+Raw FEATURE_COLS mix tempo (~60-200 BPM) with 0-1 features, so euclidean
+neighbours were effectively tempo matches. Every column is standardized and
+then multiplied by a weight:  x' = (x - mean) / std * weight.
+
+The fitted transform is stored with the artifacts (feature_transform.json)
+and applied to index vectors and query vectors alike. Weights come from
+FEATURE_WEIGHTS at build time, e.g. "tempo=0.5,energy=1.5"; unlisted
+columns weigh 1.0. Artifacts built before this file existed load with the
+identity transform, which matches how their index was built.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from lookup_store import FEATURE_COLS
+
+ARTIFACT = "feature_transform.json"
+
+
+def configured_weights():
+    """Column weights from FEATURE_WEIGHTS ("col=weight,..."); unknown columns are ignored."""
+    weights = dict.fromkeys(FEATURE_COLS, 1.0)
+    for part in (os.getenv("FEATURE_WEIGHTS") or "").split(","):
+        col, _, value = part.partition("=")
+        col = col.strip()
+        if col in weights and value.strip():
+            weights[col] = float(value)
+    return [weights[c] for c in FEATURE_COLS]
+
+
+class FeatureTransform:
+    """Per-column standardization plus weights."""
+
+    def __init__(self, mean, std, weights):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self._scale = self.weights / self.std
+
+    @classmethod
+    def identity(cls):
+        n = len(FEATURE_COLS)
+        return cls(np.zeros(n), np.ones(n), np.ones(n))
+
+    @classmethod
+    def fit(cls, X, weights=None):
+        X = np.asarray(X, dtype=np.float64)
+        std = X.std(axis=0)
+        std[~(std > 0)] = 1.0
+        return cls(X.mean(axis=0), std, configured_weights() if weights is None else weights)
+
+    def transform(self, X):
+        """Raw feature rows -> index space (float32)."""
+        return ((np.asarray(X, dtype=np.float64) - self.mean) * self._scale).astype(np.float32)
+
+    def save(self, directory):
+        with open(os.path.join(directory, ARTIFACT), "w") as f:
+            json.dump({
+                "feature_cols": FEATURE_COLS,
+                "mean": self.mean.tolist(),
+                "std": self.std.tolist(),
+                "weights": self.weights.tolist(),
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, directory):
+        path = os.path.join(directory, ARTIFACT)
+        if not os.path.exists(path):
+            return cls.identity()
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("feature_cols") != FEATURE_COLS:
+            raise ValueError("feature_transform.json was built for different FEATURE_COLS")
+        return cls(data["mean"], data["std"], data["weights"])
+
+
+class TransformedRows:
+    """Raw feature rows seen through a transform: rows[ids] is transform.transform(features[ids])."""
+
+    def __init__(self, features, transform):
+        self.features = features
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.features)
+
+    def __getitem__(self, rows):
+        return self.transform.transform(self.features[rows])
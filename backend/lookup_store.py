@@ -0,0 +1,290 @@
+"""
+Columnar track/artist lookup store.
+
+Replaces the per-row dicts (track_by_id, artist_features_by_id) with
+fixed-width 22-byte ID keys, float32 feature columns and a sorted index that
+is searched with one vectorized np.searchsorted per batch. The same store is
+built in memory from DataFrames (CSV path) or memory-mapped from precomputed/.
+
+  LOOKUP_QUANTIZE  "off" (default) or "on": keep track and artist features as
+                   uint16 fixed-point codes (LOOKUP_STEPS, see quantize.py),
+                   half the bytes of float32; read when the store is built
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from quantize import QuantizedFeatures, ScalarQuantizer
+
+FEATURE_COLS = ["tempo", "energy", "valence", "danceability", "acousticness", "liveness"]
+LOOKUP_QUANTIZE = os.getenv("LOOKUP_QUANTIZE", "off").lower() == "on"
+# Decimal step per column: tempo to 0.005 BPM (0-320 BPM fits uint16), 0-1 features to 4 decimals
+# (Spotify reports 3).
+LOOKUP_STEPS = {"tempo": 0.005}
+DEFAULT_LOOKUP_STEP = 0.0001
+LOOKUP_QUANTIZER = "lookup_quantizer.json"
+ID_DTYPE = "S22"
+ID_LEN = 22
+
+MATCH_NONE = 0
+MATCH_EXACT = 1
+MATCH_ARTIST = 2
+MATCH_NAME = 3
+MATCH_NEAR = 4
+MATCH_TYPES = {MATCH_NONE: "unmatched", MATCH_EXACT: "exact", MATCH_ARTIST: "artist", MATCH_NAME: "name",
+               MATCH_NEAR: "near"}
+
+
+def to_float64(values):
+    """float32 array -> float64 via the shortest float32 repr, so 0.73 stays 0.73 in JSON."""
+    values = np.asarray(values, dtype=np.float32)
+    return values.astype(str).astype(np.float64)
+
+
+class StringTable:
+    """Offset-encoded UTF-8 strings: value i is blob[offsets[i]:offsets[i + 1]]."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def take(self, positions):
+        return [self[int(i)] for i in positions]
+
+    @classmethod
+    def from_strings(cls, values):
+        encoded = [str(v).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(offsets, blob)
+
+    def save(self, directory, name):
+        np.save(os.path.join(directory, f"{name}.offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, f"{name}.blob.npy"), self.blob)
+
+    @classmethod
+    def load(cls, directory, name, mmap_mode="r"):
+        return cls(
+            np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, f"{name}.blob.npy"), mmap_mode=mmap_mode),
+        )
+
+
+def name_keys(track_names, artist_names):
+    """Stable uint64 key per (track_name, artist_name) pair, used for dedup and exclusion."""
+    track_names = list(track_names)
+    return np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(f"{t}\x1f{a}".encode("utf-8"), digest_size=8).digest(), "little")
+            for t, a in zip(track_names, artist_names)
+        ),
+        dtype=np.uint64,
+        count=len(track_names),
+    )
+
+
+def _quantized(track_features, artist_features):
+    """Both feature tables as QuantizedFeatures sharing one fixed-point quantizer (unchanged if it can't fit)."""
+    steps = [LOOKUP_STEPS.get(c, DEFAULT_LOOKUP_STEP) for c in FEATURE_COLS]
+    try:
+        quantizer = ScalarQuantizer.fixed_point(np.concatenate([track_features, artist_features]), steps)
+    except ValueError as e:
+        print(f"LOOKUP_QUANTIZE: {e}; keeping float32 features.")
+        return track_features, artist_features
+    return (QuantizedFeatures(quantizer.encode(track_features), quantizer),
+            QuantizedFeatures(quantizer.encode(artist_features), quantizer))
+
+
+def encode_ids(ids):
+    """Spotify IDs -> S22 array. Anything that isn't a 22-char ASCII string becomes b"" (never matches)."""
+    return np.array(
+        [i if isinstance(i, str) and len(i) == ID_LEN and i.isascii() else "" for i in ids],
+        dtype=ID_DTYPE,
+    )
+
+
+def _sorted_ids(ids):
+    """Encode IDs as fixed-width bytes; returns (sorted_ids, order)."""
+    encoded = np.asarray(ids, dtype=ID_DTYPE)
+    order = np.argsort(encoded, kind="stable")
+    return encoded[order], order
+
+
+def _search(sorted_ids, keys):
+    """Vectorized binary search. Returns positions, -1 where the key is absent."""
+    if len(sorted_ids) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    pos = np.searchsorted(sorted_ids, keys)
+    pos = np.minimum(pos, len(sorted_ids) - 1)
+    return np.where(sorted_ids[pos] == keys, pos, -1)
+
+
+class LookupStore:
+    """Track and artist-mean features keyed by Spotify ID, resolved in batches."""
+
+    def __init__(self, track_ids, track_features, track_names, track_artists, artist_ids, artist_features):
+        self.track_ids = track_ids
+        self.track_features = track_features
+        self.track_names = track_names
+        self.track_artists = track_artists
+        self.artist_ids = artist_ids
+        self.artist_features = artist_features
+
+    @property
+    def n_tracks(self):
+        return len(self.track_ids)
+
+    @property
+    def n_artists(self):
+        return len(self.artist_ids)
+
+    @classmethod
+    def from_frames(cls, df_first, df_artist, quantize=None):
+        """Build from the deduplicated track frame and the artist-mean frame.
+
+        quantize (default LOOKUP_QUANTIZE) stores features as uint16 codes, or float32 if a
+        column's range does not fit.
+        """
+        track_ids, order = _sorted_ids(df_first["track_id"].astype(str).values)
+        artist_ids, artist_order = _sorted_ids(df_artist["artist_id"].astype(str).values)
+        track_features = df_first[FEATURE_COLS].to_numpy(dtype=np.float32)[order]
+        artist_features = df_artist[FEATURE_COLS].to_numpy(dtype=np.float32)[artist_order]
+        if LOOKUP_QUANTIZE if quantize is None else quantize:
+            track_features, artist_features = _quantized(track_features, artist_features)
+        return cls(
+            track_ids,
+            track_features,
+            StringTable.from_strings(df_first["track_name"].values[order]),
+            StringTable.from_strings(df_first["artist_name"].values[order]),
+            artist_ids,
+            artist_features,
+        )
+
+    @property
+    def quantized(self):
+        return isinstance(self.track_features, QuantizedFeatures)
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "track_ids.npy"), self.track_ids)
+        self.track_names.save(directory, "track_names")
+        self.track_artists.save(directory, "track_artists")
+        np.save(os.path.join(directory, "artist_ids.npy"), self.artist_ids)
+        if self.quantized:
+            np.save(os.path.join(directory, "track_codes.npy"), self.track_features.codes)
+            np.save(os.path.join(directory, "artist_codes.npy"), self.artist_features.codes)
+            with open(os.path.join(directory, LOOKUP_QUANTIZER), "w") as f:
+                json.dump({"feature_cols": FEATURE_COLS, **self.track_features.quantizer.to_dict()}, f, indent=2)
+        else:
+            np.save(os.path.join(directory, "track_features.npy"), self.track_features)
+            np.save(os.path.join(directory, "artist_features.npy"), self.artist_features)
+
+    @staticmethod
+    def feature_files(directory):
+        """Feature artifacts of the store saved in directory: codes + quantizer, or float32 arrays."""
+        if os.path.exists(os.path.join(directory, LOOKUP_QUANTIZER)):
+            return ["track_codes.npy", "artist_codes.npy", LOOKUP_QUANTIZER]
+        return ["track_features.npy", "artist_features.npy"]
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        def npy(name):
+            return np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+
+        if os.path.exists(os.path.join(directory, LOOKUP_QUANTIZER)):
+            with open(os.path.join(directory, LOOKUP_QUANTIZER)) as f:
+                data = json.load(f)
+            if data.get("feature_cols") != FEATURE_COLS:
+                raise ValueError(f"{LOOKUP_QUANTIZER} was built for different FEATURE_COLS")
+            quantizer = ScalarQuantizer.from_dict(data)
+            track_features = QuantizedFeatures(npy("track_codes.npy"), quantizer)
+            artist_features = QuantizedFeatures(npy("artist_codes.npy"), quantizer)
+        else:
+            track_features, artist_features = npy("track_features.npy"), npy("artist_features.npy")
+        return cls(
+            npy("track_ids.npy"),
+            track_features,
+            StringTable.load(directory, "track_names", mmap_mode),
+            StringTable.load(directory, "track_artists", mmap_mode),
+            npy("artist_ids.npy"),
+            artist_features,
+        )
+
+    def resolve(self, track_ids, artist_ids, track_names=None, artist_names=None, name_index=None):
+        """Resolve a batch of (track ID, primary artist ID) pairs in one pass.
+
+        Exact track matches win. With a name_index (name_index.py) and the
+        track and primary artist names, ID misses are then looked up by
+        normalized name in one batch (MATCH_NAME, or MATCH_NEAR for a fuzzy
+        match). Otherwise the artist mean is used. Returns (match, features,
+        track_pos): match codes (MATCH_*), float64 features [n, len(FEATURE_COLS)]
+        with NaN rows for unmatched, and the track-table position of track
+        matches (-1 otherwise).
+        """
+        track_pos = _search(self.track_ids, encode_ids(track_ids))
+        artist_pos = _search(self.artist_ids, encode_ids(artist_ids))
+        exact = track_pos >= 0
+        named = np.zeros(len(track_pos), dtype=bool)
+        near = np.zeros(len(track_pos), dtype=bool)
+        if name_index is not None and track_names is not None and not exact.all():
+            misses = np.flatnonzero(~exact)
+            found, found_near = name_index.lookup([track_names[i] for i in misses], [artist_names[i] for i in misses])
+            track_pos[misses] = found
+            named[misses] = found >= 0
+            near[misses] = found_near
+        artist = ~exact & ~named & (artist_pos >= 0)
+
+        features = np.full((len(track_pos), len(FEATURE_COLS)), np.nan)
+        if (exact | named).any():
+            features[exact | named] = to_float64(self.track_features[track_pos[exact | named]])
+        if artist.any():
+            features[artist] = to_float64(self.artist_features[artist_pos[artist]])
+        match = np.select([exact, near, named, artist], [MATCH_EXACT, MATCH_NEAR, MATCH_NAME, MATCH_ARTIST], MATCH_NONE)
+        return match, features, track_pos
+
+
+class KnnTable:
+    """Rows of the neighbour index in engine order: raw features, names and name keys."""
+
+    def __init__(self, features, names, artists, keys):
+        self.features = features
+        self.names = names
+        self.artists = artists
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.features)
+
+    @classmethod
+    def from_frame(cls, df_knn):
+        return cls(
+            df_knn[FEATURE_COLS].to_numpy(dtype=np.float32),
+            StringTable.from_strings(df_knn["track_name"].values),
+            StringTable.from_strings(df_knn["artist_name"].values),
+            df_knn["name_key"].to_numpy(dtype=np.uint64) if "name_key" in df_knn
+            else name_keys(df_knn["track_name"].values, df_knn["artist_name"].values),
+        )
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "knn_features.npy"), self.features)
+        self.names.save(directory, "knn_names")
+        self.artists.save(directory, "knn_artists")
+        np.save(os.path.join(directory, "knn_keys.npy"), self.keys)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        return cls(
+            np.load(os.path.join(directory, "knn_features.npy"), mmap_mode=mmap_mode),
+            StringTable.load(directory, "knn_names", mmap_mode),
+            StringTable.load(directory, "knn_artists", mmap_mode),
+            np.load(os.path.join(directory, "knn_keys.npy"), mmap_mode=mmap_mode),
+        )
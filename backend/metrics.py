@@ -0,0 +1,188 @@
+"""
+In-process metrics with Prometheus text exposition, plus an opt-in sampling profiler.
+
+  REQUEST_SECONDS        request latency by endpoint and status
+  STAGE_SECONDS          /auth-data stages: spotify, match, stats, knn, serialize
+  DATASET_LOAD_SECONDS   dataset load steps (map_precomputed, read_rows, lookup_ready, engine_build, total, ...)
+  gauges                 callbacks evaluated at scrape time (readiness, cache,
+                         rate limiter, user writes), registered by app.py
+
+Everything is per process; under gunicorn each worker answers /metrics with
+its own numbers, so scrape per worker or aggregate by instance.
+
+SamplingProfiler samples one thread's stack every PROFILE_INTERVAL_MS while
+a request runs and returns folded stacks ("a;b;c count" lines), the input
+format of flamegraph.pl and speedscope.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOAD_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values."""
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for labelvalues, (counts, total, n) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _labels(self.labelnames + ("le",), labelvalues + (f"{bound:g}",))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            inf = _labels(self.labelnames + ("le",), labelvalues + ("+Inf",))
+            lines.append(f"{self.name}_bucket{inf} {n}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {n}")
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter whose samples come from fn() -> {label value tuple or (): number} at scrape time."""
+
+    def __init__(self, name, help, fn, labelnames=(), kind="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            samples = self.fn() or {}
+        except Exception:
+            samples = {}
+        for labelvalues, value in sorted(samples.items()):
+            if value is not None:
+                lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {float(value)!r}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "sonus_request_seconds", "HTTP request latency.", ("endpoint", "status")))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "sonus_auth_data_stage_seconds", "Time per /auth-data stage.", ("stage",)))
+DATASET_LOAD_SECONDS = REGISTRY.register(Histogram(
+    "sonus_dataset_load_seconds", "Time per dataset load step.", ("step",), LOAD_BUCKETS))
+
+
+def stage(name):
+    """Time one /auth-data stage."""
+    return STAGE_SECONDS.time(name)
+
+
+def load_step(name):
+    """Time one dataset load step."""
+    return DATASET_LOAD_SECONDS.time(name)
+
+
+def gauge(name, help, fn, labelnames=(), kind="gauge"):
+    return REGISTRY.register(CallbackMetric(name, help, fn, labelnames, kind))
+
+
+def render():
+    return REGISTRY.render()
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval from a helper thread."""
+
+    def __init__(self, thread_id=None, interval_ms=PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sampling-profiler")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
@@ -0,0 +1,196 @@
+"""
+Name-based track matching for top tracks whose Spotify ID is not in the dataset.
+
+Re-releases, remasters and regional releases carry new track IDs, so an ID
+miss often still has its song in the dataset under another ID. NameIndex keys
+every lookup-store track by its normalized (track_name, artist_name):
+lowercased, accents and punctuation stripped, and "remaster" / "feat."
+suffixes removed, so "Song - 2011 Remaster" by "Beyoncé" and "Song (feat. X)"
+by "Beyonce" meet at ("song", "beyonce"). The keys are uint64 hashes kept
+sorted, and all misses of a request are looked up with one searchsorted.
+
+With NAME_MATCH=fuzzy, names still missing are compared by character
+trigram similarity (Jaccard) with the tracks of the same normalized artist,
+and the best one at or above NAME_FUZZY_MIN_SIMILARITY is taken. The trigram
+postings are built with the index: one sorted uint64 key per (artist,
+trigram) of every indexed name, so a miss looks up its own trigrams and
+scores only the artist's tracks that share at least one, however many
+tracks the artist has. LookupStore.resolve reports these as match_type
+"name" and "near"; both use the matched track's own features.
+
+  name_keys.npy         uint64 [n]  normalized (track, artist) keys, sorted
+  name_rows.npy         int64 [n]   lookup-store track position per key
+  name_gram_keys.npy    uint64 [g]  (artist, trigram) posting keys, sorted
+  name_gram_rows.npy    int32 [g]   lookup-store track position per posting
+  name_gram_counts.npy  uint16 [n_tracks]  distinct trigrams per indexed track
+
+The name_gram_* postings take about 12 bytes per trigram and are only built
+when NAME_MATCH is fuzzy for precompute_dataset.py / the CSV load (like
+LOOKUP_QUANTIZE); without them fuzzy mode finds no near matches.
+
+  NAME_MATCH                 "on" (default), "fuzzy" (also near matches) or "off"
+  NAME_FUZZY_MIN_SIMILARITY  trigram Jaccard needed for a near match, default 0.6
+"""
+
+import os
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from lookup_store import name_keys
+
+NAME_MATCH = os.getenv("NAME_MATCH", "on").lower()
+FUZZY_MIN_SIMILARITY = float(os.getenv("NAME_FUZZY_MIN_SIMILARITY", 0.6))
+GRAM_BUILD_CHUNK = 100_000
+GRAM_FILES = ["name_gram_keys.npy", "name_gram_rows.npy", "name_gram_counts.npy"]
+# Odd 64-bit constant that spreads trigram codes before they are mixed into an artist key.
+_GRAM_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+# "(Remastered 2011)", "[feat. X]", "(with X, feat. Y)": any bracketed part naming a remaster or a feature.
+_BRACKETED = re.compile(r"[(\[][^)\]]*\b(?:remaster(?:ed)?|feat|ft|featuring)\b[^)\]]*[)\]]")
+# "Song - 2011 Remaster", "Song - Remastered Version"
+_DASH_REMASTER = re.compile(r"\s[-–—]\s[^-–—]*\bremaster(?:ed)?\b.*$")
+# "Song feat. X", "Artist ft. Y"
+_FEATURING = re.compile(r"\s(?:feat|ft|featuring)\b\.?\s.*$")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(name):
+    """Matching form of a track or artist name ("" if nothing is left)."""
+    name = str(name)
+    if name.isascii():
+        name = name.lower()
+    else:
+        name = unicodedata.normalize("NFKD", name)
+        name = "".join(c for c in name if not unicodedata.combining(c)).casefold()
+    if "remaster" in name or "f" in name:
+        if "(" in name or "[" in name:
+            name = _BRACKETED.sub(" ", name)
+        name = _FEATURING.sub("", _DASH_REMASTER.sub("", name))
+    return _NON_WORD.sub(" ", name).strip()
+
+
+def _normalized(names):
+    """normalize() over a sequence, computing each distinct name once."""
+    codes, uniques = pd.factorize(pd.Series(names, dtype=object).astype(str))
+    return np.array([normalize(u) for u in uniques], dtype=object)[codes]
+
+
+def _trigrams(name):
+    """Distinct character trigrams of a normalized name as 63-bit codes (three 21-bit code points)."""
+    codes = [ord(c) for c in f"  {name} "]
+    return {(a << 42) | (b << 21) | c for a, b, c in zip(codes, codes[1:], codes[2:])}
+
+
+def _gram_keys(artist_keys, grams):
+    """Posting key per (artist key, trigram code) pair."""
+    return np.bitwise_xor(np.asarray(artist_keys, dtype=np.uint64), np.asarray(grams, dtype=np.uint64) * _GRAM_MIX)
+
+
+class NameIndex:
+    """Normalized (track, artist) keys over the lookup-store tracks, plus optional trigram postings."""
+
+    def __init__(self, keys, rows, gram_keys=None, gram_rows=None, gram_counts=None):
+        self.keys = keys
+        self.rows = rows
+        self.gram_keys = gram_keys
+        self.gram_rows = gram_rows
+        self.gram_counts = gram_counts
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def fuzzy(self):
+        """True if the index has trigram postings for near matches."""
+        return self.gram_keys is not None
+
+    @classmethod
+    def build(cls, track_names, artist_names, fuzzy=None):
+        """Index tracks in lookup-store order; a key shared by several tracks maps to the first.
+
+        fuzzy (default NAME_MATCH == "fuzzy") also builds the trigram postings of those first tracks.
+        """
+        tracks = _normalized(track_names)
+        artists = _normalized(artist_names)
+        named = np.flatnonzero((tracks != "") & (artists != ""))
+        keys = name_keys(tracks[named], artists[named])
+        keys, first = np.unique(keys, return_index=True)
+        rows = named[first].astype(np.int64)
+        if not (NAME_MATCH == "fuzzy" if fuzzy is None else fuzzy):
+            return cls(keys, rows)
+        gram_counts = np.zeros(len(tracks), dtype=np.uint16)
+        gram_keys, gram_rows = [], []
+        # In chunks, so only one chunk's trigram sets are alive at a time.
+        for start in range(0, len(rows), GRAM_BUILD_CHUNK):
+            chunk = rows[start:start + GRAM_BUILD_CHUNK]
+            grams = [_trigrams(t) for t in tracks[chunk]]
+            counts = np.fromiter((len(g) for g in grams), dtype=np.int64, count=len(grams))
+            flat = np.fromiter((c for g in grams for c in g), dtype=np.uint64, count=int(counts.sum()))
+            gram_keys.append(_gram_keys(np.repeat(name_keys([""] * len(chunk), artists[chunk]), counts), flat))
+            gram_rows.append(np.repeat(chunk, counts).astype(np.int32))
+            gram_counts[chunk] = np.minimum(counts, np.iinfo(np.uint16).max)
+        gram_keys = np.concatenate(gram_keys) if gram_keys else np.empty(0, dtype=np.uint64)
+        gram_rows = np.concatenate(gram_rows) if gram_rows else np.empty(0, dtype=np.int32)
+        order = np.argsort(gram_keys, kind="stable")
+        return cls(keys, rows, gram_keys[order], gram_rows[order], gram_counts)
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "name_keys.npy"), self.keys)
+        np.save(os.path.join(directory, "name_rows.npy"), self.rows)
+        if self.fuzzy:
+            for name, values in zip(GRAM_FILES, (self.gram_keys, self.gram_rows, self.gram_counts)):
+                np.save(os.path.join(directory, name), values)
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, "name_rows.npy"))
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        def npy(name):
+            return np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+
+        has_grams = all(os.path.exists(os.path.join(directory, name)) for name in GRAM_FILES)
+        if NAME_MATCH == "fuzzy" and not has_grams:
+            print("NAME_MATCH=fuzzy but the name index has no trigram postings; "
+                  "re-run precompute_dataset.py with NAME_MATCH=fuzzy.")
+        grams = [npy(name) for name in GRAM_FILES] if has_grams else []
+        return cls(npy("name_keys.npy"), npy("name_rows.npy"), *grams)
+
+    def lookup(self, track_names, artist_names, fuzzy=None):
+        """Lookup-store position per (track, artist) name pair, -1 where none; plus a near-match mask.
+
+        Near matches need fuzzy (default NAME_MATCH == "fuzzy") and an index built with trigram postings.
+        """
+        tracks = _normalized(track_names)
+        artists = _normalized(artist_names)
+        positions = np.full(len(tracks), -1, dtype=np.int64)
+        near = np.zeros(len(tracks), dtype=bool)
+        if not len(tracks) or not len(self.keys):
+            return positions, near
+        keys = name_keys(tracks, artists)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        hit = (self.keys[pos] == keys) & (tracks != "") & (artists != "")
+        positions[hit] = self.rows[pos[hit]]
+        if (NAME_MATCH == "fuzzy" if fuzzy is None else fuzzy) and self.fuzzy:
+            for i in np.flatnonzero(~hit & (tracks != "") & (artists != "")):
+                positions[i] = self._near(tracks[i], artists[i])
+                near[i] = positions[i] >= 0
+        return positions, near
+
+    def _near(self, track, artist):
+        """Best trigram match for track among the artist's tracks that share a trigram with it, or -1."""
+        grams = np.fromiter(_trigrams(track), dtype=np.uint64)
+        keys = _gram_keys(np.full(len(grams), name_keys([""], [artist])[0]), grams)
+        lo = np.searchsorted(self.gram_keys, keys, side="left")
+        hi = np.searchsorted(self.gram_keys, keys, side="right")
+        if not (hi > lo).any():
+            return -1
+        rows, shared = np.unique(np.concatenate([self.gram_rows[a:b] for a, b in zip(lo, hi)]), return_counts=True)
+        # Jaccard: shared / (|query| + |candidate| - shared)
+        scores = shared / (len(grams) + self.gram_counts[rows].astype(np.int64) - shared)
+        best = int(np.argmax(scores))
+        return int(rows[best]) if scores[best] >= FUZZY_MIN_SIMILARITY else -1
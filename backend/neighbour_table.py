@@ -0,0 +1,188 @@
+"""
+Precomputed neighbour lists for dataset tracks.
+
+Most top tracks are exact matches, so the neighbours of the same popular
+tracks used to be searched again on every request. precompute_dataset.py
+now searches them once for every KNN row with the exact engine, in row
+chunks spread over a process pool, and stores them:
+
+  neighbours.npy            int32 [n_knn, k]   nearest KNN rows per KNN row, nearest first
+  neighbour_track_rows.npy  int32 [n_tracks]   KNN row per lookup-store track, -1 where the
+                                               track's features differ from that row's
+
+NeighbourTable.kneighbors reads the rows of dataset tracks from the table
+and sends only the other queries (artist means, feature vectors, tracks
+whose KNN row is another version of the song) to the live engine. Lists are
+exact whatever KNN_ENGINE is. per_track recommendations (the default
+REC_MODE) and the batch endpoint use the table when no filter is set;
+centroid and cluster queries are feature vectors and stay live. An incremental precompute run merges the
+appended rows into the saved lists instead of searching every row again.
+
+  NEIGHBOUR_TABLE    "on" (default) or "off": map the table at load time
+  NEIGHBOUR_TABLE_K  neighbours stored per row, default 5; 0 skips the table (precompute_dataset.py)
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ann import ExactEngine
+from lookup_store import DEFAULT_LOOKUP_STEP, FEATURE_COLS, LOOKUP_STEPS, name_keys
+
+NEIGHBOUR_TABLE = os.getenv("NEIGHBOUR_TABLE", "on").lower() != "off"
+NEIGHBOUR_TABLE_K = int(os.getenv("NEIGHBOUR_TABLE_K", 5))
+CHUNK_ROWS = 50_000
+
+_worker = {}
+
+
+def _init_worker(directory):
+    _worker["engine"] = ExactEngine.load(directory)
+    _worker["queries"] = np.load(os.path.join(directory, "queries.npy"), mmap_mode="r")
+
+
+def _search_chunk(start, stop, k):
+    distances, indices = _worker["engine"].kneighbors(_worker["queries"][start:stop], k)
+    return start, distances.astype(np.float32), indices.astype(np.int32)
+
+
+def exact_kneighbors(engine, queries, k, workers=1):
+    """(float32 distances, int32 indices) of engine.kneighbors over queries, CHUNK_ROWS at a time.
+
+    With workers > 1 the engine and queries are saved to a temporary directory
+    that every pool process maps, so the KD-tree is shared rather than copied.
+    """
+    k = min(k, len(engine))
+    distances = np.empty((len(queries), k), dtype=np.float32)
+    indices = np.empty((len(queries), k), dtype=np.int32)
+    starts = range(0, len(queries), CHUNK_ROWS)
+    if workers <= 1 or len(starts) <= 1:
+        for start in starts:
+            d, i = engine.kneighbors(queries[start:start + CHUNK_ROWS], k)
+            distances[start:start + len(i)], indices[start:start + len(i)] = d, i
+        return distances, indices
+    with tempfile.TemporaryDirectory() as directory:
+        engine.save(directory)
+        np.save(os.path.join(directory, "queries.npy"), np.asarray(queries))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(directory,)) as pool:
+            futures = [pool.submit(_search_chunk, start, start + CHUNK_ROWS, k) for start in starts]
+            for future in futures:
+                start, d, i = future.result()
+                distances[start:start + len(i)], indices[start:start + len(i)] = d, i
+    return distances, indices
+
+
+def track_knn_rows(store, knn_table, track_names=None, track_artists=None):
+    """KNN row per lookup-store track: the row with its (name, artist) key, -1 unless the features agree.
+
+    Features agree within one lookup quantization step, so a LOOKUP_QUANTIZE store maps like a float one.
+    """
+    n = store.n_tracks
+    if track_names is None:
+        track_names, track_artists = store.track_names.take(range(n)), store.track_artists.take(range(n))
+    rows = np.full(n, -1, dtype=np.int32)
+    if not n or not len(knn_table):
+        return rows
+    keys = name_keys(track_names, track_artists)
+    order = np.argsort(knn_table.keys, kind="stable")
+    sorted_keys = np.asarray(knn_table.keys)[order]
+    pos = np.minimum(np.searchsorted(sorted_keys, keys), len(order) - 1)
+    hit = np.flatnonzero(sorted_keys[pos] == keys)
+    candidate = order[pos[hit]]
+    steps = np.array([LOOKUP_STEPS.get(c, DEFAULT_LOOKUP_STEP) for c in FEATURE_COLS])
+    diff = np.abs(np.asarray(store.track_features[hit], dtype=np.float64)
+                  - np.asarray(knn_table.features[candidate], dtype=np.float64))
+    same = (diff <= steps).all(axis=1)
+    rows[hit[same]] = candidate[same]
+    return rows
+
+
+class NeighbourTable:
+    """k nearest KNN rows of every KNN row, plus the KNN row of every lookup-store track."""
+
+    files = ["neighbours.npy", "neighbour_track_rows.npy"]
+
+    def __init__(self, neighbours, track_rows):
+        self.neighbours = neighbours
+        self.track_rows = track_rows
+
+    def __len__(self):
+        return len(self.neighbours)
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    @staticmethod
+    def build(X, k=NEIGHBOUR_TABLE_K, workers=1, engine=None):
+        """int32 [len(X), k] neighbour lists of every row of X (engine: an ExactEngine over X, built if None)."""
+        engine = engine or ExactEngine.build(X)
+        return exact_kneighbors(engine, X, k, workers)[1]
+
+    @classmethod
+    def update(cls, directory, X, appended_from=None, k=NEIGHBOUR_TABLE_K, workers=1, engine=None):
+        """Neighbour lists for X, reusing the saved ones when X only appended rows from appended_from.
+
+        Saved lists of old rows are merged with each row's nearest appended rows;
+        appended rows are searched in full. Anything else is a full build.
+        """
+        path = os.path.join(directory, cls.files[0])
+        k = min(k, len(X))
+        if appended_from is None or not os.path.exists(path):
+            return cls.build(X, k, workers, engine)
+        previous = np.load(path)
+        if previous.shape != (appended_from, k):
+            return cls.build(X, k, workers, engine)
+        if appended_from == len(X):
+            return previous
+        engine = engine or ExactEngine.build(X)
+        _, tail = exact_kneighbors(engine, X[appended_from:], k, workers)
+        added_d, added_i = exact_kneighbors(ExactEngine.build(X[appended_from:]), X[:appended_from], k, workers)
+        merged = np.empty((len(X), k), dtype=np.int32)
+        merged[appended_from:] = tail
+        for start in range(0, appended_from, CHUNK_ROWS):
+            stop = min(start + CHUNK_ROWS, appended_from)
+            old = previous[start:stop]
+            old_d = np.sqrt(((X[old] - X[start:stop, None, :]) ** 2).sum(axis=2))
+            ids = np.concatenate([old, added_i[start:stop] + appended_from], axis=1)
+            top = np.argsort(np.concatenate([old_d, added_d[start:stop]], axis=1), axis=1, kind="stable")[:, :k]
+            merged[start:stop] = np.take_along_axis(ids, top, axis=1)
+        return merged
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "neighbours.npy"), self.neighbours)
+        np.save(os.path.join(directory, "neighbour_track_rows.npy"), self.track_rows)
+
+    @classmethod
+    def exists(cls, directory):
+        return all(os.path.exists(os.path.join(directory, f)) for f in cls.files)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        return cls(np.load(os.path.join(directory, "neighbours.npy"), mmap_mode=mmap_mode),
+                   np.load(os.path.join(directory, "neighbour_track_rows.npy"), mmap_mode=mmap_mode))
+
+    def knn_rows(self, track_pos):
+        """KNN row per lookup-store position (-1 positions and unmapped tracks give -1)."""
+        track_pos = np.asarray(track_pos, dtype=np.int64)
+        rows = np.full(len(track_pos), -1, dtype=np.int64)
+        known = track_pos >= 0
+        rows[known] = self.track_rows[track_pos[known]]
+        return rows
+
+    def kneighbors(self, engine, Q, track_pos, k):
+        """Neighbour indices [len(Q), k] for query vectors Q of the tracks at lookup-store positions track_pos.
+
+        Rows of mapped tracks come from the table; the rest (and everything when k > self.k) from engine.
+        """
+        rows = self.knn_rows(track_pos) if k <= self.k else np.full(len(Q), -1)
+        live = rows < 0
+        if live.all():
+            return engine.kneighbors(Q, k)[1]
+        indices = np.empty((len(Q), k), dtype=np.int64)
+        indices[~live] = self.neighbours[rows[~live], :k]
+        if live.any():
+            indices[live] = engine.kneighbors(np.asarray(Q)[live], k)[1]
+        return indices
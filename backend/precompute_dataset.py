@@ -1,21 +1,61 @@
 """
 One-time script to build full-dataset artifacts from the full CSV.
-Run from backend dir: python precompute_dataset.py
+Run from backend dir: python precompute_dataset.py [--full] [--workers N] [--partition-rows N]
 
 This processes all ~2.26M rows and saves precomputed/ so the app can load
 full data at startup without redoing groupby, drop_duplicates, or KNN fit.
+Artifacts are plain .npy arrays plus string tables (see artifacts.py) that the
+app memory-maps, so startup takes milliseconds and workers share the pages.
 Run again whenever spotify_tracks_cleaned_final.csv is updated.
+
+The CSV is split into partitions of --partition-rows lines (cut only outside
+quoted fields) and each partition is fingerprinted. A process pool parses
+changed partitions (IDs, name keys, in-partition dedup, per-artist sums and
+counts) into precomputed/partitions/; unchanged partitions are reused, so a
+rerun after appending or editing rows only parses what changed. The main
+process then merges partition aggregates in file order (hash-set dedup of
+track IDs and (track_name, artist_name) keys, summed artist aggregates), so
+memory is bounded by the deduplicated output, never the whole CSV.
+
+On an incremental run the stored feature transform is kept and engines are
+updated rather than refitted where they support it (IVF: appended points are
+assigned to the existing lists, and ivf_sq8 re-quantizes the updated lists;
+see ann.py). The neighbour table (neighbour_table.py) is then searched with
+the exact engine in row chunks over --workers processes; an incremental run
+only merges appended rows into the saved lists. --full rebuilds everything.
+The name index used to match top tracks missing by ID (name_index.py) is
+rebuilt from the lookup store on every run.
+A per-stage timing report is printed at the end.
 """
 
+import argparse
+import hashlib
+import io
+import json
 import os
-import pickle
+import resource
 import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
+import numpy as np
 import pandas as pd
-from sklearn.neighbors import NearestNeighbors
+
+from ann import ENGINES, ExactEngine
+from artifacts import has_mmap_artifacts, save_mmap_artifacts, update_source_mtime
+from feature_transform import FeatureTransform, configured_weights
+from lookup_store import name_keys
+from neighbour_table import NEIGHBOUR_TABLE_K, NeighbourTable
 
 LOAD_COLS = ["track_uri", "artist_uri", "track_name", "artist_name", "tempo", "energy", "valence", "danceability", "acousticness", "liveness"]
 FEATURE_COLS = ["tempo", "energy", "valence", "danceability", "acousticness", "liveness"]
+OUTPUT_COLS = ["track_id", "artist_id", "track_name", "artist_name"] + FEATURE_COLS
+PARTITION_ROWS = 200_000
+PARTITIONS_DIR = "partitions"
+STATE_FILE = "state.json"
+ARTIST_FOLD_EVERY = 8
 
 
 def _extract_ids_vectorized(series, prefix="track"):
@@ -28,7 +68,219 @@ def _extract_ids_vectorized(series, prefix="track"):
     return ids
 
 
+def _prepare_chunk(chunk):
+    """Worker: clean one CSV chunk. Returns (rows, name keys, per-artist sums and counts)."""
+    chunk = chunk.dropna(subset=FEATURE_COLS)
+    chunk = chunk.assign(tempo=pd.to_numeric(chunk["tempo"], errors="coerce"))
+    chunk = chunk.assign(
+        track_id=_extract_ids_vectorized(chunk["track_uri"], "track"),
+        artist_id=_extract_ids_vectorized(chunk["artist_uri"], "artist"),
+    )
+    chunk = chunk[chunk["track_id"].notna() & chunk["artist_id"].notna()][OUTPUT_COLS].reset_index(drop=True)
+    keys = name_keys(chunk["track_name"].values, chunk["artist_name"].values)
+    grouped = chunk.groupby("artist_id")[FEATURE_COLS]
+    partial = grouped.sum().join(grouped.count(), rsuffix="__n")
+    return chunk, keys, partial
+
+
+class _StageTimer:
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        yield
+        self.stages.append((name, time.perf_counter() - start))
+
+    def report(self):
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print("\nStage timings:")
+        for name, seconds in self.stages:
+            print(f"  {name:<34}{seconds:>9.2f} s")
+        print(f"  {'total':<34}{sum(s for _, s in self.stages):>9.2f} s")
+        print(f"  peak RSS (main process)           {peak_mb:>9.0f} MB")
+
+
+def _fingerprint(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _iter_partitions(csv_path, partition_rows):
+    """Yield (header, data) for runs of ~partition_rows physical lines, cut only outside quoted fields."""
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+        lines, count, in_quotes = [], 0, False
+        for line in f:
+            lines.append(line)
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            if not in_quotes:
+                count += 1
+                if count >= partition_rows:
+                    yield header, b"".join(lines)
+                    lines, count = [], 0
+        if lines:
+            yield header, b"".join(lines)
+
+
+def _partition_paths(partitions_dir, index):
+    base = os.path.join(partitions_dir, f"p{index:05d}")
+    return {part: f"{base}.{part}.parquet" for part in ("tracks", "knn", "artists")}
+
+
+def _build_partition(header, data, paths):
+    """Worker: parse one partition and write its aggregates. Returns the parsed row count.
+
+    tracks: first row per track_id; knn: first row per name key (NaN features kept,
+    since such a row still claims its key); artists: per-artist feature sums and counts.
+    """
+    chunk = pd.read_csv(io.BytesIO(header + data), usecols=LOAD_COLS)
+    chunk, keys, partial = _prepare_chunk(chunk)
+    chunk.drop_duplicates(subset=["track_id"]).to_parquet(paths["tracks"], index=False)
+    chunk.assign(name_key=keys).drop_duplicates(subset=["name_key"]).to_parquet(paths["knn"], index=False)
+    partial.reset_index().to_parquet(paths["artists"], index=False)
+    return len(chunk)
+
+
+def _load_state(partitions_dir):
+    try:
+        with open(os.path.join(partitions_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(partitions_dir, state):
+    with open(os.path.join(partitions_dir, STATE_FILE), "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def _refresh_partitions(csv_path, partitions_dir, partition_rows, previous, workers):
+    """Fingerprint every partition and rebuild the changed ones. Returns (state, changed indexes)."""
+    old = previous["partitions"] if previous else []
+    state = {"partition_rows": partition_rows, "header": None, "partitions": []}
+    changed = []
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = deque()
+    try:
+        for index, (header, data) in enumerate(_iter_partitions(csv_path, partition_rows)):
+            state["header"] = _fingerprint(header)
+            fingerprint = _fingerprint(data)
+            paths = _partition_paths(partitions_dir, index)
+            entry = {"fingerprint": fingerprint, "rows": old[index]["rows"] if index < len(old) else None}
+            state["partitions"].append(entry)
+            reusable = (
+                previous is not None
+                and previous.get("header") == state["header"]
+                and index < len(old)
+                and old[index]["fingerprint"] == fingerprint
+                and all(os.path.exists(p) for p in paths.values())
+            )
+            if reusable:
+                continue
+            changed.append(index)
+            if pool is None:
+                entry["rows"] = _build_partition(header, data, paths)
+                continue
+            pending.append((entry, pool.submit(_build_partition, header, data, paths)))
+            if len(pending) >= 2 * workers:
+                done_entry, future = pending.popleft()
+                done_entry["rows"] = future.result()
+        while pending:
+            done_entry, future = pending.popleft()
+            done_entry["rows"] = future.result()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for name in os.listdir(partitions_dir):
+        if name.startswith("p") and name.endswith(".parquet") and int(name[1:6]) >= len(state["partitions"]):
+            os.remove(os.path.join(partitions_dir, name))
+    return state, changed
+
+
+class _PartitionMerger:
+    """Merges partition aggregates in file order into deduplicated outputs and artist means."""
+
+    def __init__(self):
+        self.seen_tracks = set()
+        self.seen_keys = set()
+        self.track_parts = []
+        self.knn_parts = []
+        self.artist_parts = []
+        self.artist_totals = None
+
+    def add(self, tracks, knn, partial):
+        ids = tracks["track_id"].values
+        first_tracks = np.fromiter((tid not in self.seen_tracks for tid in ids), dtype=bool, count=len(ids))
+        self.seen_tracks.update(ids[first_tracks])
+        self.track_parts.append(tracks[first_tracks])
+
+        # Same order as drop_duplicates(track_name, artist_name) then dropna: a key is
+        # claimed by its first row even if that row is later dropped for a NaN feature.
+        keys = knn["name_key"].to_numpy(dtype=np.uint64)
+        first_keys = np.fromiter((int(k) not in self.seen_keys for k in keys), dtype=bool, count=len(keys))
+        self.seen_keys.update(keys[first_keys].tolist())
+        knn_rows = first_keys & knn[FEATURE_COLS].notna().all(axis=1).values
+        self.knn_parts.append(knn[knn_rows])
+
+        self.artist_parts.append(partial.set_index("artist_id"))
+        if len(self.artist_parts) >= ARTIST_FOLD_EVERY:
+            self._fold_artists()
+
+    def _fold_artists(self):
+        parts = self.artist_parts + ([self.artist_totals] if self.artist_totals is not None else [])
+        self.artist_totals = pd.concat(parts).groupby(level=0).sum()
+        self.artist_parts = []
+
+    def frames(self):
+        self._fold_artists()
+        totals = self.artist_totals
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = totals[FEATURE_COLS].to_numpy() / totals[[f"{c}__n" for c in FEATURE_COLS]].to_numpy()
+        df_artist = pd.DataFrame(means, columns=FEATURE_COLS)
+        df_artist.insert(0, "artist_id", totals.index.astype(str))
+        df_first = pd.concat(self.track_parts, ignore_index=True)
+        df_knn = pd.concat(self.knn_parts, ignore_index=True)
+        self.track_parts = self.knn_parts = None
+        return df_artist, df_first, df_knn
+
+
+def _merge_partitions(partitions_dir, n_partitions):
+    merger = _PartitionMerger()
+    for index in range(n_partitions):
+        paths = _partition_paths(partitions_dir, index)
+        merger.add(
+            pd.read_parquet(paths["tracks"]),
+            pd.read_parquet(paths["knn"]),
+            pd.read_parquet(paths["artists"]),
+        )
+    return merger.frames()
+
+
+def _appended_from(precomputed_dir, df_knn):
+    """Row count of the previous KNN table if it is an unchanged prefix of df_knn, else None."""
+    try:
+        old_keys = np.load(os.path.join(precomputed_dir, "knn_keys.npy"))
+        old_features = np.load(os.path.join(precomputed_dir, "knn_features.npy"))
+    except OSError:
+        return None
+    n = len(old_keys)
+    if n > len(df_knn) or not np.array_equal(df_knn["name_key"].to_numpy(dtype=np.uint64)[:n], old_keys):
+        return None
+    if not np.array_equal(df_knn[FEATURE_COLS].to_numpy(dtype=np.float32)[:n], old_features):
+        return None
+    return n
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Build precomputed/ from spotify_tracks_cleaned_final.csv")
+    parser.add_argument("--full", action="store_true", help="ignore stored partitions and rebuild everything")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parser processes")
+    parser.add_argument("--partition-rows", type=int, default=PARTITION_ROWS, help="CSV lines per partition")
+    args = parser.parse_args()
+
     backend_dir = os.path.dirname(os.path.abspath(__file__))
     csv_path = os.path.join(backend_dir, "spotify_tracks_cleaned_final.csv")
     if not os.path.exists(csv_path):
@@ -36,52 +288,82 @@ def main():
         sys.exit(1)
 
     precomputed_dir = os.path.join(backend_dir, "precomputed")
-    os.makedirs(precomputed_dir, exist_ok=True)
-
-    print("Reading full CSV (this may take a few minutes)...")
-    df_full = pd.read_csv(csv_path, usecols=LOAD_COLS)
-    df_full.dropna(subset=FEATURE_COLS, inplace=True)
-    df_full["tempo"] = pd.to_numeric(df_full["tempo"], errors="coerce")
-    df_full["track_id"] = _extract_ids_vectorized(df_full["track_uri"], "track")
-    df_full["artist_id"] = _extract_ids_vectorized(df_full["artist_uri"], "artist")
-    df_full = df_full[df_full["track_id"].notna() & df_full["artist_id"].notna()]
-    print(f"  Loaded {len(df_full)} rows.")
-
-    print("Building artist features...")
-    df_artist = df_full.groupby("artist_id", as_index=False)[FEATURE_COLS].mean()
-    df_artist["artist_id"] = df_artist["artist_id"].astype(str)
-    raw_artist = df_artist.set_index("artist_id")[FEATURE_COLS].to_dict("index")
-    artist_features_by_id = {aid: {k: float(v) for k, v in row.items()} for aid, row in raw_artist.items()}
-    print(f"  {len(artist_features_by_id)} artists.")
-
-    print("Building track lookup...")
-    df_first = df_full.drop_duplicates(subset=["track_id"], keep="first").copy()
-    df_first["acousticness"] = df_first["acousticness"].fillna(0.5)
-    df_first["liveness"] = df_first["liveness"].fillna(0.2)
-    track_cols = ["track_name", "artist_name"] + FEATURE_COLS
-    df_first["track_id"] = df_first["track_id"].astype(str)
-    raw_track = df_first.set_index("track_id")[track_cols].to_dict("index")
-    track_by_id = {tid: {k: float(v) if k in FEATURE_COLS else v for k, v in row.items()} for tid, row in raw_track.items()}
-    print(f"  {len(track_by_id)} tracks.")
-
-    print("Building KNN matrix and fitting model...")
-    df_knn = df_full.drop_duplicates(subset=["track_name", "artist_name"]).dropna(subset=FEATURE_COLS)
-    knn_model = NearestNeighbors(n_neighbors=5, metric="euclidean")
-    knn_model.fit(df_knn[FEATURE_COLS].values)
-    print(f"  KNN fitted on {len(df_knn)} unique tracks.")
-
-    print("Writing precomputed artifacts...")
-    with open(os.path.join(precomputed_dir, "artist_features_by_id.pkl"), "wb") as f:
-        pickle.dump(artist_features_by_id, f, protocol=4)
-    with open(os.path.join(precomputed_dir, "track_by_id.pkl"), "wb") as f:
-        pickle.dump(track_by_id, f, protocol=4)
-    df_knn.to_parquet(os.path.join(precomputed_dir, "df_knn.parquet"), index=False)
-    with open(os.path.join(precomputed_dir, "knn_model.pkl"), "wb") as f:
-        pickle.dump(knn_model, f, protocol=4)
-    with open(os.path.join(precomputed_dir, "source_mtime.txt"), "w") as f:
-        f.write(str(os.path.getmtime(csv_path)))
+    partitions_dir = os.path.join(precomputed_dir, PARTITIONS_DIR)
+    os.makedirs(partitions_dir, exist_ok=True)
+    timer = _StageTimer()
+
+    previous = None if args.full else _load_state(partitions_dir)
+    if previous and previous.get("partition_rows") != args.partition_rows:
+        previous = None
+    weights = configured_weights()
+    incremental = (
+        previous is not None
+        and previous.get("weights") == weights
+        and has_mmap_artifacts(precomputed_dir)
+    )
+
+    print(f"Fingerprinting {args.partition_rows}-line partitions, parsing changes with {args.workers} worker(s)...")
+    with timer.stage("parse changed partitions"):
+        state, changed = _refresh_partitions(csv_path, partitions_dir, args.partition_rows, previous, args.workers)
+    state["weights"] = weights
+    n_partitions = len(state["partitions"])
+    print(f"  {n_partitions} partitions, {len(changed)} changed, {sum(p['rows'] for p in state['partitions'])} rows.")
 
+    if incremental and not changed and n_partitions == len(previous["partitions"]):
+        update_source_mtime(precomputed_dir, os.path.getmtime(csv_path))
+        _save_state(partitions_dir, state)
+        timer.report()
+        print("Done. precomputed/ is already up to date.")
+        return
+
+    with timer.stage("merge partitions"):
+        df_artist, df_first, df_knn = _merge_partitions(partitions_dir, n_partitions)
+        df_first["acousticness"] = df_first["acousticness"].fillna(0.5)
+        df_first["liveness"] = df_first["liveness"].fillna(0.2)
+    print(f"  {len(df_artist)} artists, {len(df_first)} tracks, {len(df_knn)} unique (name, artist) rows.")
+
+    print("Building neighbour engines..." if not incremental else "Updating neighbour engines...")
+    with timer.stage("feature transform"):
+        if incremental:
+            feature_transform = FeatureTransform.load(precomputed_dir)
+        else:
+            feature_transform = FeatureTransform.fit(df_knn[FEATURE_COLS].values, weights)
+        X = feature_transform.transform(df_knn[FEATURE_COLS].values)
+    print(f"  Feature weights: {dict(zip(FEATURE_COLS, feature_transform.weights.tolist()))}")
+    appended_from = _appended_from(precomputed_dir, df_knn) if incremental else None
+    if appended_from is not None:
+        print(f"  Existing rows unchanged; adding {len(df_knn) - appended_from} new points.")
+    engines = []
+    for engine in ENGINES.values():
+        with timer.stage(f"engine: {engine.name}"):
+            # Engines over another engine's index (ivf_sq8 over ivf) reuse the one just built.
+            base = next((e for e in engines if e.name == getattr(engine, "derived_from", None)), None)
+            if base is not None:
+                engines.append(engine.derive(base, X))
+            elif incremental:
+                engines.append(engine.update(precomputed_dir, X, appended_from))
+            else:
+                engines.append(engine.build(X))
+    print(f"  {', '.join(e.name for e in engines)} ready on {len(df_knn)} unique tracks.")
+    neighbours = None
+    if NEIGHBOUR_TABLE_K > 0:
+        with timer.stage("neighbour table"):
+            exact = next((e for e in engines if e.name == ExactEngine.name), None)
+            neighbours = NeighbourTable.update(precomputed_dir, X, appended_from, NEIGHBOUR_TABLE_K, args.workers,
+                                               exact)
+        print(f"  {neighbours.shape[1]} neighbours per row precomputed for {len(neighbours)} rows.")
+
+    print("Writing precomputed artifacts (memory-mapped format)...")
+    with timer.stage("write artifacts"):
+        save_mmap_artifacts(
+            precomputed_dir, df_first, df_artist, df_knn, feature_transform, engines, os.path.getmtime(csv_path),
+            neighbours,
+        )
+        _save_state(partitions_dir, state)
+
+    timer.report()
     print("Done. App will use precomputed/ on next start (full data, fast load).")
 
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,96 @@
+"""
+Scalar quantization of feature columns: x ~= offset + code * step, per column.
+
+Two fits share one class:
+
+  ScalarQuantizer.fit(X)                 uint8 steps spanning each column's range;
+                                         the ivf_sq8 engine scans these codes (ann.py)
+  ScalarQuantizer.fixed_point(X, steps)  uint16 decimal steps, so values with that many
+                                         decimals round-trip exactly; the lookup store
+                                         uses these under LOOKUP_QUANTIZE (lookup_store.py)
+
+The top code of each dtype is reserved for NaN. QuantizedFeatures wraps
+codes so that indexing decodes rows to float32, which keeps every reader of
+the float arrays unchanged.
+"""
+
+import numpy as np
+
+
+class ScalarQuantizer:
+    """Per-column affine map between float features and unsigned integer codes."""
+
+    def __init__(self, offset, step, dtype):
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.step = np.asarray(step, dtype=np.float64)
+        self.dtype = np.dtype(dtype)
+
+    @classmethod
+    def fit(cls, X, dtype=np.uint8):
+        """Steps that spread each column's [min, max] over every code but nan_code."""
+        X = np.asarray(X, dtype=np.float64)
+        lo, hi = X.min(axis=0), X.max(axis=0)
+        step = (hi - lo) / (np.iinfo(dtype).max - 1)
+        step[~(step > 0)] = 1.0
+        return cls(lo, step, dtype)
+
+    @classmethod
+    def fixed_point(cls, X, steps, dtype=np.uint16):
+        """Decimal steps with offsets on the step grid. Raises ValueError if a column's range needs wider codes."""
+        steps = np.asarray(steps, dtype=np.float64)
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(steps))
+        if not len(X):
+            return cls(np.zeros(len(steps)), steps, dtype)
+        lo = np.floor(np.nanmin(X, axis=0) / steps + 1e-9)
+        hi = np.ceil(np.nanmax(X, axis=0) / steps - 1e-9)
+        if ((hi - lo) >= np.iinfo(dtype).max).any():
+            raise ValueError(f"feature range too wide for {np.dtype(dtype).name} codes at steps {steps.tolist()}")
+        return cls(lo * steps, steps, dtype)
+
+    @property
+    def nan_code(self):
+        return np.iinfo(self.dtype).max
+
+    def encode(self, X):
+        """Nearest code per value, clipped to the code range; NaN gets nan_code."""
+        codes = np.rint((np.asarray(X, dtype=np.float64) - self.offset) / self.step)
+        return np.where(np.isnan(codes), self.nan_code, np.clip(codes, 0, self.nan_code - 1)).astype(self.dtype)
+
+    def decode(self, codes):
+        codes = np.asarray(codes)
+        values = (self.offset + codes.astype(np.float64) * self.step).astype(np.float32)
+        values[codes == self.nan_code] = np.nan
+        return values
+
+    def to_dict(self):
+        return {"offset": self.offset.tolist(), "step": self.step.tolist(), "dtype": self.dtype.name}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["offset"], data["step"], data["dtype"])
+
+
+class QuantizedFeatures:
+    """Feature matrix stored as codes; indexing rows returns decoded float32 rows."""
+
+    def __init__(self, codes, quantizer):
+        self.codes = codes
+        self.quantizer = quantizer
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def __getitem__(self, rows):
+        return self.quantizer.decode(self.codes[rows])
+
+    def __array__(self, dtype=None, copy=None):
+        decoded = self.quantizer.decode(self.codes)
+        return decoded if dtype is None else decoded.astype(dtype)
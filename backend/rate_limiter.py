@@ -0,0 +1,159 @@
+"""
+Per-client request rate limiting for app.py's rate_limit decorator.
+
+Limits are RATE_LIMIT_MAX requests per RATE_LIMIT_WINDOW seconds per client
+IP. Two backends share one interface (allow(key) -> (allowed, retry_after),
+stats()):
+
+  memory  TokenBucketLimiter: per-process token buckets (burst = max, refill
+          max/window per second) in lock-striped shards, so threads only
+          contend when their keys hash to the same stripe. Buckets idle long
+          enough to have refilled are evicted on a periodic sweep, and each
+          stripe is LRU-capped, so memory stays bounded.
+  redis   SlidingWindowLimiter: sliding-window counter in any client with
+          incr/expire/get (e.g. redis.Redis), so the limit holds across all
+          worker processes. Fails open if the store is unreachable.
+
+Configured from env by make_limiter():
+  RATE_LIMIT_BACKEND    memory (default), redis, or none
+  RATE_LIMIT_MAX        requests per window (default 120)
+  RATE_LIMIT_WINDOW     seconds (default 60)
+  RATE_LIMIT_MAX_KEYS   memory backend bound on tracked clients (default 100000)
+  RATE_LIMIT_REDIS_URL  redis backend URL (default redis://localhost:6379/0)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX = 120
+DEFAULT_WINDOW = 60
+DEFAULT_MAX_KEYS = 100000
+STRIPES = 64
+SWEEP_INTERVAL = 10
+
+
+class TokenBucketLimiter:
+    """Thread-safe token buckets keyed by client, sharded over lock stripes."""
+
+    backend = "memory"
+
+    def __init__(self, max_requests=DEFAULT_MAX, window=DEFAULT_WINDOW, max_keys=DEFAULT_MAX_KEYS,
+                 stripes=STRIPES, clock=time.monotonic):
+        self.burst = float(max_requests)
+        self.rate = max_requests / window
+        self.idle_ttl = window
+        self._clock = clock
+        self._stripe_cap = max(1, max_keys // stripes)
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._buckets = [OrderedDict() for _ in range(stripes)]
+        self._rejected = [0] * stripes
+        self._evicted = [0] * stripes
+        self._next_sweep = [clock() + SWEEP_INTERVAL] * stripes
+
+    def allow(self, key):
+        """Take one token for key. Returns (allowed, seconds until a token is available)."""
+        i = hash(key) % len(self._locks)
+        now = self._clock()
+        with self._locks[i]:
+            buckets = self._buckets[i]
+            if now >= self._next_sweep[i]:
+                self._sweep(i, now)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [self.burst, now]
+                if len(buckets) > self._stripe_cap:
+                    buckets.popitem(last=False)
+                    self._evicted[i] += 1
+            else:
+                buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0.0
+            self._rejected[i] += 1
+            return False, (1 - bucket[0]) / self.rate
+
+    def _sweep(self, i, now):
+        """Drop buckets untouched for idle_ttl (they would be full again anyway)."""
+        buckets = self._buckets[i]
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if now - bucket[1] < self.idle_ttl:
+                break
+            del buckets[key]
+            self._evicted[i] += 1
+        self._next_sweep[i] = now + SWEEP_INTERVAL
+
+    def __len__(self):
+        return sum(len(b) for b in self._buckets)
+
+    def stats(self):
+        return {"backend": self.backend, "keys": len(self), "rejected": sum(self._rejected),
+                "evicted": sum(self._evicted)}
+
+
+class SlidingWindowLimiter:
+    """Sliding-window counter in an external store shared by every worker process.
+
+    Counts live in fixed windows; the current estimate is this window's count
+    plus the previous window's count weighted by how much of it still overlaps.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client, max_requests=DEFAULT_MAX, window=DEFAULT_WINDOW, prefix="sonus:rate:",
+                 clock=time.time):
+        self.client = client
+        self.max_requests = max_requests
+        self.window = window
+        self.prefix = prefix
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rejected = 0
+        self._errors = 0
+
+    def allow(self, key):
+        now = self._clock()
+        slot = int(now // self.window)
+        elapsed = now - slot * self.window
+        current_key = f"{self.prefix}{key}:{slot}"
+        try:
+            current = int(self.client.incr(current_key))
+            if current == 1:
+                self.client.expire(current_key, 2 * self.window)
+            previous = int(self.client.get(f"{self.prefix}{key}:{slot - 1}") or 0)
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            return True, 0.0
+        estimate = previous * (1 - elapsed / self.window) + current
+        if estimate <= self.max_requests:
+            return True, 0.0
+        with self._lock:
+            self._rejected += 1
+        return False, self.window - elapsed
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.backend, "rejected": self._rejected, "errors": self._errors}
+
+
+def make_limiter():
+    """Limiter from RATE_LIMIT_* env, or None when disabled."""
+    backend = (os.getenv("RATE_LIMIT_BACKEND") or "memory").strip().lower()
+    max_requests = int(os.getenv("RATE_LIMIT_MAX", DEFAULT_MAX))
+    window = float(os.getenv("RATE_LIMIT_WINDOW", DEFAULT_WINDOW))
+    if backend == "none" or max_requests <= 0:
+        return None
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            print("RATE_LIMIT_BACKEND=redis but redis is not installed; using in-process limiter.")
+        else:
+            url = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+            return SlidingWindowLimiter(redis.Redis.from_url(url), max_requests, window)
+    return TokenBucketLimiter(max_requests, window, int(os.getenv("RATE_LIMIT_MAX_KEYS", DEFAULT_MAX_KEYS)))
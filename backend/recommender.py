@@ -0,0 +1,201 @@
+"""
+Per-request stats and recommendation assembly on NumPy arrays.
+
+Matched top tracks are carried as a feature matrix plus name lists
+(MatchedTracks) rather than a DataFrame. Recommendations gather every
+neighbour index in one array, deduplicate on the precomputed
+(track_name, artist_name) keys of the KNN table, drop the user's own tracks
+and take the first REC_LIMIT rows with one fancy-indexing step.
+
+Query modes (REC_MODE, default per_track, or ?mode= on /auth-data):
+
+  per_track  k=NEIGHBOURS_PER_TRACK neighbours of every matched track, in rank order
+  centroid   one query: the rank-weighted mean of the user's (scaled) vectors
+  clusters   the vectors grouped into up to REC_CLUSTERS weighted taste centroids,
+             each queried with k proportional to its weight; candidates are
+             merged nearest-first with a heap
+
+centroid and clusters make one kneighbors call with a handful of query rows
+instead of one row per track, and clusters keeps minority tastes in the list.
+
+With a SearchFilter (attribute_index.py) every mode searches only KNN rows
+that pass the filter, so filtered lists are as long as unfiltered ones.
+Unfiltered per_track queries of dataset tracks read their neighbours from
+the precomputed neighbour table when the dataset has one (neighbour_table.py).
+"""
+
+import heapq
+import os
+
+import numpy as np
+
+from attribute_index import filtered_kneighbors
+from lookup_store import FEATURE_COLS, name_keys, to_float64
+
+REC_LIMIT = 25
+NEIGHBOURS_PER_TRACK = 5
+STAT_COLS = ["tempo", "energy", "valence", "danceability"]
+REC_MODES = ("per_track", "centroid", "clusters")
+REC_MODE = os.getenv("REC_MODE", "per_track").strip().lower()
+if REC_MODE not in REC_MODES:
+    raise RuntimeError(f"REC_MODE must be one of {', '.join(REC_MODES)}, got {REC_MODE!r}")
+REC_CLUSTERS = int(os.getenv("REC_CLUSTERS", 4))
+KMEANS_ITERATIONS = 10
+
+_COL = {c: i for i, c in enumerate(FEATURE_COLS)}
+
+
+class MatchedTracks:
+    """Matched top tracks in Spotify rank order: float64 features [n, len(FEATURE_COLS)] and names.
+
+    track_pos: lookup-store position per track, -1 for artist means (default all -1).
+    """
+
+    def __init__(self, features, track_names, artist_names, track_pos=None):
+        self.features = np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURE_COLS))
+        self.track_names = list(track_names)
+        self.artist_names = list(artist_names)
+        self.track_pos = (np.full(len(self.track_names), -1, dtype=np.int64) if track_pos is None
+                          else np.asarray(track_pos, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.track_names)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def column(self, name):
+        return self.features[:, _COL[name]]
+
+
+def stats(matched, total_count):
+    """User-stats payload; tempo rounds to whole BPM, the rest to 2 decimals."""
+    tempo = np.round(matched.column("tempo"))
+    energy = np.round(matched.column("energy"), 2)
+    valence = np.round(matched.column("valence"), 2)
+    danceability = np.round(matched.column("danceability"), 2)
+    matched_count = len(matched)
+    return {
+        "track_count": matched_count,
+        "matched_count": matched_count,
+        "total_count": total_count,
+        "tempo_avg": round(float(tempo.mean()), 1),
+        "tempo_range": [int(tempo.min()), int(tempo.max())],
+        "energy_avg": round(float(energy.mean()), 2),
+        "valence_avg": round(float(valence.mean()), 2),
+        "danceability_avg": round(float(danceability.mean()), 2),
+        "tracks": [
+            {"track_name": t, "artist_name": a, "tempo": te, "energy": e, "valence": v, "danceability": d}
+            for t, a, te, e, v, d in zip(
+                matched.track_names, matched.artist_names,
+                tempo.tolist(), energy.tolist(), valence.tolist(), danceability.tolist(),
+            )
+        ],
+    }
+
+
+def select_rows(knn_table, indices, exclude_keys, limit=REC_LIMIT):
+    """Neighbour rows in query order, first occurrence per name key, minus excluded keys."""
+    flat = np.asarray(indices).ravel()
+    keys = knn_table.keys[flat]
+    _, first = np.unique(keys, return_index=True)
+    first.sort()
+    flat, keys = flat[first], keys[first]
+    keep = ~np.isin(keys, exclude_keys)
+    return flat[keep][:limit]
+
+
+def records(knn_table, rows):
+    """Recommendation dicts for KNN rows."""
+    features = to_float64(knn_table.features[rows])
+    cols = [features[:, _COL[c]].tolist() for c in STAT_COLS]
+    return [
+        {"track_name": knn_table.names[int(r)], "artist_name": knn_table.artists[int(r)],
+         **dict(zip(STAT_COLS, values))}
+        for r, values in zip(rows, zip(*cols))
+    ]
+
+
+def rank_weights(n):
+    """Weight per Spotify rank position, decaying like DCG: 1 / log2(rank + 1)."""
+    return 1.0 / np.log2(np.arange(n) + 2.0)
+
+
+def taste_centroids(Q, weights, n_clusters=REC_CLUSTERS, iterations=KMEANS_ITERATIONS):
+    """Weighted k-means on a user's scaled vectors: (centroids, total weight, member count) per centroid.
+
+    Seeded farthest-first from the top-ranked track, so results are deterministic.
+    """
+    n_clusters = max(1, min(n_clusters, len(Q)))
+    seeds = [0]
+    d = ((Q - Q[0]) ** 2).sum(axis=1)
+    while len(seeds) < n_clusters and d.max() > 0:
+        seeds.append(int(d.argmax()))
+        d = np.minimum(d, ((Q - Q[seeds[-1]]) ** 2).sum(axis=1))
+    centroids = Q[seeds].copy()
+    for _ in range(iterations):
+        labels = ((Q[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        member = (labels[:, None] == np.arange(len(centroids))) * weights[:, None]
+        totals = member.sum(axis=0)
+        updated = np.where(totals[:, None] > 0, member.T @ Q / np.maximum(totals, 1e-12)[:, None], centroids)
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+    labels = ((Q[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    totals = np.bincount(labels, weights=weights, minlength=len(centroids))
+    sizes = np.bincount(labels, minlength=len(centroids))
+    used = sizes > 0
+    return centroids[used], totals[used], sizes[used]
+
+
+def _merge_nearest(knn_table, distances, indices, shares, exclude_keys, limit):
+    """Up to shares[i] new, non-excluded neighbours from query row i, merged nearest-first; first `limit` rows."""
+    seen = set(np.asarray(exclude_keys).tolist())
+    heap = []
+    for row_d, row_i, share in zip(distances, indices, shares):
+        taken = 0
+        for dist, idx in zip(row_d.tolist(), row_i.tolist()):
+            if taken >= share:
+                break
+            key = int(knn_table.keys[idx])
+            if key not in seen:
+                seen.add(key)
+                heap.append((dist, idx))
+                taken += 1
+    return np.array([idx for _, idx in heapq.nsmallest(limit, heap)], dtype=np.int64)
+
+
+def recommend(matched, knn_table, knn_engine, feature_transform, limit=REC_LIMIT, k=NEIGHBOURS_PER_TRACK,
+              mode=None, filters=None, attribute_index=None, neighbour_table=None):
+    """Top `limit` neighbours of the user's matched tracks, excluding the tracks themselves.
+
+    filters (attribute_index.SearchFilter) needs the dataset's attribute_index.
+    neighbour_table (neighbour_table.NeighbourTable) serves unfiltered per_track queries of dataset tracks.
+    """
+    mode = mode or REC_MODE
+    if mode not in REC_MODES:
+        raise ValueError(f"unknown recommendation mode {mode!r}")
+    exclude = name_keys(matched.track_names, matched.artist_names)
+    Q = feature_transform.transform(matched.features)
+
+    def kneighbors(queries, n):
+        return filtered_kneighbors(knn_engine, feature_transform, knn_table, attribute_index, queries, n, filters,
+                                   matched.artist_names)
+
+    if mode == "per_track":
+        if neighbour_table is not None and (filters is None or filters.empty):
+            indices = neighbour_table.kneighbors(knn_engine, Q, matched.track_pos, k)
+        else:
+            _, indices = kneighbors(Q, k)
+        return records(knn_table, select_rows(knn_table, indices, exclude, limit))
+    weights = rank_weights(len(Q))
+    if mode == "centroid":
+        centroids, totals, sizes = np.average(Q, axis=0, weights=weights)[None, :], weights.sum()[None], [len(Q)]
+    else:
+        centroids, totals, sizes = taste_centroids(Q, weights)
+    # Each centroid gets its weighted share of `limit`; k adds room for its own members and duplicate names
+    shares = np.ceil(limit * totals / totals.sum()).astype(int)
+    k = min(int((shares + sizes).max()) + NEIGHBOURS_PER_TRACK, len(knn_engine))
+    distances, indices = kneighbors(centroids, k)
+    return records(knn_table, _merge_nearest(knn_table, distances, indices, shares, exclude, limit))
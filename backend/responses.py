@@ -0,0 +1,88 @@
+"""
+Compact, compressed JSON responses with ETag revalidation (used by /auth-data).
+
+json_response(payload) serializes once, with orjson when it is installed or
+else the stdlib encoder with compact separators. It sets a weak ETag from a
+hash of the body and answers a matching If-None-Match with 304 before any
+compression. Otherwise it compresses per Accept-Encoding with brotli (when
+the package is installed) or gzip, for bodies of at least
+RESPONSE_COMPRESS_MIN_BYTES.
+
+  RESPONSE_COMPRESS_MIN_BYTES  default 1024; 0 compresses everything
+  RESPONSE_GZIP_LEVEL          default 6
+  RESPONSE_BROTLI_QUALITY      default 5
+  RESPONSE_COMPRESSION         "on" (default) or "off"
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", 5))
+COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "on").lower() != "off"
+
+
+def dumps(payload):
+    """UTF-8 JSON bytes, no whitespace, keys in insertion order."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def body_etag(body):
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+def _encoding():
+    if not COMPRESSION:
+        return None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality("br") > 0:
+        return "br"
+    if accepted.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def json_response(payload, status=200):
+    """Response for payload; 304 if the client's If-None-Match already names this body.
+
+    The ETag is weak because the same body may go out under different encodings.
+    """
+    body = dumps(payload)
+    etag = body_etag(body)
+    if status == 200 and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Accept-Encoding")
+        return response
+    encoding = _encoding() if len(body) >= COMPRESS_MIN_BYTES else None
+    response = Response(compress(body, encoding) if encoding else body, status=status, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
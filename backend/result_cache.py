@@ -0,0 +1,135 @@
+"""
+Per-user cache of /auth-data results.
+
+Keys are "<spotify user id>:<dataset version>", so a dataset reload never
+serves stale recommendations. Two backends share one interface
+(get / set / stats):
+
+  memory  InProcessCache: bounded LRU with TTL, per worker process.
+  redis   ExternalCache: any client with get(key) and setex(key, ttl, value),
+          e.g. redis.Redis or a local stand-in; shared across workers.
+
+Configured from env by make_cache():
+  RESULT_CACHE_BACKEND      memory (default), redis, or none
+  RESULT_CACHE_TTL          seconds (default 600)
+  RESULT_CACHE_MAX_ENTRIES  memory backend size bound (default 10000)
+  RESULT_CACHE_REDIS_URL    redis backend URL (default redis://localhost:6379/0)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 600
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def cache_key(user_id, dataset_version):
+    return f"{user_id}:{dataset_version}"
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def snapshot(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class InProcessCache:
+    """Thread-safe LRU with per-entry TTL."""
+
+    backend = "memory"
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = _Counters()
+
+    def get(self, key):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self._counters.count("hits" if entry is not None else "misses")
+        return entry[1] if entry is not None else None
+
+    def set(self, key, value):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._counters.count("evictions", evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"backend": self.backend, "size": len(self), **self._counters.snapshot()}
+
+
+class ExternalCache:
+    """Cache in an external key-value store; values are stored as JSON with a TTL."""
+
+    backend = "redis"
+
+    def __init__(self, client, ttl=DEFAULT_TTL, prefix="sonus:auth-data:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._counters = _Counters()
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception:
+            raw = None
+        self._counters.count("hits" if raw is not None else "misses")
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        try:
+            self.client.setex(self.prefix + key, self.ttl, json.dumps(value))
+        except Exception:
+            pass
+
+    def stats(self):
+        return {"backend": self.backend, **self._counters.snapshot()}
+
+
+def make_cache():
+    """Cache from RESULT_CACHE_* env, or None when disabled."""
+    backend = (os.getenv("RESULT_CACHE_BACKEND") or "memory").strip().lower()
+    ttl = int(os.getenv("RESULT_CACHE_TTL", DEFAULT_TTL))
+    if backend == "none" or ttl <= 0:
+        return None
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            print("RESULT_CACHE_BACKEND=redis but redis is not installed; using in-process cache.")
+        else:
+            url = os.getenv("RESULT_CACHE_REDIS_URL", "redis://localhost:6379/0")
+            return ExternalCache(redis.Redis.from_url(url), ttl=ttl)
+    return InProcessCache(int(os.getenv("RESULT_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)), ttl)
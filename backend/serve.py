@@ -0,0 +1,65 @@
+"""
+Production entry point: gunicorn with the dataset loaded once in the master.
+Run from backend dir: python serve.py
+
+The master process loads (or memory-maps) the dataset before forking, so
+every worker starts with it live and shares the pages copy-on-write; nothing
+is loaded per worker. If the preload fails, workers fall back to loading
+lazily and report progress on /health.
+
+Env:
+  PORT              bind port (default 8888)
+  WEB_CONCURRENCY   worker processes (default: CPU count)
+  GUNICORN_THREADS  threads per worker (default 4)
+  GUNICORN_TIMEOUT  worker timeout in seconds (default 60)
+"""
+
+import gc
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+import app as backend
+
+
+class PreloadedApplication(BaseApplication):
+    """Serve an already-imported WSGI app; gunicorn forks workers from this process."""
+
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def _options():
+    return {
+        "bind": f"0.0.0.0:{int(os.getenv('PORT', 8888))}",
+        "workers": int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count()),
+        "threads": int(os.getenv("GUNICORN_THREADS", 4)),
+        "worker_class": "gthread",
+        "timeout": int(os.getenv("GUNICORN_TIMEOUT", 60)),
+        "preload_app": True,
+    }
+
+
+def main():
+    try:
+        backend.load_dataset()
+    except Exception as e:
+        print("Dataset preload failed; workers will load lazily:", str(e)[:200])
+    # Keep the loaded objects out of GC bookkeeping so collections in workers
+    # don't write to (and un-share) the master's pages.
+    gc.freeze()
+    PreloadedApplication(backend.app, _options()).run()
+
+
+if __name__ == "__main__":
+    main()
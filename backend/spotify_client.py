@@ -0,0 +1,113 @@
+"""
+Spotify Web API access shared by app.py request handlers.
+
+Every call goes through one requests.Session per process, so HTTPS
+connections to the API are kept alive and reused across requests instead of
+a new client (and TLS handshake) per call. Independent calls, e.g. the
+profile and one or more top-track time ranges, run concurrently on a shared
+thread pool. A 429 is retried centrally after its Retry-After (capped);
+when retries run out RateLimited is raised so the caller can answer 503.
+
+Env:
+  SPOTIFY_API_URL        API base (default https://api.spotify.com/v1/); point
+                         at benchmarks/fake_spotify.py to run without Spotify
+  SPOTIFY_POOL_SIZE      keep-alive connections per process (default 32)
+  SPOTIFY_FETCH_THREADS  concurrent calls per process (default 8)
+  SPOTIFY_TIMEOUT        per-call timeout in seconds (default 5)
+  SPOTIFY_MAX_RETRIES    429 retries per call (default 3)
+  SPOTIFY_MAX_BACKOFF    longest Retry-After honoured, seconds (default 5)
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from spotipy import Spotify
+from spotipy.exceptions import SpotifyException
+
+TIME_RANGES = ("short_term", "medium_term", "long_term")
+DEFAULT_TIME_RANGE = "medium_term"
+
+API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1/").rstrip("/") + "/"
+POOL_SIZE = int(os.getenv("SPOTIFY_POOL_SIZE", 32))
+FETCH_THREADS = int(os.getenv("SPOTIFY_FETCH_THREADS", 8))
+TIMEOUT = float(os.getenv("SPOTIFY_TIMEOUT", 5))
+MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", 3))
+MAX_BACKOFF = float(os.getenv("SPOTIFY_MAX_BACKOFF", 5))
+
+_lock = threading.Lock()
+_pid = None
+_session = None
+_executor = None
+
+
+class RateLimited(Exception):
+    """Spotify kept answering 429 after MAX_RETRIES retries."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Spotify rate limit; retry after {retry_after:g}s")
+        self.retry_after = retry_after
+
+
+def _shared():
+    """(session, executor) for this process; rebuilt after fork so workers never share sockets."""
+    global _pid, _session, _executor
+    if _pid != os.getpid():
+        with _lock:
+            if _pid != os.getpid():
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+                _executor = ThreadPoolExecutor(max_workers=FETCH_THREADS, thread_name_prefix="spotify")
+                _pid = os.getpid()
+    return _session, _executor
+
+
+def _retry_after(exc):
+    headers = getattr(exc, "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("Retry-After", 1)))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def call(fn, *args, **kwargs):
+    """Run one spotipy call, sleeping out 429s (Retry-After, capped at MAX_BACKOFF)."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except SpotifyException as e:
+            if e.http_status != 429:
+                raise
+            wait = _retry_after(e)
+            if attempt == MAX_RETRIES or wait > MAX_BACKOFF:
+                raise RateLimited(wait) from e
+            time.sleep(wait)
+
+
+class SpotifyUser:
+    """Calls on behalf of one access token, over the shared session."""
+
+    def __init__(self, access_token):
+        session, self._executor = _shared()
+        self.client = Spotify(auth=access_token, requests_session=session, requests_timeout=TIMEOUT)
+        self.client.prefix = API_URL
+
+    def profile(self):
+        return call(self.client.current_user)
+
+    def top_tracks(self, time_range=DEFAULT_TIME_RANGE, limit=50):
+        return call(self.client.current_user_top_tracks, limit=limit, time_range=time_range)["items"]
+
+    def profile_and_top_tracks(self, time_ranges=(DEFAULT_TIME_RANGE,), limit=50):
+        """Profile plus top tracks for each time range, fetched concurrently.
+
+        Returns (user, {time_range: items}).
+        """
+        user = self._executor.submit(self.profile)
+        tops = {r: self._executor.submit(self.top_tracks, r, limit) for r in time_ranges}
+        return user.result(), {r: f.result() for r, f in tops.items()}
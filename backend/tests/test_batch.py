@@ -0,0 +1,86 @@
+"""
+Seed-set validation in batch.resolve_seed_set: malformed input raises SeedSetError (a 400 from the endpoint).
+
+Run from backend dir:
+  python -m pytest tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch  # noqa: E402
+from lookup_store import FEATURE_COLS  # noqa: E402
+
+ROW = [float(i) for i in range(len(FEATURE_COLS))]
+
+
+def resolve(item):
+    # Feature seed sets without exclude_track_ids never touch the lookup store.
+    return batch.resolve_seed_set(item, None)
+
+
+@pytest.mark.parametrize("features", [5, "abc", {"a": 1}, [ROW, dict(zip(FEATURE_COLS, ROW))], [5, 6]])
+def test_features_not_a_list_of_rows(features):
+    with pytest.raises(batch.SeedSetError, match="features must be a list of rows"):
+        resolve({"id": "s", "features": features})
+
+
+@pytest.mark.parametrize("features", [[[1, 2, 3], [4, 5, 6]], [ROW + [1.0]], [ROW, ROW[:-1]], [["x"] * len(FEATURE_COLS)]])
+def test_features_wrong_width_or_not_numbers(features):
+    with pytest.raises(batch.SeedSetError, match=f"rows of {len(FEATURE_COLS)} numbers"):
+        resolve({"id": "s", "features": features})
+
+
+def test_feature_object_missing_keys():
+    row = dict(zip(FEATURE_COLS, ROW))
+    del row[FEATURE_COLS[0]]
+    with pytest.raises(batch.SeedSetError, match=f"missing {FEATURE_COLS[0]}"):
+        resolve({"id": "s", "features": [row]})
+
+
+def test_feature_rows_and_objects_resolve():
+    for features in ([ROW, ROW], [dict(zip(FEATURE_COLS, ROW))] * 2):
+        seed_id, X, exclude, limit, pos = resolve({"id": "s", "features": features})
+        assert seed_id == "s" and X.shape == (2, len(FEATURE_COLS)) and limit == batch.recommender.REC_LIMIT
+        assert len(exclude) == 0 and (pos == -1).all()
+    assert resolve({"id": "s", "features": []})[1].shape == (0, len(FEATURE_COLS))
+
+
+@pytest.mark.parametrize("limit, message", [(0, "at least 1"), (-3, "at least 1"), ("abc", "an integer"),
+                                            ([5], "an integer")])
+def test_bad_limit(limit, message):
+    with pytest.raises(batch.SeedSetError, match=message):
+        resolve({"id": "s", "features": [ROW], "limit": limit})
+    with pytest.raises(batch.SeedSetError, match=message):
+        batch.parse_limit(limit)
+
+
+def test_limit_default_and_cap():
+    assert resolve({"id": "s", "features": [ROW], "limit": None})[3] == batch.recommender.REC_LIMIT
+    assert resolve({"id": "s", "features": [ROW], "limit": 500})[3] == batch.MAX_LIMIT
+    assert batch.parse_limit(None, 7) == 7
+
+
+@pytest.mark.parametrize("field", ["track_ids", "artist_ids", "exclude_track_ids"])
+def test_id_fields_must_be_string_lists(field):
+    with pytest.raises(batch.SeedSetError, match=f"{field} must be a list of strings"):
+        resolve({"id": "s", "track_ids": ["a"], field: "abc"})
+    with pytest.raises(batch.SeedSetError, match=f"{field} must be a list of strings"):
+        resolve({"id": "s", "track_ids": ["a"], field: [1, 2]})
+
+
+def test_seed_set_not_an_object():
+    with pytest.raises(batch.SeedSetError, match="must be an object"):
+        resolve(["a"])
+
+
+def test_nan_rows_dropped():
+    row = list(ROW)
+    row[0] = None
+    assert len(resolve({"id": "s", "features": [ROW, row]})[1]) == 1
+    assert np.isfinite(resolve({"id": "s", "features": [ROW]})[1]).all()
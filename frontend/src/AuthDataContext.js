@@ -5,6 +5,11 @@ import { API_BASE } from "./config";
 const AuthDataContext = createContext(null);
 
 const AUTH_PATHS = ["/dashboard", "/recommendations"];
+// Backend answers 503 + Retry-After while the dataset is still loading, and
+// recommendations_status "pending" (+ Retry-After) while only lookups are ready.
+// Each has its own budget: about 1 min of 503s, then about 2 min of pending polls.
+const DATASET_RETRIES = 30;
+const PENDING_POLLS = 60;
 
 export function AuthDataProvider({ children, setUser }) {
   const location = useLocation();
@@ -17,6 +22,7 @@ export function AuthDataProvider({ children, setUser }) {
   const [tracks, setTracks] = useState([]);
   const [loadingStats, setLoadingStats] = useState(false);
   const [loadingRecs, setLoadingRecs] = useState(false);
+  const [loadError, setLoadError] = useState(null);
 
   const isAuthPath = AUTH_PATHS.includes(location.pathname);
 
@@ -28,9 +34,10 @@ export function AuthDataProvider({ children, setUser }) {
     setLoadingStats(true);
     setLoadingRecs(true);
 
-    const fetchAll = async (retries = 1) => {
+    const fetchAll = async (retries = DATASET_RETRIES, polls = PENDING_POLLS) => {
       try {
-        const res = await fetch(`${API_BASE}/auth-data`, { credentials: "include" });
+        // slim=1: the backend leaves out stats.tracks, the matched entries of data.tracks
+        const res = await fetch(`${API_BASE}/auth-data?slim=1`, { credentials: "include" });
         const data = await res.json();
 
         if (res.status === 401) {
@@ -39,16 +46,35 @@ export function AuthDataProvider({ children, setUser }) {
           return;
         }
         if (res.status === 503 && retries > 0) {
-          await new Promise((r) => setTimeout(r, 2000));
-          return fetchAll(retries - 1);
+          const retryAfter = Number(res.headers.get("Retry-After")) || 2;
+          await new Promise((r) => setTimeout(r, retryAfter * 1000));
+          return fetchAll(retries - 1, polls);
+        }
+        if (res.status === 503) {
+          setLoadError("The music dataset is still loading. Please refresh in a minute.");
+          return;
         }
         if (data.user) {
           setUser(data.user);
           setLocalUser(data.user);
         }
-        if (data.stats) setStats(data.stats);
-        if (Array.isArray(data.recommended)) setRecommendations(data.recommended);
+        if (data.stats) {
+          const matched = Array.isArray(data.tracks) ? data.tracks.filter((t) => t.match_type !== "unmatched") : [];
+          setStats({ ...data.stats, tracks: data.stats.tracks ?? matched });
+        }
         if (Array.isArray(data.tracks)) setTracks(data.tracks);
+        // Stats arrive before the neighbour index is built; poll until recommendations are ready.
+        if (data.recommendations_status === "pending") {
+          if (polls > 0) {
+            setLoadingStats(false);
+            const retryAfter = Number(res.headers.get("Retry-After")) || 2;
+            await new Promise((r) => setTimeout(r, retryAfter * 1000));
+            return fetchAll(retries, polls - 1);
+          }
+          setLoadError("Recommendations are still being prepared. Please refresh in a minute.");
+          return;
+        }
+        if (Array.isArray(data.recommended)) setRecommendations(data.recommended);
       } catch (err) {
         console.error("Failed to fetch:", err);
         hasFetched.current = false;
@@ -69,7 +95,8 @@ export function AuthDataProvider({ children, setUser }) {
     tracks,
     loadingStats,
     loadingRecs,
-  }), [user, stats, recommendations, tracks, loadingStats, loadingRecs]);
+    loadError,
+  }), [user, stats, recommendations, tracks, loadingStats, loadingRecs, loadError]);
 
   return (
     <AuthDataContext.Provider value={value}>
@@ -7,12 +7,14 @@ import Spinner from "../spinner";
 
 const matchTypeLabel = {
   exact: "Exact match",
+  name: "Name match",
+  near: "Near match",
   artist: "Artist-based",
   unmatched: "Not in dataset",
 };
 
 const Dashboard = () => {
-  const { user, stats, tracks, loadingStats } = useAuthData();
+  const { user, stats, tracks, loadingStats, loadError } = useAuthData();
   const displayName = user?.display_name ?? "";
   const matchedCount = stats?.matched_count ?? 0;
   const totalCount = stats?.total_count ?? (tracks.length || 50);
@@ -48,7 +50,7 @@ const Dashboard = () => {
               ))}
             </div>
           ) : (
-            <p>No stats found.</p>
+            <p>{loadError ?? "No stats found."}</p>
           )}
         </section>
 
@@ -11,7 +11,7 @@ const LOAD_MORE_RECS = 5;
 const MAX_RECS = 25;
 
 const Recommendations = () => {
-  const { user, stats, recommendations, loadingRecs } = useAuthData();
+  const { user, stats, recommendations, loadingRecs, loadError } = useAuthData();
   const insight = useMemo(() => generateInsight(stats, recommendations), [stats, recommendations]);
   const [recommendationsToShow, setRecommendationsToShow] = useState(INITIAL_RECS);
 
@@ -73,7 +73,7 @@ const Recommendations = () => {
               )}
             </>
           ) : (
-            <p>No recommendations found.</p>
+            <p>{loadError ?? "No recommendations found."}</p>
           )}
         </section>
       </div>